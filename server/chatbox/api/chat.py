@@ -1,16 +1,22 @@
+import asyncio
 from datetime import datetime
 from typing import Any, Optional
-import json
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import StreamingResponse
 from langchain_core.messages import HumanMessage, AIMessage
 from langchain_core.runnables.config import RunnableConfig
 from pydantic import BaseModel
 from asyncpg import Connection
 
-from database import get_async_db_connection
+from database import get_async_db_connection, acquire_async_db_connection
 from chatbox.chat_agents.graph import get_agent_app
+from chatbox.chat_agents.nodes import ANSWER_STREAM_TAG
 from chatbox.chat_agents.state import AgentState
+from chatbox.chat_agents.paper_chunk_cache import get_paper_chunk_cache
+from chatbox.chat_agents.compaction import get_conversation_compactor
+from chatbox.chat_agents.run_control import get_agent_run_manager
+from chatbox.chat_agents.admission import AdmissionRejected, get_chat_admission
+from chatbox.utils.sse import SSEWriter
 from models.session import ChatSession
 
 chat_router = APIRouter(tags=["chat"])
@@ -126,6 +132,12 @@ async def create_chat_history(request: CreateChatSessionRequest,db: Connection =
         config: RunnableConfig = {"configurable": {"thread_id": request.session.id}}
         await agent_app.aupdate_state(config, initial_state)
 
+        # load the paper's chunk matrix in the background so the first turn searches in memory
+        if initial_paper_id:
+            asyncio.get_running_loop().run_in_executor(
+                None, get_paper_chunk_cache().warm, initial_paper_id
+            )
+
         return {"message": "Chat session created successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to create chat session: {str(e)}")
@@ -197,7 +209,7 @@ async def get_messages(thread_id: str, db: Connection = Depends(get_async_db_con
 
 
 @chat_router.post("/api/chat")
-async def chat(body: ChatRequest, db: Connection = Depends(get_async_db_connection)):
+async def chat(body: ChatRequest, request: Request):
     #assemble message
     thread_id = body.thread_id
     file_id = body.file_id
@@ -220,101 +232,145 @@ async def chat(body: ChatRequest, db: Connection = Depends(get_async_db_connecti
         }
     )
 
-    #update chat session title if it is the first user message
-    new_title = content[:30] + ("..." if len(content) > 30 else "")
-    await db.execute(
-        """
-        UPDATE chatsession 
-        SET title = $1, updated_at = $2 
-        WHERE id = $3 AND title = 'New Chat'
-        """,
-        new_title,
-        datetime.now(),
-        thread_id
-    )
+    # one run per thread and a global cap: a full queue is rejected before any work,
+    # otherwise wait for the thread's previous run and a free run slot. No database
+    # connection is held while waiting; the run takes its own once it is admitted.
+    admission = get_chat_admission()
+    run_manager = get_agent_run_manager()
+    try:
+        admission.check(thread_id)
+        # a new message supersedes the thread's in-flight run; it stops at its last
+        # checkpoint and this turn starts from there
+        await run_manager.cancel_thread(thread_id, "superseded")
+        slot = await admission.acquire(thread_id)
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)}) from e
 
-    agent_app = await get_agent_app()
-    config: RunnableConfig = {"configurable": {"thread_id": thread_id}}
+    try:
+        #update chat session title if it is the first user message
+        new_title = content[:30] + ("..." if len(content) > 30 else "")
+        async with acquire_async_db_connection() as db:
+            await db.execute(
+                """
+                UPDATE chatsession 
+                SET title = $1, updated_at = $2 
+                WHERE id = $3 AND title = 'New Chat'
+                """,
+                new_title,
+                datetime.now(),
+                thread_id
+            )
 
-    existing_state = await agent_app.aget_state(config)
-    existing_values = existing_state.values if existing_state and existing_state.values else {}
+        agent_app = await get_agent_app()
+        config: RunnableConfig = {"configurable": {"thread_id": thread_id}}
+
+        # the previous turn's background summary must land before this turn reads the state
+        compactor = get_conversation_compactor()
+        await compactor.wait(thread_id)
+
+        existing_state = await agent_app.aget_state(config)
+        existing_values = existing_state.values if existing_state and existing_state.values else {}
     
-    inputs: AgentState = {
-        "original_question": content,
-        "current_question": content,
-        "paper_id": existing_values.get("paper_id", ""),
-        "paper_topic": existing_values.get("paper_topic", ""),
-        "documents": [],
-        "semantic_docs": [],
-        "tavily_docs": [],
-        "db_docs": [],
-        "selected_tools": [],
-        "retrieval_reason": "",
-        "retrieval_confidence": 0.0,
-        "answer": "",
-        "search_count": 0,
-        "source": "local",
-        "summary": existing_values.get("summary", ""),
-        "messages": [user_message],
-        "user_excerpts": excerpt_texts
-    }
+        inputs: AgentState = {
+            "original_question": content,
+            "current_question": content,
+            "paper_id": existing_values.get("paper_id", ""),
+            "paper_topic": existing_values.get("paper_topic", ""),
+            "documents": [],
+            "semantic_docs": [],
+            "tavily_docs": [],
+            "db_docs": [],
+            "selected_tools": [],
+            "retrieval_reason": "",
+            "retrieval_confidence": 0.0,
+            "answer": "",
+            "search_count": 0,
+            "source": "local",
+            "summary": existing_values.get("summary", ""),
+            "messages": [user_message],
+            "user_excerpts": excerpt_texts
+        }
+
+        # only node runs and the answer model's events are emitted; internal runnables,
+        # routing functions and the other model calls are filtered out before they are
+        # queued for the stream
+        run = run_manager.start(
+            thread_id,
+            agent_app.astream_events(
+                inputs,
+                config=config,
+                version="v2",
+                include_names=[name for name in agent_app.nodes if not name.startswith("__")],
+                include_tags=[ANSWER_STREAM_TAG],
+            ),
+        )
+    except BaseException:
+        slot.release()
+        raise
+
+    def _on_run_done(_):
+        # summarize older messages off the response path; a cancelled run has no new
+        # answer to summarize. Scheduled before the slot is released, so the thread's
+        # next admitted turn finds the summary task in compactor.wait
+        try:
+            if run.completed:
+                compactor.schedule(thread_id)
+        finally:
+            slot.release()
+
+    # the slot is held until the graph run has stopped, whether or not it is streamed
+    run.task.add_done_callback(_on_run_done)
 
     async def chat_agent_stream():
-        """Stream events from agent execution, including token-by-token LLM generation"""
-        current_node = None
-        
-        async for event in agent_app.astream_events(inputs, config=config, version="v2"):
-            event_type = event["event"]
-            
-            # Track current node from metadata
-            metadata = event.get("metadata", {})
-            if "langgraph_node" in metadata:
-                node_name = metadata["langgraph_node"]
-                if node_name != current_node:
-                    current_node = node_name
-            
-            # 1. Node start events - send status updates only, no data output
-            if event_type == "on_chain_start":
-                if "langgraph_node" in metadata:
-                    node_name = metadata["langgraph_node"]
+        """Stream node status and answer tokens, coalescing tokens into larger frames"""
+        writer = SSEWriter()
+        try:
+            async for event in run.stream(request.is_disconnected, next_deadline=writer.next_deadline):
+                # no event before the writer's deadline: flush due tokens or send a heartbeat
+                if event is None:
+                    frames = writer.tick()
+                    if frames:
+                        yield frames
+                    continue
+
+                writer.received()
+                event_type = event["event"]
+                node_name = event.get("metadata", {}).get("langgraph_node")
+
+                # 1. Node start events - send status updates only, no data output
+                if event_type == "on_chain_start" and event["name"] == node_name:
                     print(f"[Node Start] {node_name}")
-                    
-                    yield f"data: {json.dumps({
-                        'type': 'node_status',
-                        'node': node_name
-                    })}\n\n"
-            
-            # 2. Node end events 
-            elif event_type == "on_chain_end":
-                if "langgraph_node" in metadata:
-                    node_name = metadata["langgraph_node"]
+                    yield writer.send({'type': 'node_status', 'node': node_name})
+
+                # 2. Node end events
+                elif event_type == "on_chain_end" and event["name"] == node_name:
                     print(f"[Node End] {node_name}")
-            
-            # 3. LLM streaming events 
-            elif event_type == "on_chat_model_stream":
-                if current_node == "generate" or current_node == "not_found":
-                    chunk = event.get("data", {}).get("chunk")
-                    
-                    # Extract content from the chunk (safely handle different types)
-                    if chunk and hasattr(chunk, 'content'):
-                        content = getattr(chunk, 'content', None)
-                        if content and isinstance(content, str):
-                            print(f"[LLM Stream] {content}")
-                            
-                            # Send token chunks to frontend
-                            yield f"data: {json.dumps({
-                                'type': 'llm_stream',
-                                'node': current_node,
-                                'chunk': content
-                            })}\n\n"
-            
-            elif event_type == "on_chain_error":
-                error = event.get("data", {}).get("error", "Unknown error")
-                print(f"[Error] {error}")
-                
-                yield f"data: {json.dumps({
-                    'type': 'error',
-                    'error': str(error)
-                })}\n\n"
-    
+                    writer.drop()
+
+                # 3. Answer tokens, buffered into llm_stream frames
+                elif event_type == "on_chat_model_stream" and node_name:
+                    content = getattr(event.get("data", {}).get("chunk"), "content", None)
+                    if content and isinstance(content, str):
+                        frames = writer.add_token(node_name, content)
+                        if frames:
+                            yield frames
+                    else:
+                        writer.drop()
+
+                elif event_type == "on_chain_error":
+                    error = event.get("data", {}).get("error", "Unknown error")
+                    print(f"[Error] {error}")
+                    yield writer.send({'type': 'error', 'error': str(error)})
+
+                else:
+                    writer.drop()
+
+            frames = writer.flush()
+            if frames:
+                yield frames
+        finally:
+            # Starlette cancels this generator when the client disconnects mid-stream
+            run.cancel("client_disconnected")
+            writer.close()
+
     return StreamingResponse(chat_agent_stream(), media_type="text/event-stream")
@@ -1,3 +1,4 @@
+import asyncio
 import json
 import logging
 import os
@@ -13,6 +14,8 @@ from models.paper import Paper, PaperChunk
 from report_pipeline.ingest_pipeline import parse_pdf_to_md, chunk_document
 from chatbox.utils.extract_relative_path import extract_relative_path
 from managers.storage_manager import StorageManager
+from managers.bm25_index_manager import reindex_paper
+from chatbox.chat_agents.paper_chunk_cache import get_paper_chunk_cache
 
 os.makedirs(UPLOADS_DIR, exist_ok=True)
 files_router = APIRouter(tags=["files"])
@@ -254,7 +257,16 @@ async def upload_paper(file: UploadFile = File(...), db: Connection = Depends(ge
                     paper_chunk.paper_id, paper_chunk.embedding
                 )
 
-            return {"message": "Paper uploaded successfully", "id": paper_id}
+        # chunks are committed now, so the lexical index can read them.
+        # the paper itself is stored, so an index failure must not undo the upload.
+        # reindex_paper is a blocking sync rewrite, so it runs off the event loop
+        try:
+            await asyncio.to_thread(reindex_paper, paper_id)
+        except Exception as e:
+            logger.error(f"Failed to update BM25 index for {paper_id}: {e}")
+        get_paper_chunk_cache().invalidate(paper_id)
+
+        return {"message": "Paper uploaded successfully", "id": paper_id}
 
     except Exception as e:
         # Clean up: delete from storage if upload succeeded but DB failed
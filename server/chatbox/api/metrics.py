@@ -0,0 +1,29 @@
+from fastapi import APIRouter
+
+from chatbox.chat_agents.tool_guard import get_tool_guard
+from chatbox.chat_agents.route_classifier import get_route_classifier
+from chatbox.chat_agents.paper_chunk_cache import get_paper_chunk_cache
+from chatbox.chat_agents.checkpoint_retention import get_checkpoint_retention
+from chatbox.chat_agents.run_control import get_agent_run_manager
+from chatbox.chat_agents.admission import get_chat_admission
+from chatbox.utils.embedding_cache import get_embedding_cache
+from chatbox.utils.http_client import get_http_client
+from chatbox.utils.sse import get_sse_stats
+
+metrics_router = APIRouter(tags=["metrics"])
+
+
+@metrics_router.get("/api/metrics")
+async def get_metrics():
+    # in-process counters of this worker; they reset on restart
+    return {
+        "tools": get_tool_guard().stats(),
+        "router": get_route_classifier().stats(),
+        "embedding_cache": get_embedding_cache().stats(),
+        "paper_cache": get_paper_chunk_cache().stats(),
+        "search_cache": get_http_client().cache.stats(),
+        "checkpoint_retention": get_checkpoint_retention().stats(),
+        "agent_runs": get_agent_run_manager().stats(),
+        "chat_admission": get_chat_admission().stats(),
+        "chat_stream": get_sse_stats().stats(),
+    }
@@ -1,3 +1,3 @@
-from .retrieve import search_base, search_opening_chunks_by_id, search_opening_chunks_by_query
+from .retrieve import asearch_base, asearch_opening_chunks_by_id, asearch_opening_chunks_by_query
 from .state import AgentState
 from .graph import initialize_agent, cleanup_agent, get_agent_app
\ No newline at end of file
@@ -0,0 +1,210 @@
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+from chatbox.core.config import (
+    CHAT_MAX_CONCURRENT_RUNS,
+    CHAT_MAX_QUEUED,
+    CHAT_MAX_QUEUED_PER_THREAD,
+    CHAT_QUEUE_TIMEOUT_SECONDS,
+)
+
+# Admission control for /api/chat. A thread has at most one graph run at a time, and
+# follow-up messages wait for it in order, so two runs never write the same
+# checkpoint concurrently. Runs across all threads are capped, and a request that
+# cannot start waits in a bounded queue. When that queue (or the thread's share of
+# it) is full, the request is rejected at once with 429 instead of piling up on the
+# asyncpg pool and the OpenAI rate limit.
+
+# recent admission waits kept for the wait-time percentiles
+_WAIT_SAMPLES = 500
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Chat is busy ({reason}), retry in {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _FifoSlots:
+    """Counting semaphore that hands released slots to waiters in arrival order."""
+
+    def __init__(self, capacity: int):
+        self.capacity = max(1, capacity)
+        self.in_use = 0
+        self._waiters: deque[asyncio.Future] = deque()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def available(self) -> bool:
+        return self.in_use < self.capacity and not self._waiters
+
+    def idle(self) -> bool:
+        return self.in_use == 0 and not self._waiters
+
+    async def acquire(self, timeout: Optional[float]):
+        if self.available():
+            self.in_use += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                # the slot was handed over just as the wait ended: pass it on
+                self.release()
+            else:
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+            raise
+
+    def release(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # hand the slot over; in_use stays the same
+                waiter.set_result(None)
+                return
+        self.in_use -= 1
+
+
+class ChatSlot:
+    """A thread's run slot and a global slot; release() is idempotent."""
+
+    def __init__(self, admission: "ChatAdmission", thread_id: str):
+        self._admission = admission
+        self.thread_id = thread_id
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self._admission._release(self.thread_id)
+
+
+class ChatAdmission:
+
+    def __init__(
+        self,
+        max_concurrent: int,
+        max_queued: int,
+        max_queued_per_thread: int,
+        queue_timeout_seconds: float,
+    ):
+        self.max_queued = max_queued
+        self.max_queued_per_thread = max_queued_per_thread
+        self.queue_timeout_seconds = queue_timeout_seconds
+        self._runs = _FifoSlots(max_concurrent)
+        self._threads: dict[str, _FifoSlots] = {}
+        # requests waiting in either stage (thread, then global)
+        self._queued = 0
+        self._lock = threading.Lock()
+
+        self.admitted = 0
+        self.queued_admissions = 0
+        self.rejected: dict[str, int] = {}
+        self.max_queue_depth = 0
+        self._waits: deque[float] = deque(maxlen=_WAIT_SAMPLES)
+
+    def check(self, thread_id: str):
+        """Raise AdmissionRejected if a request for thread_id would be turned away now."""
+        thread_slots = self._threads.get(thread_id)
+        if self._runs.available() and (thread_slots is None or thread_slots.available()):
+            return
+        if self._queued >= self.max_queued:
+            self._reject("queue_full")
+        if thread_slots is not None and thread_slots.waiting >= self.max_queued_per_thread:
+            self._reject("thread_queue_full")
+
+    async def acquire(self, thread_id: str) -> ChatSlot:
+        """
+        Wait for the thread's slot, then for a global one. Raises AdmissionRejected when
+        the queue is full or the wait exceeds the queue timeout.
+        """
+        self.check(thread_id)
+        thread_slots = self._threads.setdefault(thread_id, _FifoSlots(1))
+        queued = not (self._runs.available() and thread_slots.available())
+        deadline = time.monotonic() + self.queue_timeout_seconds
+        start = time.perf_counter()
+
+        self._queued += 1
+        self.max_queue_depth = max(self.max_queue_depth, self._queued)
+        try:
+            await thread_slots.acquire(self.queue_timeout_seconds)
+            try:
+                await self._runs.acquire(max(0.0, deadline - time.monotonic()))
+            except BaseException:
+                thread_slots.release()
+                raise
+        except asyncio.TimeoutError:
+            self._reject("queue_timeout")
+        finally:
+            self._queued -= 1
+            if thread_slots.idle():
+                self._threads.pop(thread_id, None)
+
+        wait = time.perf_counter() - start
+        with self._lock:
+            self.admitted += 1
+            if queued:
+                self.queued_admissions += 1
+                print(f"Chat run of thread {thread_id} admitted after {wait:.2f}s in queue")
+            self._waits.append(wait)
+        return ChatSlot(self, thread_id)
+
+    def _release(self, thread_id: str):
+        self._runs.release()
+        thread_slots = self._threads.get(thread_id)
+        if thread_slots is not None:
+            thread_slots.release()
+            if thread_slots.idle():
+                self._threads.pop(thread_id, None)
+
+    def _reject(self, reason: str):
+        with self._lock:
+            self.rejected[reason] = self.rejected.get(reason, 0) + 1
+            waits = sorted(self._waits)
+        # suggest retrying after a typical queue wait
+        retry_after = max(1, math.ceil(waits[len(waits) // 2])) if waits else 1
+        print(f"Chat request rejected: {reason}")
+        raise AdmissionRejected(reason, retry_after)
+
+    def stats(self) -> dict:
+        with self._lock:
+            waits = sorted(self._waits)
+            return {
+                "running": self._runs.in_use,
+                "max_concurrent": self._runs.capacity,
+                "queue_depth": self._queued,
+                "max_queue_depth": self.max_queue_depth,
+                "threads_busy": len(self._threads),
+                "admitted": self.admitted,
+                "queued_admissions": self.queued_admissions,
+                "rejected": dict(self.rejected),
+                "wait_p50_ms": waits[len(waits) // 2] * 1000 if waits else 0.0,
+                "wait_p95_ms": waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000 if waits else 0.0,
+            }
+
+
+_chat_admission: Optional[ChatAdmission] = None
+
+
+def get_chat_admission() -> ChatAdmission:
+    global _chat_admission
+    if _chat_admission is None:
+        _chat_admission = ChatAdmission(
+            max_concurrent=CHAT_MAX_CONCURRENT_RUNS,
+            max_queued=CHAT_MAX_QUEUED,
+            max_queued_per_thread=CHAT_MAX_QUEUED_PER_THREAD,
+            queue_timeout_seconds=CHAT_QUEUE_TIMEOUT_SECONDS,
+        )
+    return _chat_admission
@@ -0,0 +1,246 @@
+import asyncio
+import threading
+import time
+from typing import Optional
+
+import database
+from database import to_asyncpg_query
+from chatbox.core.config import (
+    CHECKPOINT_RETENTION_ENABLED,
+    CHECKPOINT_KEEP_LAST,
+    CHECKPOINT_RETENTION_MIN_IDLE_SECONDS,
+    CHECKPOINT_RETENTION_INTERVAL_SECONDS,
+    CHECKPOINT_RETENTION_BATCH_THREADS,
+    CHECKPOINT_RETENTION_THREAD_DELAY_SECONDS,
+)
+
+# Retention for the LangGraph checkpoint tables (checkpoints, checkpoint_writes,
+# checkpoint_blobs). The saver keeps a checkpoint for every node step of every turn,
+# but the app only reads the latest state of a thread. The job keeps the newest
+# CHECKPOINT_KEEP_LAST checkpoints of each idle thread and deletes the writes and
+# channel blobs no remaining checkpoint refers to.
+
+# session-level advisory lock: one worker runs a cycle at a time
+_ADVISORY_LOCK_KEY = 0x6368_6b70  # "chkp"
+
+# threads over the limit whose latest checkpoint is older than the idle time,
+# the largest first
+_CANDIDATE_THREADS_SQL = """
+SELECT t.thread_id, t.checkpoint_ns, t.n
+FROM (
+    SELECT thread_id, checkpoint_ns, count(*) AS n, max(checkpoint_id) AS latest_id
+    FROM checkpoints
+    GROUP BY thread_id, checkpoint_ns
+    HAVING count(*) > :keep_last
+) AS t
+JOIN checkpoints AS c
+  ON c.thread_id = t.thread_id AND c.checkpoint_ns = t.checkpoint_ns AND c.checkpoint_id = t.latest_id
+WHERE (c.checkpoint ->> 'ts')::timestamptz < now() - make_interval(secs => :min_idle)
+ORDER BY t.n DESC
+LIMIT :batch
+"""
+
+# checkpoint ids are uuid6, so they sort by creation time (the saver relies on this too)
+_DELETE_CHECKPOINTS_SQL = """
+WITH ranked AS (
+    SELECT checkpoint_id, row_number() OVER (ORDER BY checkpoint_id DESC) AS rn
+    FROM checkpoints
+    WHERE thread_id = :thread_id AND checkpoint_ns = :checkpoint_ns
+), deleted AS (
+    DELETE FROM checkpoints AS c
+    USING ranked AS r
+    WHERE c.thread_id = :thread_id AND c.checkpoint_ns = :checkpoint_ns
+      AND c.checkpoint_id = r.checkpoint_id AND r.rn > :keep_last
+    RETURNING pg_column_size(c.*) AS size
+)
+SELECT count(*) AS rows, coalesce(sum(size), 0) AS bytes FROM deleted
+"""
+
+_DELETE_ORPHAN_WRITES_SQL = """
+WITH deleted AS (
+    DELETE FROM checkpoint_writes AS w
+    WHERE w.thread_id = :thread_id AND w.checkpoint_ns = :checkpoint_ns
+      AND NOT EXISTS (
+          SELECT 1 FROM checkpoints AS c
+          WHERE c.thread_id = w.thread_id AND c.checkpoint_ns = w.checkpoint_ns
+            AND c.checkpoint_id = w.checkpoint_id
+      )
+    RETURNING pg_column_size(w.*) AS size
+)
+SELECT count(*) AS rows, coalesce(sum(size), 0) AS bytes FROM deleted
+"""
+
+# a blob is live if a remaining checkpoint lists its (channel, version). Only blobs
+# older than the newest live version of their channel are deleted, so blobs of a
+# checkpoint that is being written right now are never touched.
+_DELETE_ORPHAN_BLOBS_SQL = """
+WITH live AS (
+    SELECT DISTINCT cv.key AS channel, cv.value AS version
+    FROM checkpoints AS c, jsonb_each_text(c.checkpoint -> 'channel_versions') AS cv
+    WHERE c.thread_id = :thread_id AND c.checkpoint_ns = :checkpoint_ns
+), latest AS (
+    SELECT channel, max(version) AS version FROM live GROUP BY channel
+), deleted AS (
+    DELETE FROM checkpoint_blobs AS b
+    USING latest AS l
+    WHERE b.thread_id = :thread_id AND b.checkpoint_ns = :checkpoint_ns
+      AND b.channel = l.channel AND b.version < l.version
+      AND NOT EXISTS (SELECT 1 FROM live WHERE live.channel = b.channel AND live.version = b.version)
+    RETURNING pg_column_size(b.*) AS size
+)
+SELECT count(*) AS rows, coalesce(sum(size), 0) AS bytes FROM deleted
+"""
+
+_TABLES = ("checkpoints", "checkpoint_writes", "checkpoint_blobs")
+
+
+class CheckpointRetention:
+    """Scheduled background job with per-table counters of rows and bytes deleted."""
+
+    def __init__(
+        self,
+        keep_last: int,
+        min_idle_seconds: float,
+        interval_seconds: float,
+        batch_threads: int,
+        thread_delay_seconds: float,
+    ):
+        self.keep_last = max(1, keep_last)
+        self.min_idle_seconds = min_idle_seconds
+        self.interval_seconds = interval_seconds
+        self.batch_threads = batch_threads
+        self.thread_delay_seconds = thread_delay_seconds
+        self._task: Optional[asyncio.Task] = None
+        self._lock = threading.Lock()
+
+        self.runs = 0
+        self.skipped_runs = 0
+        self.threads_compacted = 0
+        self.rows_deleted = {table: 0 for table in _TABLES}
+        self.bytes_reclaimed = {table: 0 for table in _TABLES}
+        self.last_run_at: Optional[float] = None
+        self.last_run_seconds = 0.0
+        self.last_error: Optional[str] = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                await self.run_once()
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Checkpoint retention failed: {e}")
+
+    async def run_once(self) -> dict:
+        """One cycle over at most batch_threads threads; returns what it deleted."""
+        start = time.perf_counter()
+        deleted_rows = {table: 0 for table in _TABLES}
+        deleted_bytes = {table: 0 for table in _TABLES}
+        threads = 0
+
+        async with database.acquire_async_db_connection() as conn:
+            if not await conn.fetchval("SELECT pg_try_advisory_lock($1)", _ADVISORY_LOCK_KEY):
+                with self._lock:
+                    self.skipped_runs += 1
+                return {"threads": 0, "rows": deleted_rows, "bytes": deleted_bytes}
+            try:
+                sql, args = to_asyncpg_query(
+                    _CANDIDATE_THREADS_SQL,
+                    {
+                        "keep_last": self.keep_last,
+                        "min_idle": float(self.min_idle_seconds),
+                        "batch": self.batch_threads,
+                    },
+                )
+                candidates = await conn.fetch(sql, *args)
+
+                for candidate in candidates:
+                    params = {
+                        "thread_id": candidate["thread_id"],
+                        "checkpoint_ns": candidate["checkpoint_ns"],
+                        "keep_last": self.keep_last,
+                    }
+                    # one short transaction per thread, then a pause, so the job never
+                    # holds locks for long or saturates the database
+                    async with conn.transaction():
+                        for table, statement in zip(
+                            _TABLES,
+                            (_DELETE_CHECKPOINTS_SQL, _DELETE_ORPHAN_WRITES_SQL, _DELETE_ORPHAN_BLOBS_SQL),
+                            strict=True,
+                        ):
+                            sql, args = to_asyncpg_query(statement, params)
+                            row = await conn.fetchrow(sql, *args)
+                            deleted_rows[table] += row["rows"]
+                            deleted_bytes[table] += int(row["bytes"])
+                    threads += 1
+                    await asyncio.sleep(self.thread_delay_seconds)
+            finally:
+                await conn.execute("SELECT pg_advisory_unlock($1)", _ADVISORY_LOCK_KEY)
+
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.runs += 1
+            self.threads_compacted += threads
+            for table in _TABLES:
+                self.rows_deleted[table] += deleted_rows[table]
+                self.bytes_reclaimed[table] += deleted_bytes[table]
+            self.last_run_at = time.time()
+            self.last_run_seconds = elapsed
+            self.last_error = None
+
+        if threads:
+            print(
+                f"Checkpoint retention: {threads} threads, "
+                + ", ".join(
+                    f"{table} {deleted_rows[table]} rows / {deleted_bytes[table] / 1024:.0f} KB"
+                    for table in _TABLES
+                )
+                + f" in {elapsed:.1f}s"
+            )
+        return {"threads": threads, "rows": deleted_rows, "bytes": deleted_bytes}
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self._task is not None and not self._task.done(),
+                "keep_last": self.keep_last,
+                "runs": self.runs,
+                "skipped_runs": self.skipped_runs,
+                "threads_compacted": self.threads_compacted,
+                "rows_deleted": dict(self.rows_deleted),
+                "bytes_reclaimed": dict(self.bytes_reclaimed),
+                "last_run_at": self.last_run_at,
+                "last_run_seconds": self.last_run_seconds,
+                "last_error": self.last_error,
+            }
+
+
+_checkpoint_retention: Optional[CheckpointRetention] = None
+
+
+def get_checkpoint_retention() -> CheckpointRetention:
+    global _checkpoint_retention
+    if _checkpoint_retention is None:
+        _checkpoint_retention = CheckpointRetention(
+            keep_last=CHECKPOINT_KEEP_LAST,
+            min_idle_seconds=CHECKPOINT_RETENTION_MIN_IDLE_SECONDS,
+            interval_seconds=CHECKPOINT_RETENTION_INTERVAL_SECONDS,
+            batch_threads=CHECKPOINT_RETENTION_BATCH_THREADS,
+            thread_delay_seconds=CHECKPOINT_RETENTION_THREAD_DELAY_SECONDS,
+        )
+    return _checkpoint_retention
+
+
+def start_checkpoint_retention():
+    if CHECKPOINT_RETENTION_ENABLED:
+        get_checkpoint_retention().start()
@@ -0,0 +1,147 @@
+import threading
+from functools import lru_cache
+from typing import Any, Optional
+
+import msgpack
+import zstandard
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from chatbox.core.config import CHECKPOINT_SERIALIZER, CHECKPOINT_ZSTD_LEVEL
+
+# Checkpoint serializer for AsyncPostgresSaver. Channel values made of plain data and
+# chat messages are written as msgpack with each message reduced to its type and
+# non-default fields (id, content, additional_kwargs with timestamp/excerpts),
+# instead of the full pydantic dump JsonPlusSerializer stores. Payloads above a few
+# hundred bytes are zstd-compressed. Values with other objects fall back to
+# JsonPlusSerializer (still compressed). Reading dispatches on the stored type tag,
+# so rows written by the default serializer (existing threads) load unchanged.
+
+_COMPACT_TYPE = "cmsgpack"
+_ZSTD_PREFIX = "zstd+"
+_MIN_COMPRESS_BYTES = 256
+# raw type tags the fallback serializer writes that are not worth compressing
+_UNCOMPRESSED_TYPES = {"null", "empty", "bytes", "bytearray"}
+
+_MESSAGE_EXT = 1
+_MESSAGE_CLASSES: dict[str, type[BaseMessage]] = {
+    "human": HumanMessage,
+    "ai": AIMessage,
+    "system": SystemMessage,
+    "tool": ToolMessage,
+}
+
+
+class _Unsupported(TypeError):
+    pass
+
+
+_NO_DEFAULT = object()
+
+
+@lru_cache(maxsize=None)
+def _field_defaults(message_class: type[BaseMessage]) -> tuple[tuple[str, Any], ...]:
+    # (field name, default) per class; resolving pydantic defaults is slow, so once
+    return tuple(
+        (name, _NO_DEFAULT if field.is_required() else field.get_default(call_default_factory=True))
+        for name, field in message_class.model_fields.items()
+        if name != "type"  # implied by the ext payload
+    )
+
+
+def _message_fields(message: BaseMessage) -> dict:
+    # fields that differ from the class defaults
+    fields = {}
+    for name, default in _field_defaults(type(message)):
+        value = getattr(message, name)
+        if default is _NO_DEFAULT or value != default:
+            fields[name] = value
+    return fields
+
+
+def _default(obj: Any) -> msgpack.ExtType:
+    # exact classes only: subclasses such as AIMessageChunk go to the fallback
+    if type(obj) in _MESSAGE_CLASSES.values():
+        payload = _packb([obj.type, _message_fields(obj)])
+        return msgpack.ExtType(_MESSAGE_EXT, payload)
+    raise _Unsupported(f"cannot encode {type(obj).__name__} compactly")
+
+
+def _packb(obj: Any) -> bytes:
+    # strict_types: tuples, dict/str subclasses, datetimes etc. reach _default (and the
+    # fallback) instead of being silently turned into lists, dicts or strings
+    return msgpack.packb(obj, default=_default, strict_types=True, use_bin_type=True)
+
+
+def _ext_hook(code: int, data: bytes) -> Any:
+    if code == _MESSAGE_EXT:
+        message_type, fields = _unpackb(data)
+        return _MESSAGE_CLASSES[message_type](**fields)
+    return msgpack.ExtType(code, data)
+
+
+def _unpackb(data: bytes) -> Any:
+    return msgpack.unpackb(data, ext_hook=_ext_hook, raw=False, strict_map_key=False)
+
+
+class CompactCheckpointSerializer(JsonPlusSerializer):
+    """
+    JsonPlusSerializer subclass (so the saver's msgpack allowlist still applies to
+    the fallback path) that writes the compact format.
+    """
+
+    def __init__(self, write_compact: bool = True, zstd_level: int = 3):
+        super().__init__()
+        # write_compact=False writes like JsonPlusSerializer but still reads compact
+        # rows, so switching back to the default format keeps new threads readable
+        self.write_compact = write_compact
+        self.zstd_level = zstd_level
+        # zstandard (de)compressors must not be shared between threads
+        self._local = threading.local()
+
+    def _compressor(self) -> zstandard.ZstdCompressor:
+        if not hasattr(self._local, "compressor"):
+            self._local.compressor = zstandard.ZstdCompressor(level=self.zstd_level)
+        return self._local.compressor
+
+    def _decompressor(self) -> zstandard.ZstdDecompressor:
+        if not hasattr(self._local, "decompressor"):
+            self._local.decompressor = zstandard.ZstdDecompressor()
+        return self._local.decompressor
+
+    def dumps_typed(self, obj: Any) -> tuple[str, bytes]:
+        if not self.write_compact:
+            return super().dumps_typed(obj)
+
+        try:
+            type_, data = _COMPACT_TYPE, _packb(obj)
+        except (TypeError, ValueError, OverflowError):
+            type_, data = super().dumps_typed(obj)
+            if type_ in _UNCOMPRESSED_TYPES:
+                return type_, data
+
+        if len(data) >= _MIN_COMPRESS_BYTES:
+            return _ZSTD_PREFIX + type_, self._compressor().compress(data)
+        return type_, data
+
+    def loads_typed(self, data: tuple[str, bytes]) -> Any:
+        type_, payload = data
+        if type_.startswith(_ZSTD_PREFIX):
+            type_ = type_[len(_ZSTD_PREFIX):]
+            payload = self._decompressor().decompress(payload)
+        if type_ == _COMPACT_TYPE:
+            return _unpackb(payload)
+        return super().loads_typed((type_, payload))
+
+
+_checkpoint_serializer: Optional[CompactCheckpointSerializer] = None
+
+
+def get_checkpoint_serializer() -> CompactCheckpointSerializer:
+    global _checkpoint_serializer
+    if _checkpoint_serializer is None:
+        _checkpoint_serializer = CompactCheckpointSerializer(
+            write_compact=CHECKPOINT_SERIALIZER == "compact",
+            zstd_level=CHECKPOINT_ZSTD_LEVEL,
+        )
+    return _checkpoint_serializer
@@ -0,0 +1,79 @@
+import asyncio
+import time
+from typing import Optional
+
+from langchain_core.runnables.config import RunnableConfig
+
+from chatbox.chat_agents.graph import get_agent_app
+from chatbox.chat_agents.nodes import summarize_conversation
+
+
+class ConversationCompactor:
+    """
+    Runs summarize_conversation for a thread in the background once a turn has
+    streamed, and writes the result to the checkpoint. Jobs of the same thread are
+    chained, and the next turn waits for the pending job before reading the state,
+    so a summary is never computed from (or written over) a newer turn.
+    """
+
+    def __init__(self):
+        self._tasks: dict[str, asyncio.Task] = {}
+
+    def schedule(self, thread_id: str) -> asyncio.Task:
+        previous = self._tasks.get(thread_id)
+        task = asyncio.create_task(self._run(thread_id, previous))
+        self._tasks[thread_id] = task
+
+        def _forget(done: asyncio.Task):
+            if self._tasks.get(thread_id) is done:
+                self._tasks.pop(thread_id, None)
+
+        task.add_done_callback(_forget)
+        return task
+
+    async def wait(self, thread_id: str):
+        # called before a new turn of the thread reads its state
+        task = self._tasks.get(thread_id)
+        if task is not None:
+            await asyncio.wait([task])
+
+    async def drain(self):
+        # on shutdown: let in-flight summaries reach the checkpoint
+        if self._tasks:
+            await asyncio.wait(list(self._tasks.values()))
+
+    async def _run(self, thread_id: str, previous: Optional[asyncio.Task]):
+        if previous is not None:
+            await asyncio.wait([previous])
+        try:
+            await self._compact(thread_id)
+        except Exception as e:
+            print(f"Conversation compaction failed for thread {thread_id}: {e}")
+
+    @staticmethod
+    async def _compact(thread_id: str):
+        agent_app = await get_agent_app()
+        config: RunnableConfig = {"configurable": {"thread_id": thread_id}}
+        snapshot = await agent_app.aget_state(config)
+        if not snapshot or not snapshot.values:
+            return
+
+        start = time.perf_counter()
+        update = await summarize_conversation(snapshot.values)  # type: ignore[arg-type]
+        if not update:
+            return
+        await agent_app.aupdate_state(config, update)
+        print(
+            f"Compacted thread {thread_id}: {len(update['messages'])} messages summarized "
+            f"in {time.perf_counter() - start:.1f}s"
+        )
+
+
+_conversation_compactor: Optional[ConversationCompactor] = None
+
+
+def get_conversation_compactor() -> ConversationCompactor:
+    global _conversation_compactor
+    if _conversation_compactor is None:
+        _conversation_compactor = ConversationCompactor()
+    return _conversation_compactor
@@ -0,0 +1,174 @@
+import asyncio
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Optional, Sequence
+
+import tiktoken
+
+from chatbox.core.config import (
+    DEDUCE_MODEL_NAME,
+    CONTEXT_TOKEN_BUDGET,
+    CONTEXT_DEDUP_THRESHOLD,
+    CONTEXT_MIN_TRUNCATED_TOKENS,
+)
+
+# Builds the context block of the generate prompt: documents ordered by score, near
+# duplicates dropped, packed into a token budget. A document that does not fit is cut
+# at a sentence boundary if enough budget is left, otherwise skipped.
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_WORD = re.compile(r"\w+")
+
+
+@lru_cache(maxsize=4)
+def _get_encoding(model_name: str) -> Optional[tiktoken.Encoding]:
+    try:
+        try:
+            return tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # the BPE file is downloaded on first use; offline, estimate from length instead
+        print(f"Failed to load tokenizer for {model_name}, estimating token counts: {e}")
+        return None
+
+
+async def warm_tokenizer(model_name: str = DEDUCE_MODEL_NAME):
+    # loading (or downloading) the BPE file takes long enough to stall the event loop,
+    # so it is done in a thread at startup instead of in the first generate call
+    await asyncio.to_thread(_get_encoding, model_name)
+
+
+def count_tokens(text: str, model_name: str = DEDUCE_MODEL_NAME) -> int:
+    encoding = _get_encoding(model_name)
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+@dataclass
+class PackedContext:
+    text: str
+    budget: int
+    used_tokens: int = 0
+    packed: int = 0
+    truncated: int = 0
+    duplicates: int = 0
+    skipped: int = 0
+    order: list[int] = field(default_factory=list)
+
+    def stats(self) -> dict:
+        return {
+            "budget": self.budget,
+            "used_tokens": self.used_tokens,
+            "packed": self.packed,
+            "truncated": self.truncated,
+            "duplicates": self.duplicates,
+            "skipped": self.skipped,
+        }
+
+
+def _compact_header(document: str) -> str:
+    # document_refs.format_document writes "URL: N/A" for every database chunk; drop it
+    return document.replace("\nURL: N/A\n", "\n", 1)
+
+
+def _shingles(text: str, size: int = 3) -> set[tuple[str, ...]]:
+    words = _WORD.findall(text.lower())
+    if len(words) <= size:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def _is_near_duplicate(shingles: set, kept: list[set], threshold: float) -> bool:
+    for other in kept:
+        if not shingles or not other:
+            continue
+        overlap = len(shingles & other)
+        # containment, so a chunk that repeats most of a longer one also counts
+        if overlap / min(len(shingles), len(other)) >= threshold:
+            return True
+    return False
+
+
+def _truncate_to_sentences(text: str, max_tokens: int, model_name: str) -> Optional[str]:
+    # longest prefix of whole sentences within max_tokens, None if not even one fits.
+    # each sentence is encoded once and the counts summed; BPE merges across a boundary
+    # can make the sum differ slightly from the prefix count, so the chosen prefix is
+    # counted once more and shortened by a sentence while it does not fit
+    text = text.strip()
+    fitting: list[int] = []
+    total = 0
+    start = 0
+    for boundary in [m.start() for m in _SENTENCE_END.finditer(text)] + [len(text)]:
+        total += count_tokens(text[start:boundary], model_name)
+        if total > max_tokens:
+            break
+        fitting.append(boundary)
+        start = boundary
+    while fitting:
+        prefix = text[:fitting.pop()]
+        if count_tokens(prefix, model_name) <= max_tokens:
+            return prefix
+    return None
+
+
+def pack_context(
+    documents: Sequence[str],
+    scores: Optional[Sequence[Optional[float]]] = None,
+    budget: int = CONTEXT_TOKEN_BUDGET,
+    dedup_threshold: float = CONTEXT_DEDUP_THRESHOLD,
+    min_truncated_tokens: int = CONTEXT_MIN_TRUNCATED_TOKENS,
+    model_name: str = DEDUCE_MODEL_NAME,
+    separator: str = "\n\n",
+) -> PackedContext:
+    """
+    documents are in retrieval order; scores (same length, None = unknown) rank them,
+    see document_refs.context_scores. Higher scores go first, retrieval order breaks
+    ties, and documents without a score rank with the median of the known scores.
+    """
+    scores = list(scores or [])
+    known = sorted(score for score in scores if score is not None)
+    default_score = known[len(known) // 2] if known else 0.0
+    ranked = sorted(
+        range(len(documents)),
+        key=lambda i: (
+            -(scores[i] if i < len(scores) and scores[i] is not None else default_score),
+            i,
+        ),
+    )
+
+    result = PackedContext(text="", budget=budget)
+    parts: list[str] = []
+    kept_shingles: list[set] = []
+    separator_tokens = count_tokens(separator, model_name)
+
+    for i in ranked:
+        document = _compact_header(documents[i])
+        shingles = _shingles(document)
+        if _is_near_duplicate(shingles, kept_shingles, dedup_threshold):
+            result.duplicates += 1
+            continue
+
+        remaining = budget - result.used_tokens - (separator_tokens if parts else 0)
+        tokens = count_tokens(document, model_name)
+        if tokens > remaining:
+            truncated = None
+            if remaining >= min_truncated_tokens:
+                truncated = _truncate_to_sentences(document, remaining, model_name)
+            if truncated is None:
+                result.skipped += 1
+                continue
+            document = truncated
+            tokens = count_tokens(document, model_name)
+            result.truncated += 1
+
+        result.used_tokens += tokens + (separator_tokens if parts else 0)
+        parts.append(document)
+        kept_shingles.append(shingles)
+        result.order.append(i)
+
+    result.text = separator.join(parts)
+    result.packed = len(parts)
+    return result
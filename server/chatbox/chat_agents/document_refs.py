@@ -0,0 +1,159 @@
+import threading
+from collections import OrderedDict
+from typing import Optional, Sequence
+
+from chatbox.core.config import CHUNK_TEXT_CACHE_MAX_ENTRIES, GRADING_ACCEPT_SIMILARITY
+from chatbox.chat_agents.records import RetrievedChunk
+from chatbox.chat_agents.retrieve import aload_chunks
+from chatbox.chat_agents.state import DocumentRef
+
+# The graph state carries DocumentRefs instead of formatted documents, because
+# AsyncPostgresSaver writes the state to a checkpoint after every node. Text is
+# hydrated only where it is needed (LLM grading and the generate prompt):
+# database chunks from an in-process LRU filled at retrieval time (the database
+# on a miss). External results cannot be reloaded, so their refs keep the title,
+# text and url of the result; those are a few hundred bytes each.
+
+# list field and text field of each external search response
+_EXTERNAL_RESULT_FIELDS = {
+    "semantic_scholar": ("data", "abstract"),
+    "tavily": ("results", "content"),
+}
+
+_DEFAULT_TITLES = {
+    "local_db": "Local database chunk",
+    "global_db_chunk": "Global database chunk",
+}
+
+
+def format_document(source: str, title: str, content: str, url: str = "") -> str:
+    safe_title = title.strip() if title else "N/A"
+    safe_url = url.strip() if url else "N/A"
+    safe_content = content.strip() if content else ""
+    return (
+        f"[SOURCE: {source}]\n"
+        f"Title: {safe_title}\n"
+        f"URL: {safe_url}\n"
+        f"Content:\n{safe_content}"
+    )
+
+
+class ChunkTextCache:
+    """LRU of (title, text) by chunk id for hydrating chunk references."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[int, tuple[str, str]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, chunk: RetrievedChunk):
+        with self._lock:
+            self._entries.pop(chunk.chunk_id, None)
+            self._entries[chunk.chunk_id] = (chunk.title, chunk.text)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, chunk_id: int) -> Optional[tuple[str, str]]:
+        with self._lock:
+            entry = self._entries.get(chunk_id)
+            if entry is not None:
+                self._entries.move_to_end(chunk_id)
+            return entry
+
+
+_chunk_text_cache: Optional[ChunkTextCache] = None
+
+
+def get_chunk_text_cache() -> ChunkTextCache:
+    global _chunk_text_cache
+    if _chunk_text_cache is None:
+        _chunk_text_cache = ChunkTextCache(max_entries=CHUNK_TEXT_CACHE_MAX_ENTRIES)
+    return _chunk_text_cache
+
+
+def chunk_ref(chunk: RetrievedChunk, source: str) -> DocumentRef:
+    get_chunk_text_cache().put(chunk)
+    return {"source": source, "chunk_id": chunk.chunk_id, "score": round(chunk.score, 4)}
+
+
+def external_refs(source: str, response: dict) -> list[DocumentRef]:
+    # one ref per result that has text, carrying that text
+    list_field, text_field = _EXTERNAL_RESULT_FIELDS[source]
+    return [
+        {
+            "source": source,
+            "index": i,
+            "title": item.get("title") or "Untitled",
+            "text": item[text_field],
+            "url": item.get("url") or "",
+        }
+        for i, item in enumerate(response.get(list_field) or [])
+        if (item.get(text_field) or "").strip()
+    ]
+
+
+def context_scores(refs: Sequence[DocumentRef]) -> list[float]:
+    """
+    Ranking score of each graded ref for pack_context: retrieval rank + relevance.
+    Retrieval scores are on different scales per source (RRF, cosine, BM25), so they
+    are min-max normalized within the source to [0, 1]; external results without a
+    score rank by their position in the search response. Relevance is the prefilter
+    similarity; refs the LLM grader accepted without one count as just relevant enough
+    to be auto-accepted (GRADING_ACCEPT_SIMILARITY).
+    """
+    by_source: dict[str, list[int]] = {}
+    for i, ref in enumerate(refs):
+        by_source.setdefault(ref.get("source", "local_db"), []).append(i)
+
+    retrieval = [0.0] * len(refs)
+    for positions in by_source.values():
+        raw = [
+            refs[i]["score"] if "score" in refs[i] else -float(refs[i].get("index", rank))
+            for rank, i in enumerate(positions)
+        ]
+        low, high = min(raw), max(raw)
+        for i, value in zip(positions, raw, strict=True):
+            retrieval[i] = (value - low) / (high - low) if high > low else 1.0
+
+    return [
+        retrieval[i] + ref.get("similarity", GRADING_ACCEPT_SIMILARITY)
+        for i, ref in enumerate(refs)
+    ]
+
+
+async def ahydrate_documents(refs: Sequence[DocumentRef]) -> list[Optional[str]]:
+    """
+    Formatted text of each ref, in order. None for a ref whose text is gone
+    (database chunk deleted since retrieval); callers drop those.
+    """
+    cache = get_chunk_text_cache()
+    chunks: dict[int, tuple[str, str]] = {}
+    missing = []
+    for ref in refs:
+        chunk_id = ref.get("chunk_id")
+        if chunk_id is None or chunk_id in chunks:
+            continue
+        entry = cache.get(chunk_id)
+        if entry is None:
+            missing.append(chunk_id)
+        else:
+            chunks[chunk_id] = entry
+    if missing:
+        for chunk_id, chunk in (await aload_chunks(missing)).items():
+            cache.put(chunk)
+            chunks[chunk_id] = (chunk.title, chunk.text)
+
+    documents: list[Optional[str]] = []
+    for ref in refs:
+        source = ref.get("source", "local_db")
+        if source in _EXTERNAL_RESULT_FIELDS:
+            document = format_document(source, ref.get("title", ""), ref.get("text", ""), ref.get("url", ""))
+        elif ref.get("chunk_id") in chunks:
+            title, text = chunks[ref["chunk_id"]]
+            document = format_document(source, title or _DEFAULT_TITLES.get(source, "N/A"), text)
+        else:
+            document = None
+        if document is None:
+            print(f"Could not hydrate document {ref}, dropping it")
+        documents.append(document)
+    return documents
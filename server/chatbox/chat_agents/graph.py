@@ -5,9 +5,10 @@ from pydantic import BaseModel, Field
 
 from chatbox.core.config import DB_CONNECTION_STRING
 from chatbox.chat_agents.state import AgentState
+from chatbox.chat_agents.checkpoint_serde import get_checkpoint_serializer
 from chatbox.chat_agents.nodes import (
+    plan_question,
     route_question,
-    summarize_conversation,
     retrieve,
     global_search,
     semantic_scholar_search,
@@ -32,7 +33,10 @@ async def initialize_agent():
         raise ValueError("DB_CONNECTION_STRING is not set")
     
     # Using Session mode (port 5432) which supports prepared statements
-    _checkpointer_context = AsyncPostgresSaver.from_conn_string(DB_CONNECTION_STRING)
+    # compact msgpack + zstd blobs; rows written by the default serializer stay readable
+    _checkpointer_context = AsyncPostgresSaver.from_conn_string(
+        DB_CONNECTION_STRING, serde=get_checkpoint_serializer()
+    )
     _checkpointer_instance = await _checkpointer_context.__aenter__()
     
     await _checkpointer_instance.setup()
@@ -62,6 +66,7 @@ async def cleanup_agent():
 workflow = StateGraph(AgentState)
 
 #add nodes
+workflow.add_node("plan_question", plan_question)
 workflow.add_node("retrieve", retrieve)
 workflow.add_node("global_search", global_search)
 workflow.add_node("semantic_scholar_search", semantic_scholar_search)
@@ -70,14 +75,15 @@ workflow.add_node("db_chunk_search", db_chunk_search)
 workflow.add_node("grade_documents", grade_documents)
 workflow.add_node("transform_question", transform_question)
 workflow.add_node("generate", generate)
-workflow.add_node("summarize_conversation", summarize_conversation)
 
 #failed node: no relevant information found in database or online
 workflow.add_node("not_found", not_found)
 
 #add edges
-#route question entry point
-workflow.set_conditional_entry_point(
+#entry point: plan_question picks the route and, for global search, the tools in one call
+workflow.add_edge(START, "plan_question")
+workflow.add_conditional_edges(
+    "plan_question",
     route_question,
     {
         "global_search": "global_search",
@@ -108,7 +114,6 @@ workflow.add_conditional_edges(
     }
 )
 
-#exit edges
-workflow.add_edge("not_found", "summarize_conversation")
-workflow.add_edge("generate", "summarize_conversation")
-workflow.add_edge("summarize_conversation", END)
+#exit edges: conversation compaction runs after the answer has streamed (compaction.py)
+workflow.add_edge("not_found", END)
+workflow.add_edge("generate", END)
@@ -1,17 +1,46 @@
+import asyncio
 import os
-import requests
+import time
 from langchain_core.prompts import ChatPromptTemplate 
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage, RemoveMessage
 from langchain_core.output_parsers import StrOutputParser
 from pydantic import BaseModel, Field
 from typing import cast, Sequence
 
-from chatbox.chat_agents.state import AgentState
-from chatbox.chat_agents.retrieve import search_base, search_bm25, search_by_excerpt_with_context, search_opening_chunks_by_id, search_opening_chunks_by_query
+from chatbox.chat_agents.state import AgentState, DocumentRef
+from chatbox.chat_agents.records import RetrievedChunk
+from chatbox.chat_agents.retrieve import (
+    asearch_base,
+    asearch_lexical,
+    asearch_hybrid_batch,
+    asearch_opening_chunks_by_id,
+    asearch_opening_chunks_by_query,
+    achunk_similarities,
+)
+from chatbox.chat_agents.paper_chunk_cache import get_paper_chunk_cache
+from chatbox.chat_agents.route_classifier import get_route_classifier
+from chatbox.chat_agents.tool_guard import get_tool_guard
+from chatbox.chat_agents.context_packer import pack_context
+from chatbox.chat_agents.document_refs import chunk_ref, external_refs, ahydrate_documents, context_scores
 
 from chatbox.utils.create_message import create_message
+from chatbox.utils.embedding_cache import aget_query_embeddings
+from chatbox.utils.http_client import get_http_client, ResponseCache
 from chatbox.utils.topic_to_skill import topic_to_skill_name, load_prompt_by_skill
-from chatbox.core.config import get_deduce_model, get_writing_model
+from chatbox.core.config import (
+    get_deduce_model,
+    get_writing_model,
+    LEXICAL_SEARCH_BACKEND,
+    RETRIEVE_MAX_CONCURRENCY,
+    GRADING_MODE,
+    GRADING_MAX_CONCURRENCY,
+    GRADING_PREFILTER,
+    GRADING_ACCEPT_SIMILARITY,
+    GRADING_REJECT_SIMILARITY,
+    ROUTER_FAST_PATH,
+    SEMANTIC_SCHOLAR_SEARCH_URL,
+    TAVILY_SEARCH_URL,
+)
 
 # Deduce model for reasoning tasks (route, grade, transform)
 deduce_model = get_deduce_model()
@@ -19,6 +48,9 @@ deduce_model = get_deduce_model()
 # Writing model for text generation tasks (summarize, generate)
 writing_model = get_writing_model()
 
+# tag of the model run whose tokens /api/chat streams to the client
+ANSWER_STREAM_TAG = "answer_stream"
+
 
 
 def _get_generate_prompt_template(topic: str) -> str:
@@ -34,21 +66,40 @@ def _get_transform_question_prompt_template(topic: str) -> str:
     )
 
 #classes for structured output
-class RouteQuery(BaseModel):
-    """route to the source of the answer to the original question."""
-    data_source: str = Field(
-        ...,
-        description="Given a user question, choose to route it to 'global_search' or 'vectorstore'. "
-                    "If the user mentions online search or find other resources, use 'global_search'. "
-                    "Otherwise, default to 'vectorstore'."
-    )
-
 class GradeDocuments(BaseModel):
     """Binary score for relevance check on retrieved documents."""
     
     binary_score: str = Field(description="Documents are relevant to the question, 'yes' or 'no'")
 
 
+class DocumentGrade(BaseModel):
+    """Binary score for one numbered document."""
+
+    index: int = Field(description="Number of the document as given in the prompt")
+    binary_score: str = Field(description="Document is relevant to the question, 'yes' or 'no'")
+
+
+class GradeDocumentsBatch(BaseModel):
+    """Binary scores for all retrieved documents, one per numbered document."""
+
+    grades: list[DocumentGrade] = Field(description="One grade for every document")
+
+
+class QueryPlan(BaseModel):
+    """Route for the question and the retrieval tools to use for global search."""
+
+    data_source: str = Field(
+        ...,
+        description="Route the question to 'global_search' or 'retrieve' (vectorstore). "
+                    "Default to 'retrieve'."
+    )
+    selected_tools: list[str] = Field(
+        description="Tools for global search. Choose from: tavily, semantic_scholar, db_chunk. Can be multiple tools."
+    )
+    reason: str = Field(description="Short reason for the route and tool selection.")
+    confidence: float = Field(description="Confidence score from 0.0 to 1.0.")
+
+
 class RetrievalPlan(BaseModel):
     """Plan for selecting retrieval tools."""
 
@@ -59,56 +110,27 @@ class RetrievalPlan(BaseModel):
     confidence: float = Field(description="Confidence score from 0.0 to 1.0.")
 
 
-def _format_document(source: str, title: str, content: str, url: str = "") -> str:
-    safe_title = title.strip() if title else "N/A"
-    safe_url = url.strip() if url else "N/A"
-    safe_content = content.strip() if content else ""
-    return (
-        f"[SOURCE: {source}]\n"
-        f"Title: {safe_title}\n"
-        f"URL: {safe_url}\n"
-        f"Content:\n{safe_content}"
-    )
-
-
-def _search_semantic_scholar(query: str, max_results: int = 2) -> list[str]:
-    endpoint = "https://api.semanticscholar.org/graph/v1/paper/search"
+async def _search_semantic_scholar(query: str, max_results: int = 2) -> list[DocumentRef]:
+    endpoint = SEMANTIC_SCHOLAR_SEARCH_URL
     params = {
         "query": query,
         "limit": max_results,
         "fields": "title,abstract,url,year",
     }
-    try:
-        response = requests.get(endpoint, params=params, timeout=5)
-        response.raise_for_status()
-        data = response.json().get("data", [])
-    except Exception as e:
-        print(f"Semantic Scholar search failed: {e}")
-        return []
+    # errors propagate to the tool guard, which logs them and feeds the circuit breaker
+    cache_key = ResponseCache.key(endpoint, query, max_results)
+    response = await get_http_client().request_json("GET", endpoint, cache_key=cache_key, params=params)
+    # results without an abstract are skipped
+    return external_refs("semantic_scholar", response)
 
-    docs = []
-    for item in data:
-        abstract = (item.get("abstract") or "").strip()
-        if not abstract:
-            continue
-        docs.append(
-            _format_document(
-                source="semantic_scholar",
-                title=item.get("title", "Untitled"),
-                content=abstract,
-                url=item.get("url", ""),
-            )
-        )
-    return docs
 
-
-def _search_tavily(query: str, max_results: int = 2) -> list[str]:
+async def _search_tavily(query: str, max_results: int = 2) -> list[DocumentRef]:
     api_key = os.getenv("TAVILY_API_KEY", "")
     if not api_key:
         print("TAVILY_API_KEY is not set, skip Tavily search.")
         return []
 
-    endpoint = "https://api.tavily.com/search"
+    endpoint = TAVILY_SEARCH_URL
     payload = {
         "api_key": api_key,
         "query": query,
@@ -117,28 +139,11 @@ def _search_tavily(query: str, max_results: int = 2) -> list[str]:
         "include_answer": False,
         "include_images": False,
     }
-    try:
-        response = requests.post(endpoint, json=payload, timeout=5)
-        response.raise_for_status()
-        results = response.json().get("results", [])
-    except Exception as e:
-        print(f"Tavily search failed: {e}")
-        return []
-
-    docs = []
-    for item in results:
-        snippet = (item.get("content") or "").strip()
-        if not snippet:
-            continue
-        docs.append(
-            _format_document(
-                source="tavily",
-                title=item.get("title", "Untitled"),
-                content=snippet,
-                url=item.get("url", ""),
-            )
-        )
-    return docs
+    # the API key is not part of the cache key
+    cache_key = ResponseCache.key(endpoint, query, max_results)
+    response = await get_http_client().request_json("POST", endpoint, cache_key=cache_key, json=payload)
+    # results without a snippet are skipped
+    return external_refs("tavily", response)
 
 
 def _normalize_selected_tools(selected_tools: list[str]) -> list[str]:
@@ -152,19 +157,17 @@ def _normalize_selected_tools(selected_tools: list[str]) -> list[str]:
 
 
 def _rrf_fuse(
-    vector_results: Sequence[tuple],
-    bm25_results: Sequence[tuple],
+    vector_results: Sequence[RetrievedChunk],
+    bm25_results: Sequence[RetrievedChunk],
     rrf_k: int = 60,
-) -> list[tuple]:
+) -> list[RetrievedChunk]:
     scores: dict[str, float] = {}
-    items: dict[str, tuple] = {}
+    items: dict[str, RetrievedChunk] = {}
 
-    def _key(doc_tuple: tuple) -> str:
-        chunk, _paper = doc_tuple
-        chunk_id = getattr(chunk, "id", None)
-        if chunk_id is not None:
-            return f"id:{chunk_id}"
-        return f"text:{hash(chunk.text)}"
+    def _key(result: RetrievedChunk) -> str:
+        if result.chunk_id is not None:
+            return f"id:{result.chunk_id}"
+        return f"text:{hash(result.text)}"
 
     for rank, item in enumerate(vector_results, start=1):
         key = _key(item)
@@ -181,13 +184,7 @@ def _rrf_fuse(
 
 
 
-def route_question(state: AgentState):
-    print("--- ROUTE QUESTION ---")
-    question = state["original_question"]
-    
-    structured_llm_router = deduce_model.with_structured_output(RouteQuery)
-    
-    system = """You are an expert at routing a user question to a vectorstore or global search.
+_ROUTER_SYSTEM_PROMPT = """You are an expert at routing a user question to a vectorstore or global search.
     The vectorstore contains documents about a specific topic (Local DB).
     The global_search can call multiple tools (Tavily, Semantic Scholar, and global DB chunk search).
     The vectorstore is the default choice.
@@ -197,108 +194,155 @@ def route_question(state: AgentState):
     or the question is broad/ambiguous and needs baseline external definitions.
     Return either "global_search" or "retrieve" (for vectorstore).
     """
-    
-    route_prompt = ChatPromptTemplate.from_messages(
-        [("system", system), ("human", "{question}")]
+
+_PLANNER_SYSTEM_PROMPT = """You are selecting retrieval tools for a math assistant.
+Available tools:
+- tavily: web pages, broad definitions, general/ambiguous questions, community-style explanations.
+- semantic_scholar: related papers and research abstracts for academic/general scholarly questions.
+- db_chunk: search all chunks in local database; best when question/excerpt mentions concrete references.
+
+Rules:
+1) If question or user excerpt mentions explicit references/papers/ids, use db_chunk.
+2) If question is broad or ambiguous (example: "what is convergence"), include tavily.
+3) If question asks related/similar papers or general academic literature, or the excerpt/question mentions academic context such as paper or names, include semantic_scholar.
+4) If uncertain, choose 2-3 tools.
+Return selected_tools using only: tavily, semantic_scholar, db_chunk."""
+
+_ALL_TOOLS = ["tavily", "semantic_scholar", "db_chunk"]
+
+
+def _excerpt_context(state: AgentState) -> str:
+    user_excerpts = state.get("user_excerpts", [])
+    return "\n".join(user_excerpts[:3]) if user_excerpts else "N/A"
+
+
+async def _llm_plan(question: str, excerpt_context: str) -> QueryPlan:
+    # the LLM router: route and global-search tools in one structured call
+    plan_prompt = ChatPromptTemplate.from_messages(
+        [
+            (
+                "system",
+                _ROUTER_SYSTEM_PROMPT
+                + "\n\nIn the same answer, also select the tools for global_search:\n\n"
+                + _PLANNER_SYSTEM_PROMPT,
+            ),
+            (
+                "human",
+                "Question:\n{question}\n\nUser excerpts (optional):\n{excerpt_context}",
+            ),
+        ]
     )
-    
-    router = route_prompt | structured_llm_router
-    result: RouteQuery = cast(RouteQuery, router.invoke({"question": question}))
+    planner = plan_prompt | deduce_model.with_structured_output(QueryPlan)
+    return cast(
+        QueryPlan,
+        await planner.ainvoke({"question": question, "excerpt_context": excerpt_context}),
+    )
+
+
+#planning node: route + retrieval tools in one structured call
+async def plan_question(state: AgentState):
+    print("--- PLAN QUESTION ---")
+    question = state["original_question"]
 
-    if result.data_source == "global_search":  
+    # keyword rules / embedding centroids first; a local route needs no LLM call at all
+    classifier = get_route_classifier()
+    fast_route = await classifier.classify(question) if ROUTER_FAST_PATH else None
+    if fast_route == "retrieve":
+        print("--- ROUTE: TO LOCAL VECTORSTORE (fast path) ---")
+        return {"route": "retrieve"}
+    if fast_route is None and ROUTER_FAST_PATH:
+        classifier.record_llm_fallback()
+
+    # otherwise one call returns the route and the tools, so the global path does not
+    # wait on a second planner call in global_search
+    try:
+        plan = await _llm_plan(question, _excerpt_context(state))
+    except Exception as e:
+        # global_search plans its own tools when none were selected here
+        print(f"Question planning failed, route to {fast_route or 'retrieve'}: {e}")
+        return {"route": fast_route or "retrieve"}
+
+    route = fast_route or ("global_search" if plan.data_source == "global_search" else "retrieve")
+    selected_tools = _normalize_selected_tools(plan.selected_tools) or list(_ALL_TOOLS)
+    confidence = max(0.0, min(1.0, float(plan.confidence)))
+    reason = plan.reason.strip() if plan.reason else "No reason provided."
+
+    if route == "global_search":
         print("--- ROUTE: TO GLOBAL SEARCH ---")
-        return "global_search"
     else:
         print("--- ROUTE: TO LOCAL VECTORSTORE ---")
-        return "retrieve"
+    print(f"Planned tools: {selected_tools}, confidence: {confidence:.2f}")
+    # tools are kept on the local route too, for a later fallback to global_search
+    return {
+        "route": route,
+        "selected_tools": selected_tools,
+        "retrieval_confidence": confidence,
+        "retrieval_reason": reason,
+    }
+
+
+#conditional entry edge
+def route_question(state: AgentState):
+    return state.get("route") or "retrieve"
+
+async def _search_local(queries: list[str], paper_id: str | None) -> list[list[RetrievedChunk]]:
+    # fused vector + lexical results per sub-query, in input order.
+    # with the fts backend, all sub-queries are ranked, fused and limited in a single
+    # SQL statement on one pool connection.
+    if LEXICAL_SEARCH_BACKEND == "fts":
+        return await asearch_hybrid_batch(queries, paper_id=paper_id, top_k=10, candidate_k=5)
+
+    # bm25 scores outside the database, so sub-queries run concurrently. Embeddings
+    # are fetched first in one batch request and the paper cache entry is loaded once,
+    # so every sub-query only pays for its own search.
+    prefetch = [aget_query_embeddings(queries)]
+    if paper_id:
+        prefetch.append(get_paper_chunk_cache().aget(paper_id))
+    await asyncio.gather(*prefetch)
+    semaphore = asyncio.Semaphore(RETRIEVE_MAX_CONCURRENCY)
+
+    async def _search_one(query: str) -> list[RetrievedChunk]:
+        async with semaphore:
+            vector_results, lexical_results = await asyncio.gather(
+                asearch_base(query, paper_id=paper_id, top_k=5),
+                asearch_lexical(query, paper_id=paper_id, top_k=5),
+            )
+            return _rrf_fuse(vector_results, lexical_results)
+
+    return list(await asyncio.gather(*(_search_one(query) for query in queries)))
+
 
-#retrieval node， need to be optimized
-def retrieve(state: AgentState):
+#retrieval node
+async def retrieve(state: AgentState):
     original_q = state["original_question"]
     current_q = state.get("current_question", original_q)
     paper_id = state.get("paper_id", None)
-    user_excerpts = state.get("user_excerpts", [])
-    
-    all_retrieved_docs: list[str] = []
-    seen_texts = set()
-    
-    # search by original question
-    print(f"--- SEARCHING BY QUESTION: {original_q[:50]}... ---")
-    docs_by_question_vector = search_base(original_q, paper_id=paper_id, top_k=5)
-    docs_by_question_bm25 = search_bm25(original_q, paper_id=paper_id, top_k=5)
-    docs_by_question = _rrf_fuse(docs_by_question_vector, docs_by_question_bm25)
-    
-    for doc_tuple in docs_by_question:
-        chunk, paper = doc_tuple
-        if chunk.text not in seen_texts:
-            all_retrieved_docs.append(
-                _format_document(
-                    source="local_db",
-                    title=getattr(paper, "title", "Local database chunk"),
-                    content=chunk.text,
-                    url="",
-                )
-            )
-            seen_texts.add(chunk.text)
-    
-    print(f"Found {len(docs_by_question)} docs by question")
-    
-    # search by user excerpts
-    if user_excerpts:
-        print(f"--- SEARCHING BY USER EXCERPTS: {len(user_excerpts)} items ---")
-        
-        for i, excerpt in enumerate(user_excerpts):
-            excerpt_content = excerpt
-            print(f"  Excerpt {i+1}: {excerpt_content[:50]}...")
-            
-            docs_by_excerpt_vector = search_base(
-                excerpt_content, 
-                paper_id=paper_id, 
-                top_k=5  
-            )
-            docs_by_excerpt_bm25 = search_bm25(
-                excerpt_content,
-                paper_id=paper_id,
-                top_k=5,
-            )
-            docs_by_excerpt = _rrf_fuse(docs_by_excerpt_vector, docs_by_excerpt_bm25)
-            
-            for doc_tuple in docs_by_excerpt:
-                chunk, paper = doc_tuple
-                if chunk.text not in seen_texts:
-                    all_retrieved_docs.append(
-                        _format_document(
-                            source="local_db",
-                            title=getattr(paper, "title", "Local database chunk"),
-                            content=chunk.text,
-                            url="",
-                        )
-                    )
-                    seen_texts.add(chunk.text)
-            
-            print(f"  Found {len(docs_by_excerpt)} related docs for excerpt {i+1}")
-    
-    # search by transformed question
+    user_excerpts = state.get("user_excerpts", []) or []
+
+    # sub-queries: original question, each user excerpt, then the transformed question
+    labels = ["question"]
+    queries = [original_q]
+    for i, excerpt in enumerate(user_excerpts):
+        print(f"  Excerpt {i+1}: {excerpt[:50]}...")
+        labels.append(f"excerpt {i+1}")
+        queries.append(excerpt)
     if current_q and current_q != original_q:
-        print(f"--- SEARCHING BY TRANSFORMED QUERY ---")
-        docs_by_transformed_vector = search_base(current_q, paper_id=paper_id, top_k=5)
-        docs_by_transformed_bm25 = search_bm25(current_q, paper_id=paper_id, top_k=5)
-        docs_by_transformed = _rrf_fuse(docs_by_transformed_vector, docs_by_transformed_bm25)
-        
-        for doc_tuple in docs_by_transformed:
-            chunk, paper = doc_tuple
-            if chunk.text not in seen_texts:
-                all_retrieved_docs.append(
-                    _format_document(
-                        source="local_db",
-                        title=getattr(paper, "title", "Local database chunk"),
-                        content=chunk.text,
-                        url="",
-                    )
-                )
-                seen_texts.add(chunk.text)
-        
-        print(f"Found {len(docs_by_transformed)} docs by transformed query")
+        labels.append("transformed query")
+        queries.append(current_q)
+
+    print(f"--- SEARCHING {len(queries)} QUERIES: {original_q[:50]}... ---")
+    start = time.perf_counter()
+    results_per_query = await _search_local(queries, paper_id)
+    print(f"--- SEARCHED {len(queries)} QUERIES in {(time.perf_counter() - start) * 1000:.0f} ms ---")
+
+    all_retrieved_docs: list[DocumentRef] = []
+    seen_texts = set()
+    for label, results in zip(labels, results_per_query, strict=True):
+        for result in results:
+            if result.text not in seen_texts:
+                all_retrieved_docs.append(chunk_ref(result, source="local_db"))
+                seen_texts.add(result.text)
+        print(f"Found {len(results)} docs by {label}")
     
     print(f"--- TOTAL: {len(all_retrieved_docs)} unique documents for RAG ---")
     
@@ -308,31 +352,11 @@ def retrieve(state: AgentState):
         "search_count": state.get("search_count", 0) + 1,
     }
 
-#global search node
-def global_search(state: AgentState):
-    print("--- GLOBAL SEARCH DISPATCH ---")
-    question = state.get("current_question", state["original_question"])
-    user_excerpts = state.get("user_excerpts", [])
-    excerpt_context = "\n".join(user_excerpts[:3]) if user_excerpts else "N/A"
-
+async def _plan_retrieval(question: str, excerpt_context: str) -> tuple[list[str], float, str]:
     planner_llm = deduce_model.with_structured_output(RetrievalPlan)
     planner_prompt = ChatPromptTemplate.from_messages(
         [
-            (
-                "system",
-                """You are selecting retrieval tools for a math assistant.
-Available tools:
-- tavily: web pages, broad definitions, general/ambiguous questions, community-style explanations.
-- semantic_scholar: related papers and research abstracts for academic/general scholarly questions.
-- db_chunk: search all chunks in local database; best when question/excerpt mentions concrete references.
-
-Rules:
-1) If question or user excerpt mentions explicit references/papers/ids, use db_chunk.
-2) If question is broad or ambiguous (example: "what is convergence"), include tavily.
-3) If question asks related/similar papers or general academic literature, or the excerpt/question mentions academic context such as paper or names, include semantic_scholar.
-4) If uncertain, choose 2-3 tools.
-Return selected_tools using only: tavily, semantic_scholar, db_chunk.""",
-            ),
+            ("system", _PLANNER_SYSTEM_PROMPT),
             (
                 "human",
                 "Question:\n{question}\n\nUser excerpts (optional):\n{excerpt_context}",
@@ -343,18 +367,32 @@ Return selected_tools using only: tavily, semantic_scholar, db_chunk.""",
     try:
         plan: RetrievalPlan = cast(
             RetrievalPlan,
-            planner.invoke({"question": question, "excerpt_context": excerpt_context}),
+            await planner.ainvoke({"question": question, "excerpt_context": excerpt_context}),
         )
         selected_tools = _normalize_selected_tools(plan.selected_tools)
         if not selected_tools:
-            selected_tools = ["tavily", "semantic_scholar", "db_chunk"]
+            selected_tools = list(_ALL_TOOLS)
         confidence = max(0.0, min(1.0, float(plan.confidence)))
         reason = plan.reason.strip() if plan.reason else "No reason provided."
     except Exception as e:
         print(f"Tool planning failed, fallback to all tools: {e}")
-        selected_tools = ["tavily", "semantic_scholar", "db_chunk"]
+        selected_tools = list(_ALL_TOOLS)
         confidence = 0.0
         reason = "Planner failed, fallback to all tools."
+    return selected_tools, confidence, reason
+
+
+#global search node
+async def global_search(state: AgentState):
+    print("--- GLOBAL SEARCH DISPATCH ---")
+    selected_tools = state.get("selected_tools", [])
+    if selected_tools:
+        # planned together with the route in plan_question
+        confidence = state.get("retrieval_confidence", 0.0)
+        reason = state.get("retrieval_reason", "")
+    else:
+        question = state.get("current_question", state["original_question"])
+        selected_tools, confidence, reason = await _plan_retrieval(question, _excerpt_context(state))
 
     print(f"Selected tools: {selected_tools}, confidence: {confidence:.2f}")
     return {
@@ -365,70 +403,55 @@ Return selected_tools using only: tavily, semantic_scholar, db_chunk.""",
     }
 
 
-def semantic_scholar_search(state: AgentState):
+async def semantic_scholar_search(state: AgentState):
     print("--- SEMANTIC SCHOLAR SEARCH ---")
     selected_tools = state.get("selected_tools", [])
     if selected_tools and "semantic_scholar" not in selected_tools:
         print("Skip Semantic Scholar by planner decision.")
         return {"semantic_docs": []}
     question = state.get("current_question", state["original_question"])
-    docs = _search_semantic_scholar(question, max_results=2)
+    docs = await get_tool_guard().run(
+        "semantic_scholar", lambda: _search_semantic_scholar(question, max_results=2)
+    )
     print(f"Found {len(docs)} docs from Semantic Scholar.")
     return {"semantic_docs": docs}
 
 
-def tavily_search(state: AgentState):
+async def tavily_search(state: AgentState):
     print("--- TAVILY SEARCH ---")
     selected_tools = state.get("selected_tools", [])
     if selected_tools and "tavily" not in selected_tools:
         print("Skip Tavily by planner decision.")
         return {"tavily_docs": []}
     question = state.get("current_question", state["original_question"])
-    docs = _search_tavily(question, max_results=2)
+    docs = await get_tool_guard().run("tavily", lambda: _search_tavily(question, max_results=2))
     print(f"Found {len(docs)} docs from Tavily.")
     return {"tavily_docs": docs}
 
 
-def db_chunk_search(state: AgentState):
+async def db_chunk_search(state: AgentState):
     print("--- GLOBAL DATABASE CHUNK SEARCH ---")
     selected_tools = state.get("selected_tools", [])
     if selected_tools and "db_chunk" not in selected_tools:
         print("Skip DB chunk search by planner decision.")
         return {"db_docs": []}
     question = state.get("current_question", state["original_question"])
-    docs_with_meta = search_base(question, paper_id=None, top_k=2)
+    docs_with_meta = await get_tool_guard().run(
+        "db_chunk", lambda: asearch_base(question, paper_id=None, top_k=2)
+    )
     seen_texts = set()
-    docs: list[str] = []
+    docs: list[DocumentRef] = []
 
-    for chunk, paper in docs_with_meta:
-        if chunk.text in seen_texts:
+    for result in docs_with_meta:
+        if result.text in seen_texts:
             continue
-        seen_texts.add(chunk.text)
-        docs.append(
-            _format_document(
-                source="global_db_chunk",
-                title=getattr(paper, "title", "Global database chunk"),
-                content=chunk.text,
-                url="",
-            )
-        )
+        seen_texts.add(result.text)
+        docs.append(chunk_ref(result, source="global_db_chunk"))
 
     print(f"Found {len(docs)} docs from global database chunk search.")
     return {"db_docs": docs}
 
-def grade_documents(state: AgentState):
-    # Strategy: If LLM thinks the retrieved document chunks are irrelevant to the question,
-    # let LLM modify the query and search the database again.
-    # If the documents are relevant to the question, return them; otherwise, proceed to global_search
-    print("--- CHECK: DOCUMENT RELEVANCE ---")
-    question = state.get("current_question", state["original_question"])
-    documents = list(state.get("documents", []))
-    documents.extend(state.get("semantic_docs", []))
-    documents.extend(state.get("tavily_docs", []))
-    documents.extend(state.get("db_docs", []))
-
-    structured_llm_grader = deduce_model.with_structured_output(GradeDocuments)
-    system_prompt = """You are a grader assessing relevance of a retrieved document to a user question. \n 
+_GRADE_SYSTEM_PROMPT = """You are a grader assessing relevance of a retrieved document to a user question. \n 
     Rules:
     1. If the document answers the question directly, grade yes. \n
     2. If the document is irrelevant to the question, grade no. \n
@@ -443,28 +466,166 @@ def grade_documents(state: AgentState):
 
     Output only "yes" or "no".
     """
-    
+
+
+async def _grade_each(question: str, documents: list[str]) -> list[bool]:
+    # one structured call per document, sent concurrently through abatch
     grade_prompt = ChatPromptTemplate.from_messages(
         [
-            ("system", system_prompt),
+            ("system", _GRADE_SYSTEM_PROMPT),
             ("human", "Retrieved document: \n\n {document} \n\n User question: {question}"),
         ]
     )
-    
-    retrieval_grader = grade_prompt | structured_llm_grader
-    
-    # check all documents and keep relevant context only
-    filtered_docs = []
-    
-    for doc in documents:
-        # LLM judges: can doc answer the question?
-        score: GradeDocuments = cast(GradeDocuments, retrieval_grader.invoke({"question": question, "document": doc}))
-        if score.binary_score == "yes":
-            filtered_docs.append(doc)
-            
-    return {"documents": filtered_docs}
+    retrieval_grader = grade_prompt | deduce_model.with_structured_output(GradeDocuments)
+
+    scores = await retrieval_grader.abatch(
+        [{"question": question, "document": doc} for doc in documents],
+        config={"max_concurrency": GRADING_MAX_CONCURRENCY},
+        return_exceptions=True,
+    )
+    verdicts = []
+    for i, score in enumerate(scores):
+        if isinstance(score, Exception):
+            print(f"Grading document {i} failed, dropping it: {score}")
+            verdicts.append(False)
+        else:
+            verdicts.append(cast(GradeDocuments, score).binary_score == "yes")
+    return verdicts
+
+
+async def _grade_all_at_once(question: str, documents: list[str]) -> list[bool]:
+    # one structured call that grades every document; documents the model
+    # leaves out (or a failed call) fall back to per-document grading
+    numbered = "\n\n".join(
+        f"[Document {i}]\n{doc}" for i, doc in enumerate(documents)
+    )
+    grade_prompt = ChatPromptTemplate.from_messages(
+        [
+            (
+                "system",
+                _GRADE_SYSTEM_PROMPT
+                + "\n    You will receive several numbered documents. Grade each one independently "
+                "and return one grade per document with its number.",
+            ),
+            ("human", "Retrieved documents: \n\n {documents} \n\n User question: {question}"),
+        ]
+    )
+    retrieval_grader = grade_prompt | deduce_model.with_structured_output(GradeDocumentsBatch)
+
+    verdicts: dict[int, bool] = {}
+    try:
+        result = cast(
+            GradeDocumentsBatch,
+            await retrieval_grader.ainvoke({"question": question, "documents": numbered}),
+        )
+        for grade in result.grades:
+            if 0 <= grade.index < len(documents):
+                verdicts[grade.index] = grade.binary_score.strip().lower() == "yes"
+    except Exception as e:
+        print(f"Single-call grading failed, fallback to per-document grading: {e}")
+
+    missing = [i for i in range(len(documents)) if i not in verdicts]
+    if missing:
+        print(f"Grading {len(missing)} ungraded documents one by one")
+        graded = await _grade_each(question, [documents[i] for i in missing])
+        for i, verdict in zip(missing, graded, strict=True):
+            verdicts[i] = verdict
+    return [verdicts[i] for i in range(len(documents))]
+
+
+async def _prefilter_by_similarity(
+    question: str,
+    chunk_ids: list[int | None],
+    paper_id: str | None,
+) -> tuple[list[bool | None], list[float | None]]:
+    # verdicts: True / False for local chunks outside the ambiguous similarity band,
+    # None for documents the LLM still has to grade; plus each document's similarity
+    verdicts: list[bool | None] = [None] * len(chunk_ids)
+    scores: list[float | None] = [None] * len(chunk_ids)
+    local_ids = [chunk_id for chunk_id in chunk_ids if chunk_id is not None]
+    try:
+        similarities = await achunk_similarities(question, local_ids, paper_id=paper_id)
+    except Exception as e:
+        print(f"Similarity prefilter failed, grading all documents with the LLM: {e}")
+        return verdicts, scores
+
+    for i, chunk_id in enumerate(chunk_ids):
+        similarity = similarities.get(chunk_id) if chunk_id is not None else None
+        if similarity is None:
+            continue
+        scores[i] = similarity
+        if similarity >= GRADING_ACCEPT_SIMILARITY:
+            verdicts[i] = True
+        elif similarity < GRADING_REJECT_SIMILARITY:
+            verdicts[i] = False
+    return verdicts, scores
+
+
+async def grade_documents(state: AgentState):
+    # Strategy: If LLM thinks the retrieved document chunks are irrelevant to the question,
+    # let LLM modify the query and search the database again.
+    # If the documents are relevant to the question, return them; otherwise, proceed to global_search
+    print("--- CHECK: DOCUMENT RELEVANCE ---")
+    question = state.get("current_question", state["original_question"])
+    documents: list[DocumentRef] = []
+    for docs_key in ("documents", "semantic_docs", "tavily_docs", "db_docs"):
+        documents.extend(state.get(docs_key, []) or [])
+
+    if not documents:
+        return {"documents": []}
+
+    chunk_ids = [ref.get("chunk_id") for ref in documents]
+    verdicts: list[bool | None] = [None] * len(documents)
+    scores: list[float | None] = [None] * len(documents)
+    if GRADING_PREFILTER:
+        verdicts, scores = await _prefilter_by_similarity(question, chunk_ids, state.get("paper_id") or None)
+    pending = [i for i, verdict in enumerate(verdicts) if verdict is None]
+    accepted = sum(1 for verdict in verdicts if verdict is True)
+    rejected = sum(1 for verdict in verdicts if verdict is False)
+
+    # GRADING_MODE: "batch" -> concurrent per-document calls, "single" -> one call for all
+    start = time.perf_counter()
+    if pending:
+        # only the documents the LLM grades need their text
+        texts = await ahydrate_documents([documents[i] for i in pending])
+        for i in [i for i, text in zip(pending, texts, strict=True) if text is None]:
+            verdicts[i] = False
+        pending = [i for i, text in zip(pending, texts, strict=True) if text is not None]
+        pending_docs = [text for text in texts if text is not None]
+        if GRADING_MODE == "single":
+            graded = await _grade_all_at_once(question, pending_docs)
+        else:
+            graded = await _grade_each(question, pending_docs)
+        for i, verdict in zip(pending, graded, strict=True):
+            verdicts[i] = verdict
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    # keep relevant context only; generate ranks by retrieval score + prefilter similarity
+    keep = [i for i, verdict in enumerate(verdicts) if verdict]
+    filtered_docs: list[DocumentRef] = []
+    for i in keep:
+        ref = dict(documents[i])
+        if scores[i] is not None:
+            ref["similarity"] = round(scores[i], 4)
+        filtered_docs.append(cast(DocumentRef, ref))
+    grading_stats = {
+        "documents": len(documents),
+        "auto_accepted": accepted,
+        "auto_rejected": rejected,
+        "llm_graded": len(pending),
+        "skipped_grader_calls": accepted + rejected,
+    }
+    print(
+        f"--- GRADED {len(documents)} docs: {accepted} auto-accepted, {rejected} auto-rejected, "
+        f"{len(pending)} by LLM ({GRADING_MODE}) in {elapsed_ms:.0f} ms: "
+        f"{len(filtered_docs)} relevant ---"
+    )
+    return {
+        "documents": filtered_docs,
+        "grading_stats": grading_stats,
+    }
             
-def transform_question(state: AgentState):
+async def transform_question(state: AgentState):
     print("--- TRANSFORM QUERY ---")
     question = state["original_question"]
     paper_id = state.get("paper_id", None)
@@ -473,10 +634,10 @@ def transform_question(state: AgentState):
     context_text = []
     if paper_id:
         print(f"--- SEARCHING OPENING CHUNKS BY ID: {paper_id} ---")
-        context_text.extend(search_opening_chunks_by_id(paper_id))
+        context_text.extend(await asearch_opening_chunks_by_id(paper_id))
     else:
         print(f"--- SEARCHING OPENING CHUNKS BY QUERY: {question} ---")
-        context_text.extend(search_opening_chunks_by_query(question, top_k=2))
+        context_text.extend(await asearch_opening_chunks_by_query(question, top_k=2))
 
     if not context_text:
         return {"source": "global"}
@@ -487,7 +648,7 @@ def transform_question(state: AgentState):
     hyde_prompt = ChatPromptTemplate.from_template(hyde_template)
     print(f"hyde_prompt: {hyde_prompt}")
     hyde_chain = hyde_prompt | deduce_model | StrOutputParser()
-    better_question = hyde_chain.invoke({"question": question, "context": context})
+    better_question = await hyde_chain.ainvoke({"question": question, "context": context})
     
     return {"current_question": better_question, "search_count": state.get("search_count", 0) + 1}
 
@@ -518,7 +679,18 @@ async def generate(state: AgentState):
     summary = state.get("summary", "")
     recent_messages = state.get("messages", [])
 
-    context = "\n\n".join(documents)
+    # hydrate the document refs, then rank by retrieval and grading scores, dedupe and
+    # fit them into the token budget
+    texts = await ahydrate_documents(documents)
+    ranking = context_scores(documents)
+    hydrated = [(text, score) for text, score in zip(texts, ranking, strict=True) if text is not None]
+    packed = pack_context([text for text, _ in hydrated], [score for _, score in hydrated])
+    context = packed.text
+    print(
+        f"--- CONTEXT: {packed.used_tokens}/{packed.budget} tokens, {packed.packed} of "
+        f"{len(documents)} docs ({packed.truncated} truncated, {packed.duplicates} duplicates, "
+        f"{packed.skipped} over budget) ---"
+    )
 
     # Load domain prompt template from skills/<skill_name>/generate_prompt.txt.
     prompt_template = _get_generate_prompt_template(paper_topic)
@@ -530,7 +702,7 @@ async def generate(state: AgentState):
 
     # Use astream() for streaming generation instead of invoke()
     full_response = ""
-    async for chunk in deduce_model.astream(messages):
+    async for chunk in deduce_model.astream(messages, config={"tags": [ANSWER_STREAM_TAG]}):
         if hasattr(chunk, 'content') and chunk.content:
             # Ensure content is a string before concatenating
             content = chunk.content
@@ -540,17 +712,18 @@ async def generate(state: AgentState):
     # Return complete answer for state persistence
     return {
         "answer": full_response,
-        "messages": [create_message("ai", full_response)]
+        "messages": [create_message("ai", full_response)],
+        "context_stats": packed.stats(),
     }
 
 #not found node
-def not_found(state: AgentState):
+async def not_found(state: AgentState):
     answer = "Sorry, I searched both locally and online but couldn't find relevant info."
     return {"answer": answer, "messages": [create_message("ai", answer)]}
 
 
-#summary node
-def summarize_conversation(state: AgentState):
+#conversation compaction: run in the background after a turn (see compaction.py)
+async def summarize_conversation(state: AgentState):
     summary = state.get("summary", "")
     messages = state["messages"]
     
@@ -577,7 +750,7 @@ def summarize_conversation(state: AgentState):
         SystemMessage(content=system_prompt),
         HumanMessage(content=f"Conversation to summarize:\n\n{conversation_str}"),
     ]
-    response = writing_model.invoke(prompt_message)   
+    response = await writing_model.ainvoke(prompt_message)   
 
     # Delete old messages from messages
     messages_to_delete = []
@@ -585,4 +758,4 @@ def summarize_conversation(state: AgentState):
         if msg.id:
             messages_to_delete.append(RemoveMessage(id=msg.id))
     
-    return {"summary": response.content, "messages": messages + messages_to_delete}
+    return {"summary": response.content, "messages": messages_to_delete}
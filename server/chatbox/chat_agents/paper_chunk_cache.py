@@ -0,0 +1,259 @@
+import asyncio
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Optional, Sequence
+
+import numpy as np
+from sqlmodel import Session, select, col
+
+from database import engine
+from models.paper import PaperChunk, Paper
+from managers.bm25_index_manager import tokenize_for_bm25, BM25_K1, BM25_B
+from chatbox.core.config import PAPER_CACHE_MAX_MB, PAPER_CACHE_TTL_SECONDS
+from chatbox.chat_agents.records import RetrievedChunk
+
+
+class PaperChunkMatrix:
+    """
+    All chunks of one paper held in memory: ids, texts, a row-normalized float32
+    embedding matrix for exact cosine search, and per-paper BM25 postings.
+    """
+
+    __slots__ = (
+        "paper_id", "title", "chunk_ids", "chunk_indexes", "texts",
+        "embeddings", "postings", "doc_lengths", "avgdl", "nbytes", "expires_at",
+    )
+
+    def __init__(self, paper_id: str, title: str, rows: Sequence, ttl_seconds: float):
+        self.paper_id = paper_id
+        self.title = title
+        self.chunk_ids = [row.id for row in rows]
+        self.chunk_indexes = [row.chunk_index for row in rows]
+        self.texts = [row.text for row in rows]
+
+        dim = next((len(row.embedding) for row in rows if row.embedding is not None), 0)
+        matrix = np.zeros((len(rows), dim), dtype=np.float32)
+        for i, row in enumerate(rows):
+            if row.embedding is not None:
+                matrix[i] = np.asarray(row.embedding, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        self.embeddings = matrix / norms
+
+        postings: dict[str, list[tuple[int, int]]] = {}
+        doc_lengths = np.zeros(len(rows), dtype=np.float32)
+        for i, chunk_text in enumerate(self.texts):
+            tokens = tokenize_for_bm25(chunk_text)
+            doc_lengths[i] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                postings.setdefault(term, []).append((i, tf))
+        self.postings = {
+            term: (np.array([i for i, _ in entries]), np.array([tf for _, tf in entries], dtype=np.float32))
+            for term, entries in postings.items()
+        }
+        self.doc_lengths = doc_lengths
+        self.avgdl = float(doc_lengths.mean()) if len(rows) else 0.0
+        if self.avgdl <= 0:
+            self.avgdl = 1.0
+
+        # rough footprint: matrix + texts + postings arrays
+        self.nbytes = int(
+            self.embeddings.nbytes
+            + sum(len(t) for t in self.texts) * 2
+            + sum(ids.nbytes + tfs.nbytes + 64 for ids, tfs in self.postings.values())
+        )
+        self.expires_at = time.time() + ttl_seconds
+
+    def __len__(self) -> int:
+        return len(self.chunk_ids)
+
+    def vector_scores(self, query_vectors: np.ndarray) -> np.ndarray:
+        # cosine similarity of every query (rows) against every chunk (columns)
+        queries = np.atleast_2d(np.asarray(query_vectors, dtype=np.float32))
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (queries / norms) @ self.embeddings.T
+
+    def bm25_scores(self, query: str) -> np.ndarray:
+        # BM25 with the paper as the corpus, same formula as BM25IndexManager
+        scores = np.zeros(len(self), dtype=np.float32)
+        n_docs = len(self)
+        for term, qtf in Counter(tokenize_for_bm25(query)).items():
+            entry = self.postings.get(term)
+            if entry is None:
+                continue
+            ids, tfs = entry
+            idf = np.log(1 + (n_docs - len(ids) + 0.5) / (len(ids) + 0.5))
+            lengths = self.doc_lengths[ids]
+            scores[ids] += qtf * idf * tfs * (BM25_K1 + 1) / (
+                tfs + BM25_K1 * (1 - BM25_B + BM25_B * lengths / self.avgdl)
+            )
+        return scores
+
+    def hit(self, i: int, score: float) -> RetrievedChunk:
+        return RetrievedChunk(
+            self.chunk_ids[i], self.paper_id, self.chunk_indexes[i], self.texts[i], self.title, score
+        )
+
+    def hybrid_search(
+        self,
+        queries: Sequence[str],
+        query_vectors: Sequence[np.ndarray],
+        top_k: int = 10,
+        candidate_k: int = 5,
+        rrf_k: int = 60,
+    ) -> list[list[RetrievedChunk]]:
+        # in-memory counterpart of retrieve.asearch_hybrid_batch: candidate_k from
+        # the vector and BM25 rankings each, fused with RRF, ties go to vector rank
+        all_vector_scores = self.vector_scores(np.vstack(query_vectors))
+        results = []
+        for query, vector_scores in zip(queries, all_vector_scores, strict=True):
+            fused: dict[int, float] = {}
+            vector_rank: dict[int, int] = {}
+            for rank, i in enumerate(top_indices(vector_scores, candidate_k), start=1):
+                fused[i] = fused.get(i, 0.0) + 1.0 / (rrf_k + rank)
+                vector_rank[i] = rank
+            bm25_ranked = top_indices(self.bm25_scores(query), candidate_k, positive_only=True)
+            for rank, i in enumerate(bm25_ranked, start=1):
+                fused[i] = fused.get(i, 0.0) + 1.0 / (rrf_k + rank)
+
+            ranked = sorted(fused, key=lambda i: (-fused[i], vector_rank.get(i, candidate_k + 1)))
+            results.append([self.hit(i, fused[i]) for i in ranked[:top_k]])
+        return results
+
+
+def top_indices(scores: np.ndarray, k: int, positive_only: bool = False) -> list[int]:
+    # indices of the k highest scores, best first
+    if k <= 0:
+        return []
+    if positive_only:
+        candidates = np.flatnonzero(scores > 0)
+    else:
+        candidates = np.arange(len(scores))
+    if len(candidates) > k:
+        candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+    return candidates[np.argsort(-scores[candidates], kind="stable")].tolist()
+
+
+class PaperChunkCache:
+    """Process-wide LRU of PaperChunkMatrix entries, bounded by total bytes and TTL."""
+
+    def __init__(self, max_bytes: int, ttl_seconds: float):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[str, PaperChunkMatrix] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _load(self, paper_id: str) -> Optional[PaperChunkMatrix]:
+        with Session(engine) as session:
+            title = session.exec(select(Paper.title).where(Paper.id == paper_id)).first()
+            if title is None:
+                return None
+            rows = session.exec(
+                select(
+                    PaperChunk.id,
+                    PaperChunk.chunk_index,
+                    PaperChunk.text,
+                    PaperChunk.embedding,
+                )
+                .where(PaperChunk.paper_id == paper_id)
+                .order_by(col(PaperChunk.chunk_index))
+            ).all()
+        if not rows:
+            return None
+        return PaperChunkMatrix(paper_id, title, rows, self.ttl_seconds)
+
+    def _drop(self, paper_id: str):
+        # caller holds the lock
+        entry = self._entries.pop(paper_id, None)
+        if entry is not None:
+            self._bytes -= entry.nbytes
+
+    def _get_cached(self, paper_id: str) -> Optional[PaperChunkMatrix]:
+        with self._lock:
+            entry = self._entries.get(paper_id)
+            if entry is not None and entry.expires_at > time.time():
+                self._entries.move_to_end(paper_id)
+                self.hits += 1
+                return entry
+            self._drop(paper_id)
+            self.misses += 1
+        return None
+
+    def get(self, paper_id: str) -> Optional[PaperChunkMatrix]:
+        if not paper_id:
+            return None
+        entry = self._get_cached(paper_id)
+        if entry is not None:
+            return entry
+        return self._load_and_store(paper_id)
+
+    async def aget(self, paper_id: str) -> Optional[PaperChunkMatrix]:
+        # hits are served inline; a miss loads the paper in a worker thread
+        # so the event loop is not blocked by the sync session
+        if not paper_id:
+            return None
+        entry = self._get_cached(paper_id)
+        if entry is not None:
+            return entry
+        return await asyncio.to_thread(self._load_and_store, paper_id)
+
+    def _load_and_store(self, paper_id: str) -> Optional[PaperChunkMatrix]:
+        entry = self._load(paper_id)
+        if entry is None:
+            return None
+        if entry.nbytes > self.max_bytes:
+            return entry
+
+        with self._lock:
+            self._drop(paper_id)
+            self._entries[paper_id] = entry
+            self._bytes += entry.nbytes
+            while self._bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self.evictions += 1
+        return entry
+
+    def warm(self, paper_id: str):
+        try:
+            entry = self.get(paper_id)
+            if entry is not None:
+                print(f"Paper chunk cache warmed for {paper_id}: {len(entry)} chunks")
+        except Exception as e:
+            print(f"Failed to warm paper chunk cache for {paper_id}: {e}")
+
+    def invalidate(self, paper_id: str):
+        # call when chunks of the paper are (re)ingested
+        with self._lock:
+            self._drop(paper_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "papers": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+_paper_chunk_cache: Optional[PaperChunkCache] = None
+
+
+def get_paper_chunk_cache() -> PaperChunkCache:
+    global _paper_chunk_cache
+    if _paper_chunk_cache is None:
+        _paper_chunk_cache = PaperChunkCache(
+            max_bytes=int(PAPER_CACHE_MAX_MB * 1024 * 1024),
+            ttl_seconds=PAPER_CACHE_TTL_SECONDS,
+        )
+    return _paper_chunk_cache
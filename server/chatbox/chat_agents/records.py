@@ -0,0 +1,68 @@
+from sqlmodel import col
+
+from models.paper import PaperChunk, Paper
+
+
+class RetrievedChunk:
+    """
+    Lightweight retrieval result: only the columns the graph nodes use.
+    Embedding, chunk metadata and the Paper row are not selected for ranking.
+    """
+
+    __slots__ = ("chunk_id", "paper_id", "chunk_index", "text", "title", "score")
+
+    def __init__(
+        self,
+        chunk_id: int,
+        paper_id: str,
+        chunk_index: int,
+        text: str,
+        title: str,
+        score: float = 0.0,
+    ):
+        self.chunk_id = chunk_id
+        self.paper_id = paper_id
+        self.chunk_index = chunk_index
+        self.text = text
+        self.title = title
+        self.score = score
+
+    @classmethod
+    def from_row(cls, row, score: float = 0.0) -> "RetrievedChunk":
+        # row: any result with chunk_id, paper_id, chunk_index, text, title attributes
+        return cls(
+            row.chunk_id,
+            row.paper_id,
+            row.chunk_index,
+            row.text,
+            row.title,
+            float(getattr(row, "score", score) or 0.0),
+        )
+
+    @classmethod
+    def from_record(cls, record, score: float = 0.0) -> "RetrievedChunk":
+        # asyncpg Record: mapping access only, numeric scores come back as Decimal
+        return cls(
+            record["chunk_id"],
+            record["paper_id"],
+            record["chunk_index"],
+            record["text"],
+            record["title"],
+            float(record.get("score", score) or 0.0),
+        )
+
+    def __repr__(self) -> str:
+        return (
+            f"RetrievedChunk(chunk_id={self.chunk_id}, paper_id={self.paper_id!r}, "
+            f"chunk_index={self.chunk_index}, score={self.score:.4f})"
+        )
+
+
+# projected columns for ranking queries; use with select(*RETRIEVED_CHUNK_COLUMNS).join(Paper)
+RETRIEVED_CHUNK_COLUMNS = (
+    col(PaperChunk.id).label("chunk_id"),
+    PaperChunk.paper_id,
+    PaperChunk.chunk_index,
+    PaperChunk.text,
+    Paper.title,
+)
@@ -1,138 +1,454 @@
-import re
-import stat
 from sqlmodel import Session, select, col
+from sqlalchemy import text
 from typing import List, Optional
-from rank_bm25 import BM25Okapi
 
-from database import engine
+import database
+from database import engine, to_asyncpg_query
 from models.paper import PaperChunk, Paper
-from config import get_embed_model
+from managers.bm25_index_manager import BM25IndexManager, tokenize_for_bm25
+from managers.vector_index_manager import VectorIndexManager
+from chatbox.core.config import LEXICAL_SEARCH_BACKEND
+from chatbox.utils.embedding_cache import aget_query_embedding, aget_query_embeddings
+from chatbox.chat_agents.paper_chunk_cache import get_paper_chunk_cache, top_indices
+from chatbox.chat_agents.records import RetrievedChunk, RETRIEVED_CHUNK_COLUMNS
 
-# get Embedding model
-embed_model = get_embed_model()
+# Ranking queries select only the RetrievedChunk columns (id, paper_id, chunk_index,
+# text, title) and return RetrievedChunk records; embeddings and Paper rows are never
+# loaded. The graph nodes use the async searches (a* prefix) on database.async_db_pool.
+# The only sync searches left are search_lexical and its two backends, for
+# tests/lexical_backend_benchmark.py.
 
-def search_base(query:str, paper_id: Optional[str] = None, top_k: int = 3):
-    #if paper_id is provided, only search within the paper, otherwise search all papers (later: of same topic? category? etc.)
 
-    # 1.query -> vector
-    query_vector = embed_model.get_query_embedding(query)
+def _print_results(label: str, results: List[RetrievedChunk]):
+    print(f"\n find {len(results)} {label} chunks:\n")
+    for result in results:
+        print(f"[Paper]: {result.title}")
+        print(f"[Content]: \n{result.text[:50]}...")
+        print("-" * 50)
 
-    with Session(engine) as session:
-        # 2.query by vector, order by distance
-        statement =(
-            select(PaperChunk, Paper)
-            .join(Paper)
-            .order_by(PaperChunk.embedding.cosine_distance(query_vector)) #type:ignore
-            .limit(top_k)
-        )
-        if paper_id:
-            statement = statement.where(PaperChunk.paper_id == paper_id)
-
-        results = session.exec(statement).all()
-        print(f"\n find {len(results)} chunks:\n")
-        
-        for i, (chunk, paper) in enumerate(results):
-            print(f"[Metadata]: {chunk.metadata_json}")
-            print(f"[Content]: \n{chunk.text[:50]}...") 
-            print("-" * 50)
-            
+
+def _load_records(session: Session, ranked: list[tuple[int, float]]) -> List[RetrievedChunk]:
+    # fetch projected rows for ranked (chunk_id, score) pairs, keeping the ranking order
+    if not ranked:
+        return []
+    statement = (
+        select(*RETRIEVED_CHUNK_COLUMNS)
+        .join(Paper)
+        .where(col(PaperChunk.id).in_([chunk_id for chunk_id, _ in ranked]))
+    )
+    rows = {row.chunk_id: row for row in session.exec(statement).all()}
+    return [
+        RetrievedChunk.from_row(rows[chunk_id], score)
+        for chunk_id, score in ranked
+        if chunk_id in rows
+    ]
+
+
+def search_bm25(
+    query: str,
+    paper_id: Optional[str] = None,
+    top_k: int = 5,
+    use_paper_cache: bool = True,
+) -> List[RetrievedChunk]:
+    # lexical search on the persistent inverted index (see managers/bm25_index_manager.py);
+    # only postings of the query terms are scored, so every indexed chunk is a candidate.
+    # use_paper_cache=False always queries the index (backend comparisons).
+    entry = get_paper_chunk_cache().get(paper_id) if paper_id and use_paper_cache else None
+    if entry is not None:
+        scores = entry.bm25_scores(query)
+        results = [
+            entry.hit(i, float(scores[i]))
+            for i in top_indices(scores, top_k, positive_only=True)
+        ]
+        _print_results("BM25 (paper cache)", results)
         return results
 
+    with Session(engine) as session:
+        ranked = BM25IndexManager.search(session, query, paper_id=paper_id, top_k=top_k)
+        results = _load_records(session, ranked)
+
+    _print_results("BM25", results)
+    return results
 
-def _tokenize_for_bm25(text: str) -> list[str]:
-    # English-only tokenization for BM25.
-    return re.findall(r"[A-Za-z0-9_]+", (text or "").lower())
 
+# OR of the query lexemes, so long questions/excerpts match like BM25 does instead of
+# requiring every word. ts_rank_cd normalization 1 divides by 1 + log(chunk length).
+_FULLTEXT_SEARCH_SQL = """
+SELECT pc.id AS chunk_id, pc.paper_id, pc.chunk_index, pc.text, p.title,
+       ts_rank_cd(pc.text_search, q.query, 1) AS score
+FROM paperchunk AS pc
+JOIN paper AS p ON p.id = pc.paper_id
+CROSS JOIN to_tsquery('english', :tsquery) AS q(query)
+WHERE pc.text_search @@ q.query {paper_filter}
+ORDER BY score DESC
+LIMIT :top_k
+"""
 
-def search_bm25(
+
+def _build_or_tsquery(query: str) -> str:
+    # tokens are [A-Za-z0-9_]+, so they are safe to splice into to_tsquery syntax
+    terms = list(dict.fromkeys(tokenize_for_bm25(query)))
+    return " | ".join(terms)
+
+
+def _fulltext_query(query: str, paper_id: Optional[str], top_k: int) -> Optional[tuple[str, dict]]:
+    tsquery = _build_or_tsquery(query)
+    if not tsquery:
+        return None
+
+    params: dict = {"tsquery": tsquery, "top_k": top_k}
+    paper_filter = ""
+    if paper_id:
+        paper_filter = "AND pc.paper_id = :paper_id"
+        params["paper_id"] = paper_id
+    return _FULLTEXT_SEARCH_SQL.format(paper_filter=paper_filter), params
+
+
+def search_fulltext(
     query: str,
     paper_id: Optional[str] = None,
     top_k: int = 5,
-    candidate_k: int = 1000,
-):
+) -> List[RetrievedChunk]:
+    # Postgres full-text search on the generated tsvector column (GIN index).
+    # the database ranks and limits, only top_k rows come back.
+    fulltext_query = _fulltext_query(query, paper_id, top_k)
+    if fulltext_query is None:
+        return []
+
     with Session(engine) as session:
-        statement = select(PaperChunk, Paper).join(Paper)
-        if paper_id:
-            statement = statement.where(PaperChunk.paper_id == paper_id)
-        candidates = session.exec(statement.limit(candidate_k)).all()
+        rows = session.execute(text(fulltext_query[0]), fulltext_query[1]).all()
+    results = [RetrievedChunk.from_row(row) for row in rows]
+
+    _print_results("full-text", results)
+    return results
+
+
+def search_lexical(
+    query: str,
+    paper_id: Optional[str] = None,
+    top_k: int = 5,
+    backend: Optional[str] = None,
+    use_paper_cache: bool = True,
+) -> List[RetrievedChunk]:
+    # dispatch to the configured lexical backend, so "fts" and "bm25" can be compared
+    backend = (backend or LEXICAL_SEARCH_BACKEND).strip().lower()
+    if backend == "bm25":
+        return search_bm25(query, paper_id=paper_id, top_k=top_k, use_paper_cache=use_paper_cache)
+    if backend == "fts":
+        return search_fulltext(query, paper_id=paper_id, top_k=top_k)
+    raise ValueError(f"Unknown lexical search backend: {backend}")
+
+
+# Vector and full-text candidates are ranked in CTEs and fused with reciprocal-rank
+# fusion inside Postgres. Queries are unnested and searched through LATERAL joins, so
+# N sub-queries cost one round trip; rows come back tagged with their query_index.
+_HYBRID_SEARCH_SQL = """
+WITH queries AS (
+    SELECT q.query_index,
+           CAST(q.embedding AS vector) AS embedding,
+           to_tsquery('english', q.tsquery) AS tsquery
+    FROM unnest(CAST(:embeddings AS text[]), CAST(:tsqueries AS text[]))
+        WITH ORDINALITY AS q(embedding, tsquery, query_index)
+),
+vector_ranked AS (
+    SELECT queries.query_index, v.chunk_id,
+           ROW_NUMBER() OVER (PARTITION BY queries.query_index ORDER BY v.distance) AS rank
+    FROM queries
+    CROSS JOIN LATERAL (
+        SELECT pc.id AS chunk_id, pc.embedding <=> queries.embedding AS distance
+        FROM paperchunk AS pc
+        WHERE TRUE {paper_filter}
+        ORDER BY distance
+        LIMIT :candidate_k
+    ) AS v
+),
+lexical_ranked AS (
+    SELECT queries.query_index, l.chunk_id,
+           ROW_NUMBER() OVER (PARTITION BY queries.query_index ORDER BY l.score DESC) AS rank
+    FROM queries
+    CROSS JOIN LATERAL (
+        SELECT pc.id AS chunk_id, ts_rank_cd(pc.text_search, queries.tsquery, 1) AS score
+        FROM paperchunk AS pc
+        WHERE pc.text_search @@ queries.tsquery {paper_filter}
+        ORDER BY score DESC
+        LIMIT :candidate_k
+    ) AS l
+),
+fused AS (
+    SELECT COALESCE(v.query_index, l.query_index) AS query_index,
+           COALESCE(v.chunk_id, l.chunk_id) AS chunk_id,
+           v.rank AS vector_rank,
+           COALESCE(1.0 / (:rrf_k + v.rank), 0)
+               + COALESCE(1.0 / (:rrf_k + l.rank), 0) AS score
+    FROM vector_ranked AS v
+    FULL OUTER JOIN lexical_ranked AS l
+        ON l.query_index = v.query_index AND l.chunk_id = v.chunk_id
+),
+ranked AS (
+    SELECT fused.*,
+           ROW_NUMBER() OVER (
+               PARTITION BY query_index ORDER BY score DESC, vector_rank NULLS LAST
+           ) AS fused_rank
+    FROM fused
+)
+SELECT r.query_index, r.chunk_id, pc.paper_id, pc.chunk_index, pc.text, p.title, r.score
+FROM ranked AS r
+JOIN paperchunk AS pc ON pc.id = r.chunk_id
+JOIN paper AS p ON p.id = pc.paper_id
+WHERE r.fused_rank <= :top_k
+ORDER BY r.query_index, r.fused_rank
+"""
+
+
+def _to_vector_literal(vector) -> str:
+    # pgvector text input format, e.g. "[0.1,0.2]"
+    return "[" + ",".join(map(str, vector.tolist())) + "]"
+
+
+def _hybrid_query(
+    queries: List[str],
+    query_vectors: list,
+    paper_id: Optional[str],
+    top_k: int,
+    candidate_k: int,
+    rrf_k: int,
+) -> tuple[str, dict]:
+    params: dict = {
+        "embeddings": [_to_vector_literal(vector) for vector in query_vectors],
+        "tsqueries": [_build_or_tsquery(query) for query in queries],
+        "candidate_k": candidate_k,
+        "rrf_k": rrf_k,
+        "top_k": top_k,
+    }
+    paper_filter = ""
+    if paper_id:
+        paper_filter = "AND pc.paper_id = :paper_id"
+        params["paper_id"] = paper_id
+    return _HYBRID_SEARCH_SQL.format(paper_filter=paper_filter), params
+
+
+# ---- async searches on the asyncpg pool ----
+
+# the vector travels as text and is cast in SQL, so asyncpg needs no pgvector codec
+_VECTOR_SEARCH_SQL = """
+SELECT pc.id AS chunk_id, pc.paper_id, pc.chunk_index, pc.text, p.title,
+       1 - (pc.embedding <=> CAST(CAST(:query_vector AS text) AS vector)) AS score
+FROM paperchunk AS pc
+JOIN paper AS p ON p.id = pc.paper_id
+WHERE TRUE {filters}
+ORDER BY pc.embedding <=> CAST(CAST(:query_vector AS text) AS vector)
+LIMIT :top_k
+"""
+
+_LOAD_RECORDS_SQL = """
+SELECT pc.id AS chunk_id, pc.paper_id, pc.chunk_index, pc.text, p.title
+FROM paperchunk AS pc
+JOIN paper AS p ON p.id = pc.paper_id
+WHERE pc.id = ANY(CAST(:chunk_ids AS integer[]))
+"""
+
+
+async def _avector_search(
+    query_vector,
+    top_k: int,
+    paper_id: Optional[str] = None,
+    opening_only: bool = False,
+) -> List[RetrievedChunk]:
+    params: dict = {"query_vector": _to_vector_literal(query_vector), "top_k": top_k}
+    filters = ""
+    if paper_id:
+        filters += " AND pc.paper_id = :paper_id"
+        params["paper_id"] = paper_id
+    if opening_only:
+        filters += " AND pc.chunk_index IN (0, 1)"
+
+    sql, args = to_asyncpg_query(_VECTOR_SEARCH_SQL.format(filters=filters), params)
+    async with database.acquire_async_db_connection() as conn:
+        async with conn.transaction():
+            # both filters are too selective for an ANN scan, see search_params_sql
+            await VectorIndexManager.aapply_search_params(conn, exact=bool(paper_id) or opening_only)
+            rows = await conn.fetch(sql, *args)
+    return [RetrievedChunk.from_record(row) for row in rows]
+
+
+async def asearch_base(query: str, paper_id: Optional[str] = None, top_k: int = 3) -> List[RetrievedChunk]:
+    query_vector = await aget_query_embedding(query)
+
+    entry = await get_paper_chunk_cache().aget(paper_id) if paper_id else None
+    if entry is not None:
+        scores = entry.vector_scores(query_vector)[0]
+        results = [entry.hit(i, float(scores[i])) for i in top_indices(scores, top_k)]
+        _print_results("vector (paper cache)", results)
+        return results
 
-    if not candidates:
+    results = await _avector_search(query_vector, top_k, paper_id=paper_id)
+    _print_results("vector", results)
+    return results
+
+
+async def asearch_bm25(
+    query: str,
+    paper_id: Optional[str] = None,
+    top_k: int = 5,
+) -> List[RetrievedChunk]:
+    entry = await get_paper_chunk_cache().aget(paper_id) if paper_id else None
+    if entry is not None:
+        scores = entry.bm25_scores(query)
+        results = [
+            entry.hit(i, float(scores[i]))
+            for i in top_indices(scores, top_k, positive_only=True)
+        ]
+        _print_results("BM25 (paper cache)", results)
+        return results
+
+    async with database.acquire_async_db_connection() as conn:
+        ranked = await BM25IndexManager.asearch(conn, query, paper_id=paper_id, top_k=top_k)
+        results = []
+        if ranked:
+            sql, args = to_asyncpg_query(
+                _LOAD_RECORDS_SQL, {"chunk_ids": [chunk_id for chunk_id, _ in ranked]}
+            )
+            rows = {row["chunk_id"]: row for row in await conn.fetch(sql, *args)}
+            results = [
+                RetrievedChunk.from_record(rows[chunk_id], score)
+                for chunk_id, score in ranked
+                if chunk_id in rows
+            ]
+
+    _print_results("BM25", results)
+    return results
+
+
+async def asearch_fulltext(
+    query: str,
+    paper_id: Optional[str] = None,
+    top_k: int = 5,
+) -> List[RetrievedChunk]:
+    fulltext_query = _fulltext_query(query, paper_id, top_k)
+    if fulltext_query is None:
         return []
 
-    tokenized_corpus = [_tokenize_for_bm25(chunk.text) for chunk, _ in candidates]
-    bm25 = BM25Okapi(tokenized_corpus)
-    query_tokens = _tokenize_for_bm25(query)
-    if not query_tokens:
+    sql, args = to_asyncpg_query(*fulltext_query)
+    async with database.acquire_async_db_connection() as conn:
+        rows = await conn.fetch(sql, *args)
+    results = [RetrievedChunk.from_record(row) for row in rows]
+
+    _print_results("full-text", results)
+    return results
+
+
+async def asearch_lexical(
+    query: str,
+    paper_id: Optional[str] = None,
+    top_k: int = 5,
+    backend: Optional[str] = None,
+) -> List[RetrievedChunk]:
+    backend = (backend or LEXICAL_SEARCH_BACKEND).strip().lower()
+    if backend == "bm25":
+        return await asearch_bm25(query, paper_id=paper_id, top_k=top_k)
+    if backend == "fts":
+        return await asearch_fulltext(query, paper_id=paper_id, top_k=top_k)
+    raise ValueError(f"Unknown lexical search backend: {backend}")
+
+
+async def asearch_hybrid_batch(
+    queries: List[str],
+    paper_id: Optional[str] = None,
+    top_k: int = 10,
+    candidate_k: int = 5,
+    rrf_k: int = 60,
+) -> List[List[RetrievedChunk]]:
+    if not queries:
         return []
 
-    scores = bm25.get_scores(query_tokens)
-    ranked_indices = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
-
-    results = []
-    for i in ranked_indices:
-        if len(results) >= top_k:
-            break
-        if scores[i] <= 0:
-            continue
-        results.append(candidates[i])
-
-    print(f"\n find {len(results)} BM25 chunks:\n")
-    for chunk, paper in results:
-        print(f"[Paper]: {paper.title}")
-        print(f"[Content]: \n{chunk.text[:50]}...")
-        print("-" * 50)
+    query_vectors = await aget_query_embeddings(queries)
+
+    entry = await get_paper_chunk_cache().aget(paper_id) if paper_id else None
+    if entry is not None:
+        results = entry.hybrid_search(
+            queries, query_vectors, top_k=top_k, candidate_k=candidate_k, rrf_k=rrf_k
+        )
+        print(f"\n find {sum(map(len, results))} hybrid chunks for {len(queries)} queries (paper cache)\n")
+        return results
 
+    sql, args = to_asyncpg_query(
+        *_hybrid_query(queries, query_vectors, paper_id, top_k, candidate_k, rrf_k)
+    )
+    async with database.acquire_async_db_connection() as conn:
+        async with conn.transaction():
+            await VectorIndexManager.aapply_search_params(conn, exact=bool(paper_id))
+            rows = await conn.fetch(sql, *args)
+
+    results: List[List[RetrievedChunk]] = [[] for _ in queries]
+    for row in rows:
+        results[row["query_index"] - 1].append(RetrievedChunk.from_record(row))
+
+    print(f"\n find {len(rows)} hybrid chunks for {len(queries)} queries\n")
     return results
 
 
-def search_opening_chunks_by_id(paper_id: str):
-    with Session(engine) as session:
-        statement = (
-            select(PaperChunk)
-            .where(PaperChunk.paper_id == paper_id)
-            .where(PaperChunk.chunk_index.in_([0,1])) #type:ignore
-            .order_by(col(PaperChunk.chunk_index))
+async def asearch_opening_chunks_by_id(paper_id: str) -> List[str]:
+    async with database.acquire_async_db_connection() as conn:
+        rows = await conn.fetch(
+            "SELECT text FROM paperchunk WHERE paper_id = $1 AND chunk_index IN (0, 1) "
+            "ORDER BY chunk_index",
+            paper_id,
         )
+    return [row["text"] for row in rows]
 
-        results = session.exec(statement).all()
-        return [result.text for result in results]
 
-def search_opening_chunks_by_query(query: str, top_k: int = 3):
-    query_vector = embed_model.get_query_embedding(query)
-    with Session(engine) as session:
-        statement = (
-            select(PaperChunk)
-            .where(PaperChunk.chunk_index.in_([0,1])) #type:ignore
-            .order_by(PaperChunk.embedding.cosine_distance(query_vector)) #type:ignore
-            .limit(top_k)
+async def aload_chunks(chunk_ids: List[int]) -> dict[int, RetrievedChunk]:
+    # chunks by id, for hydrating the chunk references kept in the graph state
+    if not chunk_ids:
+        return {}
+    sql, args = to_asyncpg_query(_LOAD_RECORDS_SQL, {"chunk_ids": list(dict.fromkeys(chunk_ids))})
+    async with database.acquire_async_db_connection() as conn:
+        rows = await conn.fetch(sql, *args)
+    return {row["chunk_id"]: RetrievedChunk.from_record(row) for row in rows}
+
+
+async def asearch_opening_chunks_by_query(query: str, top_k: int = 3) -> List[str]:
+    query_vector = await aget_query_embedding(query)
+    results = await _avector_search(query_vector, top_k, opening_only=True)
+    return [result.text for result in results]
+
+
+_CHUNK_SIMILARITY_SQL = """
+SELECT pc.id AS chunk_id,
+       1 - (pc.embedding <=> CAST(CAST(:query_vector AS text) AS vector)) AS similarity
+FROM paperchunk AS pc
+WHERE pc.id = ANY(CAST(:chunk_ids AS integer[])) AND pc.embedding IS NOT NULL
+"""
+
+
+async def achunk_similarities(
+    query: str,
+    chunk_ids: List[int],
+    paper_id: Optional[str] = None,
+) -> dict[int, float]:
+    # cosine similarity between the query and already retrieved chunks. The query
+    # embedding is normally a cache hit from retrieval; chunks of the cached paper are
+    # scored in memory, the rest in SQL so embeddings never leave the database.
+    if not chunk_ids:
+        return {}
+    query_vector = await aget_query_embedding(query)
+
+    similarities: dict[int, float] = {}
+    entry = await get_paper_chunk_cache().aget(paper_id) if paper_id else None
+    if entry is not None:
+        row_of = {chunk_id: i for i, chunk_id in enumerate(entry.chunk_ids)}
+        cached = [chunk_id for chunk_id in chunk_ids if chunk_id in row_of]
+        if cached:
+            scores = entry.vector_scores(query_vector)[0]
+            similarities.update((chunk_id, float(scores[row_of[chunk_id]])) for chunk_id in cached)
+
+    missing = [chunk_id for chunk_id in dict.fromkeys(chunk_ids) if chunk_id not in similarities]
+    if missing:
+        sql, args = to_asyncpg_query(
+            _CHUNK_SIMILARITY_SQL,
+            {"query_vector": _to_vector_literal(query_vector), "chunk_ids": missing},
         )
-        results = session.exec(statement).all()
-        return [result.text for result in results]
-
- 
-def search_by_excerpt_with_context(
-    excerpt: str, 
-    paper_id: Optional[str] = None, 
-    top_k: int = 2
-) -> List[str]:
-
-    query_vector = embed_model.get_query_embedding(excerpt)
-    
-    with Session(engine) as session:
-        if paper_id:
-            statement = (
-                select(PaperChunk)
-                .where(PaperChunk.paper_id == paper_id)
-                .order_by(PaperChunk.embedding.cosine_distance(query_vector))#type:ignore
-                .limit(top_k) 
-            )
-        else:
-            statement = (
-                select(PaperChunk)
-                .order_by(PaperChunk.embedding.cosine_distance(query_vector))#type:ignore
-                .limit(top_k) 
-            )
-        
-        results = session.exec(statement).all()
-        
-        return [result.text for result in results]
\ No newline at end of file
+        async with database.acquire_async_db_connection() as conn:
+            rows = await conn.fetch(sql, *args)
+        similarities.update((row["chunk_id"], float(row["similarity"])) for row in rows)
+    return similarities
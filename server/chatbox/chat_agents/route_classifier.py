@@ -0,0 +1,167 @@
+import re
+import threading
+from typing import Optional
+
+import numpy as np
+
+from chatbox.core.config import ROUTER_EMBEDDING_MARGIN, ROUTER_EMBEDDING_ROUTE
+from chatbox.utils.embedding_cache import aget_query_embedding, aget_query_embeddings
+
+# Local routing for route_question. Keyword rules mirror the router prompt; when they
+# are not decisive (and use_embedding is set), the question embedding is compared with
+# the centroids of a few example questions per route. None means "not confident", and
+# the LLM decides.
+
+# phrases, not single words: "other authors", "surveys" or "online" alone also occur in
+# questions about the paper. tests/route_agreement_check.py measures these rules
+# against labeled questions and the LLM router.
+_GLOBAL_PATTERNS = [
+    r"\bother (papers?|results?|works?|references?|resources?|approaches?|authors?)\b",
+    r"\brelated (papers?|results?|works?|topics?|literature)\b",
+    r"\bsimilar (papers?|results?|works?)\b",
+    r"\b(search|look) (online|on the web|the web|the internet)\b",
+    r"\bonline (resources?|references?|sources?|tutorials?|lectures?)\b",
+    r"\bweb search\b",
+    r"\b(in|from) the literature\b",
+    r"\bliterature (on|about|review)\b",
+    r"\bsurvey (papers?|articles?)\b",
+    r"\bfind (me )?(some |more )?(papers?|resources?|references?)\b",
+]
+
+_LOCAL_PATTERNS = [
+    r"\bthis (paper|article|section|chapter|proof|lemma|theorem|proposition|corollary|definition|excerpt)\b",
+    r"\bthe (paper|article)\b",
+    r"\bthe main (theorem|result|proof|idea|contribution)\b",
+    r"\b(lemma|theorem|proposition|corollary|definition|equation|section|remark) \(?\d",
+    r"\bthe authors?\b",
+    r"\b(used|defined|shown|proved|stated|introduced|assumed) here\b",
+    r"\b(equation|formula|inequality|estimate|lemma|theorem|argument|definition|step) above\b",
+    r"\bthe above (equation|formula|inequality|estimate|lemma|theorem|argument|definition|step)\b",
+]
+
+_GLOBAL_EXAMPLES = [
+    "Are there other papers that prove similar results?",
+    "Find related work on this topic.",
+    "What does the literature say about this problem?",
+    "Search online for an introduction to this concept.",
+    "Which recent papers extend this approach?",
+    "What is convergence in general?",
+]
+
+_LOCAL_EXAMPLES = [
+    "What is the main theorem of this paper?",
+    "Explain the proof of Lemma 3.",
+    "How is this definition used in the paper?",
+    "Why does the inequality in the second step hold?",
+    "What assumptions does the main result need?",
+    "Can you summarize section 2?",
+]
+
+_global_re = re.compile("|".join(_GLOBAL_PATTERNS), re.IGNORECASE)
+_local_re = re.compile("|".join(_LOCAL_PATTERNS), re.IGNORECASE)
+
+
+def _normalized(vector: np.ndarray) -> np.ndarray:
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class RouteClassifier:
+    """Keyword + embedding-centroid route classifier with decision counters."""
+
+    def __init__(self, margin: float, use_embedding: bool = True):
+        self.margin = margin
+        self.use_embedding = use_embedding
+        self._centroids: Optional[dict[str, np.ndarray]] = None
+        self._lock = threading.Lock()
+
+        self.rule_decisions = 0
+        self.embedding_decisions = 0
+        self.llm_fallbacks = 0
+
+    async def _get_centroids(self) -> dict[str, np.ndarray]:
+        # example embeddings go through the query embedding cache, so they are
+        # requested once per process (or never, with the disk tier)
+        if self._centroids is None:
+            vectors = await aget_query_embeddings(_GLOBAL_EXAMPLES + _LOCAL_EXAMPLES)
+            split = len(_GLOBAL_EXAMPLES)
+            self._centroids = {
+                "global_search": _normalized(np.mean(vectors[:split], axis=0)),
+                "retrieve": _normalized(np.mean(vectors[split:], axis=0)),
+            }
+        return self._centroids
+
+    @staticmethod
+    def classify_by_rules(question: str) -> Optional[str]:
+        is_global = bool(_global_re.search(question))
+        is_local = bool(_local_re.search(question))
+        if is_global and not is_local:
+            return "global_search"
+        if is_local and not is_global:
+            return "retrieve"
+        return None
+
+    async def classify_by_embedding(self, question: str) -> tuple[Optional[str], float]:
+        # returns (route or None, margin between the two centroid similarities)
+        centroids = await self._get_centroids()
+        query_vector = _normalized(await aget_query_embedding(question))
+        global_score = float(query_vector @ centroids["global_search"])
+        local_score = float(query_vector @ centroids["retrieve"])
+        margin = abs(global_score - local_score)
+        if margin < self.margin:
+            return None, margin
+        return ("global_search" if global_score > local_score else "retrieve"), margin
+
+    async def classify(self, question: str) -> Optional[str]:
+        route = self.classify_by_rules(question)
+        if route is not None:
+            self._count("rule_decisions")
+            print(f"Route by keyword rules: {route}")
+            return route
+        if not self.use_embedding:
+            return None
+
+        try:
+            route, margin = await self.classify_by_embedding(question)
+        except Exception as e:
+            print(f"Embedding route classifier failed: {e}")
+            route, margin = None, 0.0
+        if route is not None:
+            self._count("embedding_decisions")
+            print(f"Route by embedding similarity: {route} (margin {margin:.3f})")
+            return route
+
+        return None
+
+    def record_llm_fallback(self):
+        self._count("llm_fallbacks")
+        stats = self.stats()
+        print(
+            f"Route fallback to LLM: {stats['llm_fallbacks']}/{stats['total']} "
+            f"turns ({stats['fallback_rate']:.1%})"
+        )
+
+    def _count(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.rule_decisions + self.embedding_decisions + self.llm_fallbacks
+            return {
+                "rule_decisions": self.rule_decisions,
+                "embedding_decisions": self.embedding_decisions,
+                "llm_fallbacks": self.llm_fallbacks,
+                "total": total,
+                "fallback_rate": self.llm_fallbacks / total if total else 0.0,
+            }
+
+
+_route_classifier: Optional[RouteClassifier] = None
+
+
+def get_route_classifier() -> RouteClassifier:
+    global _route_classifier
+    if _route_classifier is None:
+        _route_classifier = RouteClassifier(margin=ROUTER_EMBEDDING_MARGIN, use_embedding=ROUTER_EMBEDDING_ROUTE)
+    return _route_classifier
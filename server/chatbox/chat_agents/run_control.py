@@ -0,0 +1,202 @@
+import asyncio
+import threading
+import time
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+from chatbox.core.config import RUN_DISCONNECT_POLL_SECONDS
+
+# Cancellable graph runs for /api/chat. The graph's event stream is consumed by a
+# task owned by AgentRun and handed to the SSE response through a queue, so a run
+# can be cancelled from outside the response: when the client disconnects, or when
+# a new message arrives on the same thread. Cancelling the task closes the event
+# stream, which cancels the graph run and its in-flight LLM requests. LangGraph
+# finishes pending checkpoint writes on exit, so the thread keeps its last
+# completed step and the next input starts a fresh run from there.
+
+_DONE = object()
+
+
+class AgentRun:
+    """One graph run of a thread, with what it streamed so far."""
+
+    def __init__(self, thread_id: str, events: AsyncIterator[dict]):
+        self.thread_id = thread_id
+        self.cancel_reason: Optional[str] = None
+        self.generate_started = False
+        # generate stream chunks, about one token each
+        self.answer_tokens = 0
+        self.context_tokens: Optional[int] = None
+        self._events: asyncio.Queue = asyncio.Queue()
+        self.task = asyncio.create_task(self._pump(events))
+
+    async def _pump(self, events: AsyncIterator[dict]):
+        try:
+            async for event in events:
+                self._observe(event)
+                self._events.put_nowait(event)
+        finally:
+            # close the stream now rather than at garbage collection
+            await events.aclose()  # type: ignore[attr-defined]
+            self._events.put_nowait(_DONE)
+
+    def _observe(self, event: dict):
+        if event.get("metadata", {}).get("langgraph_node") != "generate":
+            return
+        event_type = event["event"]
+        if event_type == "on_chain_start":
+            self.generate_started = True
+        elif event_type == "on_chat_model_stream":
+            chunk = event.get("data", {}).get("chunk")
+            if getattr(chunk, "content", None):
+                self.answer_tokens += 1
+        elif event_type == "on_chain_end" and event.get("name") == "generate":
+            output = event.get("data", {}).get("output")
+            if isinstance(output, dict):
+                self.context_tokens = (output.get("context_stats") or {}).get("used_tokens")
+
+    @property
+    def completed(self) -> bool:
+        return self.task.done() and not self.task.cancelled() and self.task.exception() is None
+
+    def cancel(self, reason: str):
+        if not self.task.done():
+            self.cancel_reason = reason
+            self.task.cancel()
+
+    async def wait(self):
+        await asyncio.wait([self.task])
+
+    async def stream(
+        self,
+        is_disconnected: Callable[[], Awaitable[bool]],
+        poll_seconds: float = RUN_DISCONNECT_POLL_SECONDS,
+        next_deadline: Optional[Callable[[], Optional[float]]] = None,
+    ) -> AsyncIterator[Optional[dict]]:
+        """
+        Yield the run's events. While no event arrives (retrieval, grading), the
+        client is polled every poll_seconds and the run is cancelled once it is gone.
+        With next_deadline (a time.monotonic() deadline or None), None is yielded when
+        the deadline passes without an event, so the caller can flush or send a
+        heartbeat. Errors of the run are raised here after its last event.
+        """
+        while True:
+            if not self._events.empty():
+                event = self._events.get_nowait()
+            else:
+                deadline = next_deadline() if next_deadline is not None else None
+                timeout = poll_seconds
+                if deadline is not None:
+                    timeout = min(timeout, deadline - time.monotonic())
+                    if timeout <= 0:
+                        yield None
+                        continue
+                try:
+                    event = await asyncio.wait_for(self._events.get(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    if deadline is not None and time.monotonic() >= deadline:
+                        yield None
+                    elif await is_disconnected():
+                        self.cancel("client_disconnected")
+                        return
+                    continue
+            if event is _DONE:
+                break
+            yield event
+
+        await self.wait()
+        if not self.task.cancelled() and self.task.exception() is not None:
+            raise self.task.exception()  # type: ignore[misc]
+
+
+class AgentRunManager:
+    """
+    Tracks the in-flight run of each thread and counts cancelled runs. Tokens saved
+    is an estimate: the average generate prompt (packed context) and answer of
+    completed runs, minus what the cancelled run already got through.
+    """
+
+    def __init__(self):
+        self._runs: dict[str, AgentRun] = {}
+        self._lock = threading.Lock()
+
+        self.started = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled: dict[str, int] = {}
+        self.tokens_saved = 0
+        self._answer_tokens_total = 0
+        self._context_tokens_total = 0
+        self._context_samples = 0
+
+    def start(self, thread_id: str, events: AsyncIterator[dict]) -> AgentRun:
+        run = AgentRun(thread_id, events)
+        with self._lock:
+            self._runs[thread_id] = run
+            self.started += 1
+        run.task.add_done_callback(lambda _: self._finish(run))
+        return run
+
+    def active(self, thread_id: str) -> Optional[AgentRun]:
+        run = self._runs.get(thread_id)
+        return run if run is not None and not run.task.done() else None
+
+    async def cancel_thread(self, thread_id: str, reason: str):
+        # cancel the thread's in-flight run and wait until it has stopped
+        run = self.active(thread_id)
+        if run is not None:
+            print(f"Cancelling run of thread {thread_id}: {reason}")
+            run.cancel(reason)
+            await run.wait()
+
+    def _finish(self, run: AgentRun):
+        with self._lock:
+            if self._runs.get(run.thread_id) is run:
+                self._runs.pop(run.thread_id)
+
+            if run.task.cancelled():
+                reason = run.cancel_reason or "server"
+                self.cancelled[reason] = self.cancelled.get(reason, 0) + 1
+                saved = self._estimate_saved(run)
+                self.tokens_saved += saved
+                print(
+                    f"Run of thread {run.thread_id} cancelled ({reason}) after "
+                    f"{run.answer_tokens} answer tokens, ~{saved} tokens saved"
+                )
+            elif run.task.exception() is not None:
+                self.failed += 1
+            else:
+                self.completed += 1
+                self._answer_tokens_total += run.answer_tokens
+                if run.context_tokens is not None:
+                    self._context_tokens_total += run.context_tokens
+                    self._context_samples += 1
+
+    def _estimate_saved(self, run: AgentRun) -> int:
+        # caller holds the lock
+        avg_answer = self._answer_tokens_total / self.completed if self.completed else 0
+        if not run.generate_started:
+            avg_context = self._context_tokens_total / self._context_samples if self._context_samples else 0
+            return int(avg_answer + avg_context)
+        return int(max(0, avg_answer - run.answer_tokens))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "active": sum(1 for run in self._runs.values() if not run.task.done()),
+                "started": self.started,
+                "completed": self.completed,
+                "failed": self.failed,
+                "cancelled": dict(self.cancelled),
+                "estimated_tokens_saved": self.tokens_saved,
+                "avg_answer_tokens": self._answer_tokens_total / self.completed if self.completed else 0.0,
+            }
+
+
+_agent_run_manager: Optional[AgentRunManager] = None
+
+
+def get_agent_run_manager() -> AgentRunManager:
+    global _agent_run_manager
+    if _agent_run_manager is None:
+        _agent_run_manager = AgentRunManager()
+    return _agent_run_manager
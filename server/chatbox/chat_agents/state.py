@@ -1,7 +1,24 @@
-from typing import Optional, TypedDict, List, Annotated
+from typing import Optional, TypedDict, List, Dict, Annotated
 from langchain_core.messages import BaseMessage
 from langgraph.graph.message import add_messages
 
+
+class DocumentRef(TypedDict, total=False):
+    """
+    Compact pointer to a retrieved document, kept in the state (and so in every
+    checkpoint) instead of its text; see document_refs.ahydrate_documents.
+    External results keep their text, since nothing can reload them.
+    """
+    source: str  # local_db, global_db_chunk, semantic_scholar or tavily
+    chunk_id: int  # database chunks
+    score: float  # retrieval score
+    similarity: float  # question similarity from the grading prefilter
+    index: int  # external results: position in the search response
+    title: str  # external results: the result itself, which cannot be reloaded
+    text: str
+    url: str
+
+
 class _AgentStateRequired(TypedDict):
     original_question: str
     current_question: str
@@ -9,7 +26,7 @@ class _AgentStateRequired(TypedDict):
     paper_id: str
     paper_topic: str
     
-    documents: List[str]
+    documents: List[DocumentRef]
     answer: str
     search_count: int
     source: str
@@ -19,9 +36,12 @@ class _AgentStateRequired(TypedDict):
 
 
 class AgentState(_AgentStateRequired, total=False):
+    route: str
     selected_tools: List[str]
     retrieval_reason: str
     retrieval_confidence: float
-    semantic_docs: List[str]
-    tavily_docs: List[str]
-    db_docs: List[str]
\ No newline at end of file
+    semantic_docs: List[DocumentRef]
+    tavily_docs: List[DocumentRef]
+    db_docs: List[DocumentRef]
+    grading_stats: Dict[str, int]
+    context_stats: Dict[str, int]
\ No newline at end of file
@@ -0,0 +1,261 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional
+
+import httpx
+
+from chatbox.core.config import (
+    TOOL_DEADLINES_SECONDS,
+    TOOL_HEDGE_AFTER_SECONDS,
+    TOOL_HEDGE_MIN_SAMPLES,
+    TOOL_BREAKER_WINDOW,
+    TOOL_BREAKER_MIN_CALLS,
+    TOOL_BREAKER_FAILURE_RATE,
+    TOOL_BREAKER_COOLDOWN_SECONDS,
+)
+
+# Latency guard for the global-search tools (semantic_scholar, tavily, db_chunk).
+# grade_documents joins on all three, so one slow tool holds the whole turn. Each call
+# gets a deadline, a hedged second attempt once it runs longer than the tool's recent
+# p95, and a circuit breaker that skips a tool whose recent calls mostly failed or
+# timed out. A tool that misses its deadline contributes no documents to the turn.
+# 4xx responses are never hedged: a retry gets the same answer, and a 429 opens the
+# breaker right away so the tool backs off for the cooldown.
+
+
+def _client_error_status(exc: BaseException) -> Optional[int]:
+    if isinstance(exc, httpx.HTTPStatusError) and 400 <= exc.response.status_code < 500:
+        return exc.response.status_code
+    return None
+
+
+def _percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+class ToolCircuit:
+    """Rolling latency window and circuit breaker for one tool."""
+
+    def __init__(self, name: str, window: int):
+        self.name = name
+        # (latency seconds, ok) of the most recent calls
+        self.calls: deque[tuple[float, bool]] = deque(maxlen=window)
+        self.state = "closed"
+        self.opened_at = 0.0
+        # half_open admits a single probe call; the others are skipped until it reports
+        self.probe_in_flight = False
+        self.skipped = 0
+        self.hedges = 0
+        self.deadline_misses = 0
+
+    def percentiles(self, ok_only: bool = False) -> tuple[float, float]:
+        # failed and timed-out calls count with their elapsed time unless ok_only
+        latencies = sorted(latency for latency, ok in self.calls if ok or not ok_only)
+        return _percentile(latencies, 0.5), _percentile(latencies, 0.95)
+
+    def failure_rate(self) -> float:
+        if not self.calls:
+            return 0.0
+        return sum(1 for _, ok in self.calls if not ok) / len(self.calls)
+
+
+class ToolGuard:
+
+    def __init__(
+        self,
+        deadlines: dict[str, float],
+        hedge_after: float,
+        hedge_min_samples: int,
+        window: int,
+        min_calls: int,
+        failure_rate: float,
+        cooldown_seconds: float,
+    ):
+        self.deadlines = deadlines
+        self.hedge_after = hedge_after
+        self.hedge_min_samples = hedge_min_samples
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.cooldown_seconds = cooldown_seconds
+        self._circuits: dict[str, ToolCircuit] = {}
+        self._lock = threading.Lock()
+
+    def _circuit(self, name: str) -> ToolCircuit:
+        # caller holds the lock
+        if name not in self._circuits:
+            self._circuits[name] = ToolCircuit(name, self.window)
+        return self._circuits[name]
+
+    def _allow(self, name: str) -> tuple[bool, bool]:
+        # (call allowed, call is the half-open probe)
+        with self._lock:
+            circuit = self._circuit(name)
+            if circuit.state == "open":
+                if time.monotonic() - circuit.opened_at < self.cooldown_seconds:
+                    circuit.skipped += 1
+                    return False, False
+                # cooldown over: one probe call decides whether the circuit closes
+                circuit.state = "half_open"
+            if circuit.state == "half_open":
+                if circuit.probe_in_flight:
+                    circuit.skipped += 1
+                    return False, False
+                circuit.probe_in_flight = True
+                return True, True
+            return True, False
+
+    def _release_probe(self, name: str):
+        # the probe ended without a result (cancelled): let the next call probe
+        with self._lock:
+            self._circuit(name).probe_in_flight = False
+
+    def _record(self, name: str, latency: float, ok: bool, probe: bool = False, rate_limited: bool = False):
+        with self._lock:
+            circuit = self._circuit(name)
+            circuit.calls.append((latency, ok))
+            if probe:
+                circuit.probe_in_flight = False
+            if rate_limited:
+                if circuit.state != "open":
+                    print(f"Circuit breaker opened for {name}: rate limited")
+                circuit.state = "open"
+                circuit.opened_at = time.monotonic()
+            elif circuit.state == "half_open" and probe:
+                if ok:
+                    circuit.state = "closed"
+                    circuit.calls.clear()
+                else:
+                    circuit.state = "open"
+                    circuit.opened_at = time.monotonic()
+            elif (
+                circuit.state == "closed"
+                and len(circuit.calls) >= self.min_calls
+                and circuit.failure_rate() >= self.failure_rate
+            ):
+                circuit.state = "open"
+                circuit.opened_at = time.monotonic()
+                print(f"Circuit breaker opened for {name}: failure rate {circuit.failure_rate():.0%}")
+
+    def _hedge_delay(self, name: str, deadline: float) -> Optional[float]:
+        # hedge at the recent p95 once there are enough samples, before that at the
+        # configured delay (0: no hedge until then); no hedge if it could not finish
+        # before the deadline
+        with self._lock:
+            circuit = self._circuit(name)
+            ok_calls = sum(1 for _, ok in circuit.calls if ok)
+            if ok_calls >= self.hedge_min_samples:
+                delay = circuit.percentiles(ok_only=True)[1]
+            else:
+                delay = self.hedge_after
+        if delay <= 0 or delay >= deadline:
+            return None
+        return delay
+
+    @staticmethod
+    async def _first_success(name: str, tasks: list[asyncio.Task], timeout: float) -> tuple[str, list]:
+        # ("ok", result) for the first attempt that succeeds, ("failed", []) when every
+        # attempt failed, ("timeout", []) when attempts are still running at the timeout,
+        # ("rate_limited", []) / ("rejected", []) as soon as one gets a 429 / other 4xx
+        end = time.perf_counter() + timeout
+        pending = {task for task in tasks if not task.done()}
+        while pending:
+            remaining = end - time.perf_counter()
+            if remaining <= 0:
+                return "timeout", []
+            done, pending = await asyncio.wait(
+                pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if task.exception() is None:
+                    return "ok", task.result()
+                print(f"{name} attempt failed: {task.exception()}")
+                status_code = _client_error_status(task.exception())
+                if status_code == 429:
+                    return "rate_limited", []
+                if status_code is not None:
+                    return "rejected", []
+        return "failed", []
+
+    async def run(self, name: str, call: Callable[[], Awaitable[list]]) -> list:
+        """
+        Run call() under the tool's deadline with one hedged retry. Errors,
+        deadline misses and open circuits return [] so the node can finish
+        with partial results.
+        """
+        allowed, probe = self._allow(name)
+        if not allowed:
+            print(f"Skip {name}: circuit open or probe in flight")
+            return []
+
+        deadline = self.deadlines.get(name, max(self.deadlines.values(), default=5.0))
+        hedge_delay = self._hedge_delay(name, deadline)
+        start = time.perf_counter()
+        tasks = [asyncio.create_task(call())]
+        recorded = False
+        try:
+            status, result = await self._first_success(name, tasks, hedge_delay or deadline)
+            if status in ("timeout", "failed") and hedge_delay is not None:
+                # first attempt is slow (or already failed): race a second one
+                with self._lock:
+                    self._circuit(name).hedges += 1
+                tasks.append(asyncio.create_task(call()))
+                remaining = deadline - (time.perf_counter() - start)
+                status, result = await self._first_success(name, tasks, remaining)
+
+            elapsed = time.perf_counter() - start
+            self._record(name, elapsed, status == "ok", probe, rate_limited=status == "rate_limited")
+            recorded = True
+            if status == "timeout":
+                with self._lock:
+                    self._circuit(name).deadline_misses += 1
+                print(f"{name} missed its {deadline:.1f}s deadline, continuing without it")
+            return result
+        finally:
+            if probe and not recorded:
+                self._release_probe(name)
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    task.exception()  # mark as retrieved, errors were logged above
+
+    def stats(self) -> dict:
+        with self._lock:
+            result = {}
+            for name, circuit in self._circuits.items():
+                p50, p95 = circuit.percentiles()
+                result[name] = {
+                    "state": circuit.state,
+                    "calls": len(circuit.calls),
+                    "failure_rate": circuit.failure_rate(),
+                    "p50_ms": p50 * 1000,
+                    "p95_ms": p95 * 1000,
+                    "hedges": circuit.hedges,
+                    "deadline_misses": circuit.deadline_misses,
+                    "skipped": circuit.skipped,
+                    "deadline_s": self.deadlines.get(name),
+                }
+            return result
+
+
+_tool_guard: Optional[ToolGuard] = None
+
+
+def get_tool_guard() -> ToolGuard:
+    global _tool_guard
+    if _tool_guard is None:
+        _tool_guard = ToolGuard(
+            deadlines=TOOL_DEADLINES_SECONDS,
+            hedge_after=TOOL_HEDGE_AFTER_SECONDS,
+            hedge_min_samples=TOOL_HEDGE_MIN_SAMPLES,
+            window=TOOL_BREAKER_WINDOW,
+            min_calls=TOOL_BREAKER_MIN_CALLS,
+            failure_rate=TOOL_BREAKER_FAILURE_RATE,
+            cooldown_seconds=TOOL_BREAKER_COOLDOWN_SECONDS,
+        )
+    return _tool_guard
@@ -53,7 +53,7 @@ def get_cors_origins() -> list[str]:
 import sys
 from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
-from database import DATABASE_URL
+from database import DATABASE_URL, ASYNC_DB_POOL_MAX_SIZE
 DB_CONNECTION_STRING = DATABASE_URL
 
 # ================== model configuration ==================
@@ -68,6 +68,163 @@ DEDUCE_MODEL_NAME = os.getenv("DEDUCE_MODEL_NAME", "o3-mini")
 # DEDUCE_MODEL_TEMPERATURE = float(os.getenv("DEDUCE_MODEL_TEMPERATURE", "0"))
 
 
+# ================== retrieval configuration ==================
+
+# Lexical half of hybrid retrieval:
+# "fts"  -> Postgres full-text search (paperchunk.text_search + GIN, ranked by ts_rank_cd)
+# "bm25" -> BM25 over the persistent inverted index (managers/bm25_index_manager.py)
+LEXICAL_SEARCH_BACKEND = os.getenv("LEXICAL_SEARCH_BACKEND", "fts").strip().lower()
+
+# Query embedding cache (chatbox/utils/embedding_cache.py): in-memory LRU bounded by size,
+# entries expire after the TTL. Set EMBEDDING_CACHE_DIR to enable the on-disk tier.
+EMBEDDING_CACHE_MAX_MB = float(os.getenv("EMBEDDING_CACHE_MAX_MB", "64"))
+EMBEDDING_CACHE_TTL_SECONDS = float(os.getenv("EMBEDDING_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "")
+
+# Per-paper chunk matrix cache (chatbox/chat_agents/paper_chunk_cache.py) for exact
+# in-memory search inside one paper. LRU bounded by size; entries also expire after
+# the TTL so re-ingestion done by another process is picked up.
+PAPER_CACHE_MAX_MB = float(os.getenv("PAPER_CACHE_MAX_MB", "256"))
+PAPER_CACHE_TTL_SECONDS = float(os.getenv("PAPER_CACHE_TTL_SECONDS", "1800"))
+
+# The graph state keeps chunk references, not chunk text (chatbox/chat_agents/document_refs.py);
+# texts of recently retrieved chunks stay in this LRU for grading and generate.
+CHUNK_TEXT_CACHE_MAX_ENTRIES = int(os.getenv("CHUNK_TEXT_CACHE_MAX_ENTRIES", "4096"))
+
+# With the fts backend the retrieve node searches all sub-queries (question, excerpts,
+# transformed question) in one batched SQL statement. With bm25 they run concurrently,
+# at most this many at a time; each holds one asyncpg pool connection.
+RETRIEVE_MAX_CONCURRENCY = max(1, int(os.getenv("RETRIEVE_MAX_CONCURRENCY", "4")))
+
+# Relevance grading in grade_documents:
+# "batch"  -> one structured call per document, sent concurrently (abatch)
+# "single" -> one structured call that grades all documents and returns a list of verdicts
+GRADING_MODE = os.getenv("GRADING_MODE", "batch").strip().lower()
+GRADING_MAX_CONCURRENCY = max(1, int(os.getenv("GRADING_MAX_CONCURRENCY", "8")))
+
+# Embedding prefilter before LLM grading: local chunks whose cosine similarity to the
+# question is >= ACCEPT are kept, < REJECT are dropped, only the band in between
+# (and external documents) goes to the grader. Tuned for text-embedding-3-small.
+GRADING_PREFILTER = os.getenv("GRADING_PREFILTER", "true").lower() == "true"
+GRADING_ACCEPT_SIMILARITY = float(os.getenv("GRADING_ACCEPT_SIMILARITY", "0.55"))
+GRADING_REJECT_SIMILARITY = float(os.getenv("GRADING_REJECT_SIMILARITY", "0.25"))
+
+# route_question fast path (chatbox/chat_agents/route_classifier.py): keyword rules, then
+# (with ROUTER_EMBEDDING_ROUTE) cosine similarity to example-question centroids; that
+# route is taken when the two centroid similarities differ by at least the margin,
+# otherwise the LLM router decides. The rules are on by default: on the labeled set of
+# python -m tests.route_agreement_check --rules-only they decide 19 of 26 questions,
+# all 19 matching the label. The embedding stage stays off until the full check
+# (embedding and LLM requests) shows it agrees on your data.
+ROUTER_FAST_PATH = os.getenv("ROUTER_FAST_PATH", "true").lower() == "true"
+ROUTER_EMBEDDING_ROUTE = os.getenv("ROUTER_EMBEDDING_ROUTE", "false").lower() == "true"
+ROUTER_EMBEDDING_MARGIN = float(os.getenv("ROUTER_EMBEDDING_MARGIN", "0.05"))
+
+# Context packing in generate (chatbox/chat_agents/context_packer.py): graded documents are
+# ranked, near duplicates (shingle containment >= threshold) dropped, and the rest packed
+# into the token budget; a document that does not fit is cut at a sentence boundary when
+# at least MIN_TRUNCATED tokens are left.
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.8"))
+CONTEXT_MIN_TRUNCATED_TOKENS = int(os.getenv("CONTEXT_MIN_TRUNCATED_TOKENS", "64"))
+
+
+# ================== external search configuration ==================
+
+# Semantic Scholar / Tavily endpoints (overridable, e.g. to point at a local stub server)
+SEMANTIC_SCHOLAR_SEARCH_URL = os.getenv(
+    "SEMANTIC_SCHOLAR_SEARCH_URL", "https://api.semanticscholar.org/graph/v1/paper/search"
+)
+TAVILY_SEARCH_URL = os.getenv("TAVILY_SEARCH_URL", "https://api.tavily.com/search")
+
+# Shared async HTTP client (chatbox/utils/http_client.py): keep-alive pool size and
+# concurrent requests allowed per host
+HTTP_TIMEOUT_SECONDS = float(os.getenv("HTTP_TIMEOUT_SECONDS", "5"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_PER_HOST = max(1, int(os.getenv("HTTP_MAX_PER_HOST", "4")))
+
+# Search response cache keyed by (endpoint, normalized query); set SEARCH_CACHE_DIR
+# to enable the on-disk tier
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "1024"))
+SEARCH_CACHE_TTL_SECONDS = float(os.getenv("SEARCH_CACHE_TTL_SECONDS", str(24 * 3600)))
+SEARCH_CACHE_DIR = os.getenv("SEARCH_CACHE_DIR", "")
+
+# Latency guard for the global-search tools (chatbox/chat_agents/tool_guard.py).
+# Each tool call has a deadline; past it the node continues without that tool.
+TOOL_DEADLINES_SECONDS = {
+    "semantic_scholar": float(os.getenv("TOOL_DEADLINE_SEMANTIC_SCHOLAR", "3")),
+    "tavily": float(os.getenv("TOOL_DEADLINE_TAVILY", "3")),
+    "db_chunk": float(os.getenv("TOOL_DEADLINE_DB_CHUNK", "2")),
+}
+# A second attempt is raced after the tool's recent p95 once TOOL_HEDGE_MIN_SAMPLES
+# successful calls are recorded; before that after this delay, 0 = no hedge until then.
+TOOL_HEDGE_AFTER_SECONDS = float(os.getenv("TOOL_HEDGE_AFTER_SECONDS", "0"))
+TOOL_HEDGE_MIN_SAMPLES = int(os.getenv("TOOL_HEDGE_MIN_SAMPLES", "20"))
+# The breaker opens when at least FAILURE_RATE of the last WINDOW calls (min MIN_CALLS)
+# failed or missed the deadline, and lets calls through again after the cooldown.
+TOOL_BREAKER_WINDOW = int(os.getenv("TOOL_BREAKER_WINDOW", "20"))
+TOOL_BREAKER_MIN_CALLS = int(os.getenv("TOOL_BREAKER_MIN_CALLS", "5"))
+TOOL_BREAKER_FAILURE_RATE = float(os.getenv("TOOL_BREAKER_FAILURE_RATE", "0.5"))
+TOOL_BREAKER_COOLDOWN_SECONDS = float(os.getenv("TOOL_BREAKER_COOLDOWN_SECONDS", "30"))
+
+
+# ================== checkpoints ==================
+
+# Checkpoint serializer (chatbox/chat_agents/checkpoint_serde.py): "compact" writes
+# messages and plain state as msgpack + zstd, "default" writes JsonPlusSerializer rows.
+# Both settings read either format.
+CHECKPOINT_SERIALIZER = os.getenv("CHECKPOINT_SERIALIZER", "compact").strip().lower()
+CHECKPOINT_ZSTD_LEVEL = int(os.getenv("CHECKPOINT_ZSTD_LEVEL", "3"))
+
+
+# Background job (chatbox/chat_agents/checkpoint_retention.py) that keeps the newest
+# KEEP_LAST LangGraph checkpoints per thread and deletes orphaned writes and blobs.
+# Threads with a checkpoint newer than MIN_IDLE are skipped. Each run handles at most
+# BATCH_THREADS threads and pauses THREAD_DELAY between them.
+CHECKPOINT_RETENTION_ENABLED = os.getenv("CHECKPOINT_RETENTION_ENABLED", "true").lower() == "true"
+CHECKPOINT_KEEP_LAST = int(os.getenv("CHECKPOINT_KEEP_LAST", "5"))
+CHECKPOINT_RETENTION_MIN_IDLE_SECONDS = float(os.getenv("CHECKPOINT_RETENTION_MIN_IDLE_SECONDS", "600"))
+CHECKPOINT_RETENTION_INTERVAL_SECONDS = float(os.getenv("CHECKPOINT_RETENTION_INTERVAL_SECONDS", "900"))
+CHECKPOINT_RETENTION_BATCH_THREADS = int(os.getenv("CHECKPOINT_RETENTION_BATCH_THREADS", "100"))
+CHECKPOINT_RETENTION_THREAD_DELAY_SECONDS = float(
+    os.getenv("CHECKPOINT_RETENTION_THREAD_DELAY_SECONDS", "0.1")
+)
+
+
+# ================== chat runs ==================
+
+# /api/chat runs the graph in a task (chatbox/chat_agents/run_control.py). While no
+# event is streamed, the client connection is checked every POLL seconds and the run
+# is cancelled once the client is gone.
+RUN_DISCONNECT_POLL_SECONDS = float(os.getenv("RUN_DISCONNECT_POLL_SECONDS", "1"))
+
+# Admission control (chatbox/chat_agents/admission.py): one run per thread, at most
+# MAX_CONCURRENT_RUNS runs overall. Requests that cannot start wait in a queue of
+# MAX_QUEUED (MAX_QUEUED_PER_THREAD per thread) for up to QUEUE_TIMEOUT; beyond that
+# they get 429. A run holds pool connections only while it retrieves: one with the fts
+# backend (one SQL statement for all sub-queries), up to two per concurrent sub-query
+# (vector + BM25) with bm25. Most of a run is LLM calls, so the default cap allows twice
+# the pool's worth of peaks, at least 8; a run that finds the pool busy waits up to
+# ASYNC_DB_ACQUIRE_TIMEOUT_SECONDS (database.py) for a connection.
+_RUN_PEAK_DB_CONNECTIONS = 2 * RETRIEVE_MAX_CONCURRENCY if LEXICAL_SEARCH_BACKEND == "bm25" else 1
+CHAT_MAX_CONCURRENT_RUNS = int(
+    os.getenv(
+        "CHAT_MAX_CONCURRENT_RUNS",
+        str(max(8, 2 * ASYNC_DB_POOL_MAX_SIZE // _RUN_PEAK_DB_CONNECTIONS)),
+    )
+)
+CHAT_MAX_QUEUED = int(os.getenv("CHAT_MAX_QUEUED", "32"))
+CHAT_MAX_QUEUED_PER_THREAD = int(os.getenv("CHAT_MAX_QUEUED_PER_THREAD", "2"))
+CHAT_QUEUE_TIMEOUT_SECONDS = float(os.getenv("CHAT_QUEUE_TIMEOUT_SECONDS", "60"))
+
+# SSE framing of the chat response (chatbox/utils/sse.py): answer tokens are sent as one
+# frame once the oldest is FLUSH_SECONDS old or FLUSH_BYTES are buffered; a heartbeat
+# comment goes out when nothing was written for HEARTBEAT_SECONDS.
+CHAT_STREAM_FLUSH_SECONDS = float(os.getenv("CHAT_STREAM_FLUSH_SECONDS", "0.03"))
+CHAT_STREAM_FLUSH_BYTES = int(os.getenv("CHAT_STREAM_FLUSH_BYTES", "512"))
+CHAT_STREAM_HEARTBEAT_SECONDS = float(os.getenv("CHAT_STREAM_HEARTBEAT_SECONDS", "15"))
+
+
 # ================== model instances (singleton) ==================
 _writing_model = None
 _deduce_model = None
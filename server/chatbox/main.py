@@ -7,9 +7,14 @@ from fastapi.middleware.cors import CORSMiddleware
 
 from chatbox.api.chat import chat_router
 from chatbox.api.files import files_router
+from chatbox.api.metrics import metrics_router
 
 from chatbox.core.config import settings, get_cors_origins
 from chatbox.chat_agents.graph import initialize_agent, cleanup_agent
+from chatbox.chat_agents.compaction import get_conversation_compactor
+from chatbox.chat_agents.context_packer import warm_tokenizer
+from chatbox.chat_agents.checkpoint_retention import start_checkpoint_retention, get_checkpoint_retention
+from chatbox.utils.http_client import close_http_client
 from database import DATABASE_URL, init_db_pool, close_db_pool, get_async_db_connection
 
 logger = logging.getLogger("uvicorn")
@@ -32,16 +37,22 @@ async def lifespan(app: FastAPI):
     #initialize agent
     try:
         await initialize_agent()
+        await warm_tokenizer()
         logger.info("Agent initialized")
+        start_checkpoint_retention()
     except Exception as e:
         logger.error(f"Error initializing agent: {e}")
         logger.error("Agent feature disabled")
     
 
     yield 
+    await get_checkpoint_retention().stop()
+    await get_conversation_compactor().drain()
     await cleanup_agent()
     logger.info("Agent cleaned up")
 
+    await close_http_client()
+
     await close_db_pool()
     logger.info("Database closed")
 
@@ -58,6 +69,7 @@ app.add_middleware(
 
 app.include_router(chat_router)
 app.include_router(files_router)
+app.include_router(metrics_router)
 
 if __name__ == "__main__":
     import uvicorn
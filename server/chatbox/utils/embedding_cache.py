@@ -0,0 +1,186 @@
+import hashlib
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Sequence
+
+import numpy as np
+
+from config import EMBEDDING_MODEL_NAME, get_embed_model
+from chatbox.core.config import (
+    EMBEDDING_CACHE_MAX_MB,
+    EMBEDDING_CACHE_TTL_SECONDS,
+    EMBEDDING_CACHE_DIR,
+)
+
+
+def normalize_query_text(text: str) -> str:
+    # same question typed twice should hit the same entry; case is kept
+    # because the embedding model is case sensitive.
+    text = unicodedata.normalize("NFKC", text or "")
+    return " ".join(text.split())
+
+
+class EmbeddingCache:
+    """
+    Process-wide LRU + TTL cache of query embeddings keyed by (model, normalized text).
+    Vectors are stored as float32 arrays; memory is bounded by max_bytes.
+    An optional on-disk tier (one .npy file per key) survives restarts.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        max_bytes: int,
+        ttl_seconds: float,
+        disk_dir: Optional[str] = None,
+    ):
+        self.model_name = model_name
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        if self.disk_dir:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+
+        self._entries: OrderedDict[str, tuple[np.ndarray, float]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _key(self, text: str) -> str:
+        raw = f"{self.model_name}\x00{normalize_query_text(text)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _disk_path(self, key: str) -> Path:
+        assert self.disk_dir is not None
+        return self.disk_dir / f"{key}.npy"
+
+    def _store(self, key: str, vector: np.ndarray, expires_at: float):
+        # caller holds the lock
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old[0].nbytes
+        self._entries[key] = (vector, expires_at)
+        self._bytes += vector.nbytes
+        while self._bytes > self.max_bytes and self._entries:
+            _, (evicted, _) = self._entries.popitem(last=False)
+            self._bytes -= evicted.nbytes
+            self.evictions += 1
+
+    def _load_from_disk(self, key: str) -> Optional[tuple[np.ndarray, float]]:
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            expires_at = path.stat().st_mtime + self.ttl_seconds
+            if expires_at <= time.time():
+                path.unlink(missing_ok=True)
+                return None
+            return np.load(path).astype(np.float32, copy=False), expires_at
+        except (OSError, ValueError):
+            return None
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        key = self._key(text)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                vector, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return vector
+                self._entries.pop(key)
+                self._bytes -= vector.nbytes
+
+        loaded = self._load_from_disk(key)
+        with self._lock:
+            if loaded is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._store(key, *loaded)
+            return loaded[0]
+
+    def put(self, text: str, vector: Sequence[float] | np.ndarray) -> np.ndarray:
+        key = self._key(text)
+        array = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            self._store(key, array, time.time() + self.ttl_seconds)
+
+        if self.disk_dir:
+            try:
+                # write then rename, so readers never see a partial file
+                tmp_path = self.disk_dir / f"{key}.{os.getpid()}.tmp.npy"
+                np.save(tmp_path, array)
+                os.replace(tmp_path, self._disk_path(key))
+            except OSError as e:
+                print(f"Failed to write embedding cache entry: {e}")
+        return array
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
+
+_embedding_cache: Optional[EmbeddingCache] = None
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    global _embedding_cache
+    if _embedding_cache is None:
+        _embedding_cache = EmbeddingCache(
+            model_name=EMBEDDING_MODEL_NAME,
+            max_bytes=int(EMBEDDING_CACHE_MAX_MB * 1024 * 1024),
+            ttl_seconds=EMBEDDING_CACHE_TTL_SECONDS,
+            disk_dir=EMBEDDING_CACHE_DIR or None,
+        )
+    return _embedding_cache
+
+
+async def aget_query_embedding(text: str) -> np.ndarray:
+    # async, so the OpenAI request does not block the event loop
+    cache = get_embedding_cache()
+    vector = cache.get(text)
+    if vector is None:
+        vector = cache.put(text, await get_embed_model().aget_query_embedding(text))
+    return vector
+
+
+async def aget_query_embeddings(texts: Sequence[str]) -> list[np.ndarray]:
+    # cached texts are served locally; all misses go out in one batch request
+    cache = get_embedding_cache()
+    vectors: list[Optional[np.ndarray]] = [cache.get(text) for text in texts]
+
+    missing: dict[str, list[int]] = {}
+    for i, vector in enumerate(vectors):
+        if vector is None:
+            missing.setdefault(normalize_query_text(texts[i]), []).append(i)
+
+    if missing:
+        missing_texts = list(missing.keys())
+        embeddings = await get_embed_model().aget_text_embedding_batch(missing_texts)
+        for text, embedding in zip(missing_texts, embeddings, strict=True):
+            array = cache.put(text, embedding)
+            for i in missing[text]:
+                vectors[i] = array
+
+    return [vector for vector in vectors if vector is not None]
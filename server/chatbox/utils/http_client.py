@@ -0,0 +1,207 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from chatbox.core.config import (
+    HTTP_TIMEOUT_SECONDS,
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_PER_HOST,
+    SEARCH_CACHE_MAX_ENTRIES,
+    SEARCH_CACHE_TTL_SECONDS,
+    SEARCH_CACHE_DIR,
+)
+from chatbox.utils.embedding_cache import normalize_query_text
+
+
+class ResponseCache:
+    """
+    LRU + TTL cache of decoded JSON responses keyed by (endpoint, normalized query,
+    extra key parts). An optional on-disk tier (one .json file per key) survives restarts.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, disk_dir: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        if self.disk_dir:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+
+        self._entries: OrderedDict[str, tuple[Any, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(endpoint: str, query: str, *extra) -> str:
+        # case-insensitive: search APIs treat "Ricci flow" and "ricci flow" the same
+        normalized = normalize_query_text(query).lower()
+        raw = "\x00".join([endpoint, normalized, *map(str, extra)])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _store(self, key: str, value: Any, expires_at: float):
+        # caller holds the lock
+        self._entries.pop(key, None)
+        self._entries[key] = (value, expires_at)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _load_from_disk(self, key: str) -> Optional[tuple[Any, float]]:
+        if not self.disk_dir:
+            return None
+        path = self.disk_dir / f"{key}.json"
+        try:
+            expires_at = path.stat().st_mtime + self.ttl_seconds
+            if expires_at <= time.time():
+                path.unlink(missing_ok=True)
+                return None
+            return json.loads(path.read_text(encoding="utf-8")), expires_at
+        except (OSError, ValueError):
+            return None
+
+    def get(self, key: str, record_stats: bool = True) -> Optional[Any]:
+        # record_stats=False for reads that are not searches (hydrating document refs)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > time.time():
+                    self._entries.move_to_end(key)
+                    self.hits += record_stats
+                    return value
+                self._entries.pop(key)
+
+        loaded = self._load_from_disk(key)
+        with self._lock:
+            if loaded is None:
+                self.misses += record_stats
+                return None
+            self.disk_hits += record_stats
+            self._store(key, *loaded)
+            return loaded[0]
+
+    def put(self, key: str, value: Any):
+        with self._lock:
+            self._store(key, value, time.time() + self.ttl_seconds)
+
+        if self.disk_dir:
+            try:
+                # write then rename, so readers never see a partial file
+                tmp_path = self.disk_dir / f"{key}.{os.getpid()}.tmp"
+                tmp_path.write_text(json.dumps(value), encoding="utf-8")
+                os.replace(tmp_path, self.disk_dir / f"{key}.json")
+            except (OSError, TypeError) as e:
+                print(f"Failed to write search cache entry: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
+
+class ExternalHttpClient:
+    """
+    Shared async client for external search APIs: one httpx.AsyncClient with
+    keep-alive pooling, a per-host concurrency limit and the response cache.
+    """
+
+    def __init__(
+        self,
+        timeout: float,
+        max_connections: int,
+        max_per_host: int,
+        cache: ResponseCache,
+    ):
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.max_per_host = max_per_host
+        self.cache = cache
+        self._client: Optional[httpx.AsyncClient] = None
+        self._host_limits: dict[str, asyncio.Semaphore] = {}
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+        return self._client
+
+    def _host_limit(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.max_per_host)
+        return self._host_limits[host]
+
+    async def request_json(
+        self,
+        method: str,
+        url: str,
+        cache_key: Optional[str] = None,
+        **kwargs,
+    ) -> Any:
+        """
+        Send a request and return the decoded JSON body. Successful responses are
+        cached under cache_key (see ResponseCache.key); errors raise httpx exceptions.
+        """
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        async with self._host_limit(url):
+            response = await self._get_client().request(method, url, **kwargs)
+        response.raise_for_status()
+        data = response.json()
+
+        if cache_key is not None:
+            self.cache.put(cache_key, data)
+        return data
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+_http_client: Optional[ExternalHttpClient] = None
+
+
+def get_http_client() -> ExternalHttpClient:
+    global _http_client
+    if _http_client is None:
+        _http_client = ExternalHttpClient(
+            timeout=HTTP_TIMEOUT_SECONDS,
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_per_host=HTTP_MAX_PER_HOST,
+            cache=ResponseCache(
+                max_entries=SEARCH_CACHE_MAX_ENTRIES,
+                ttl_seconds=SEARCH_CACHE_TTL_SECONDS,
+                disk_dir=SEARCH_CACHE_DIR or None,
+            ),
+        )
+    return _http_client
+
+
+async def close_http_client():
+    if _http_client is not None:
+        await _http_client.aclose()
@@ -38,6 +38,18 @@ TIME_WINDOW = timedelta(days=TIME_WINDOW_DAYS)
 CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "1024"))
 CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "200"))
 
+# ================== vector index configuration ==================
+# ANN index on paperchunk.embedding, managed by managers/vector_index_manager.py
+# VECTOR_INDEX_TYPE: "hnsw", "ivfflat" or "none" (exact sequential scan)
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "hnsw").strip().lower()
+# build-time parameters
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+IVFFLAT_LISTS = int(os.getenv("IVFFLAT_LISTS", "100"))
+# query-time parameters, applied per request
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "40"))
+IVFFLAT_PROBES = int(os.getenv("IVFFLAT_PROBES", "10"))
+
 # ================== model configuration ==================
 # Embedding model
 _embed_model = None
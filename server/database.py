@@ -1,12 +1,15 @@
 from sqlmodel import SQLModel, create_engine
 from sqlalchemy import text
 import asyncpg
+import re
 from dotenv import load_dotenv
 import os
 
 from models.paper import Paper
 from models.report import Report
 from models.session import ChatSession
+# imported only to register the BM25 tables with SQLModel.metadata
+from models.bm25 import BM25Posting, BM25TermStat, BM25PaperStat  # noqa: F401
 
 # Load environment variables
 load_dotenv()
@@ -38,10 +41,38 @@ def create_db_and_tables():
     # create all tables
     SQLModel.metadata.create_all(engine)
 
+    # full-text search column for the lexical half of hybrid retrieval.
+    # generated by Postgres, so ingestion never has to write it
+    with engine.connect() as conn:
+        conn.execute(text(
+            "ALTER TABLE paperchunk ADD COLUMN IF NOT EXISTS text_search tsvector "
+            "GENERATED ALWAYS AS (to_tsvector('english', coalesce(text, ''))) STORED;"
+        ))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_paperchunk_text_search "
+            "ON paperchunk USING GIN (text_search);"
+        ))
+        conn.commit()
+
+    # B-tree for paper-scoped retrieval (create_all does not add indexes to existing tables)
+    with engine.connect() as conn:
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_paperchunk_paper_id ON paperchunk (paper_id);"
+        ))
+        conn.commit()
+
+    # ANN index on paperchunk.embedding, built with the configured parameters
+    from managers.vector_index_manager import VectorIndexManager
+    VectorIndexManager.ensure_index()
+
 
 #async database pool
 
 async_db_pool = None
+# chat admission sizes its run cap from this (chatbox/core/config.py)
+ASYNC_DB_POOL_MAX_SIZE = 10
+# how long a request waits for a free pool connection before it fails
+ASYNC_DB_ACQUIRE_TIMEOUT_SECONDS = float(os.getenv("ASYNC_DB_ACQUIRE_TIMEOUT_SECONDS", "10"))
 
 async def init_db_pool():
     global async_db_pool
@@ -49,7 +80,7 @@ async def init_db_pool():
         async_db_pool = await asyncpg.create_pool(
             dsn = DATABASE_URL,
             min_size = 1,
-            max_size = 10,
+            max_size = ASYNC_DB_POOL_MAX_SIZE,
         )
         print("asyncpg database pool initialized")
 
@@ -59,10 +90,38 @@ async def close_db_pool():
         await async_db_pool.close()
 
 
+def get_async_db_pool() -> asyncpg.Pool:
+    if not async_db_pool:
+        raise RuntimeError("Database pool not initialized")
+    return async_db_pool
+
+
+def acquire_async_db_connection():
+    # async with acquire_async_db_connection() as conn: ...; raises asyncio.TimeoutError
+    # when the pool stays saturated, instead of waiting behind the other requests forever
+    return get_async_db_pool().acquire(timeout=ASYNC_DB_ACQUIRE_TIMEOUT_SECONDS)
+
+
+_NAMED_PARAM = re.compile(r"(?<![:\w]):([A-Za-z_]\w*)")
+
+def to_asyncpg_query(sql: str, params: dict) -> tuple[str, list]:
+    # ":name" placeholders (sqlalchemy.text style) -> "$n" for asyncpg, so the same
+    # SQL string serves both drivers. "::type" casts are left untouched.
+    names: list[str] = []
+
+    def _replace(match: re.Match) -> str:
+        name = match.group(1)
+        if name not in names:
+            names.append(name)
+        return f"${names.index(name) + 1}"
+
+    return _NAMED_PARAM.sub(_replace, sql), [params[name] for name in names]
+
+
 async def get_async_db_connection():
     global async_db_pool
     if not async_db_pool:
         raise RuntimeError("Database pool not initialized")
     
-    async with async_db_pool.acquire() as connection:
+    async with async_db_pool.acquire(timeout=ASYNC_DB_ACQUIRE_TIMEOUT_SECONDS) as connection:
         yield connection
\ No newline at end of file
@@ -1,4 +1,6 @@
 # Managers package
 from .storage_manager import StorageManager
+from .bm25_index_manager import BM25IndexManager
+from .vector_index_manager import VectorIndexManager
 
-__all__ = ["StorageManager"]
+__all__ = ["StorageManager", "BM25IndexManager", "VectorIndexManager"]
@@ -0,0 +1,183 @@
+import re
+from collections import Counter
+from typing import Optional
+
+import asyncpg
+from sqlalchemy import delete, insert, text
+from sqlmodel import Session, select, col
+
+from database import engine, to_asyncpg_query
+from models.paper import PaperChunk
+from models.bm25 import BM25Posting, BM25TermStat, BM25PaperStat
+
+# Okapi BM25 parameters (same defaults as rank_bm25.BM25Okapi)
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Scores are computed inside Postgres from the postings of the query terms only,
+# so a query touches O(postings of its terms) rows instead of the whole corpus.
+# idf uses the non-negative form ln(1 + (N - df + 0.5) / (df + 0.5)).
+# k1 and b are cast explicitly so asyncpg does not infer them as integers.
+_SEARCH_SQL = """
+WITH q AS (
+    SELECT term, COUNT(*) AS qtf
+    FROM unnest(CAST(:terms AS text[])) AS t(term)
+    GROUP BY term
+),
+corpus AS (
+    SELECT SUM(doc_count)::float AS n,
+           SUM(total_length)::float / NULLIF(SUM(doc_count), 0) AS avgdl
+    FROM bm25paperstat
+    WHERE TRUE {paper_filter}
+),
+term_df AS (
+    SELECT term, SUM(df)::float AS df
+    FROM bm25termstat
+    WHERE term = ANY(CAST(:terms AS text[])) {paper_filter}
+    GROUP BY term
+)
+SELECT p.chunk_id,
+       SUM(
+           q.qtf
+           * ln(1 + (corpus.n - term_df.df + 0.5) / (term_df.df + 0.5))
+           * p.tf * (CAST(:k1 AS float) + 1)
+           / (p.tf + CAST(:k1 AS float) * (1 - CAST(:b AS float) + CAST(:b AS float) * p.doc_length / corpus.avgdl))
+       ) AS score
+FROM bm25posting AS p
+JOIN q ON q.term = p.term
+JOIN term_df ON term_df.term = p.term
+CROSS JOIN corpus
+WHERE p.term = ANY(CAST(:terms AS text[])) {posting_filter}
+GROUP BY p.chunk_id
+ORDER BY score DESC
+LIMIT :top_k
+"""
+
+
+def tokenize_for_bm25(text: str) -> list[str]:
+    # English-only tokenization for BM25.
+    return re.findall(r"[A-Za-z0-9_]+", (text or "").lower())
+
+
+class BM25IndexManager:
+
+    @staticmethod
+    def remove_paper(session: Session, paper_id: str) -> None:
+        session.execute(delete(BM25Posting).where(col(BM25Posting.paper_id) == paper_id))
+        session.execute(delete(BM25TermStat).where(col(BM25TermStat.paper_id) == paper_id))
+        session.execute(delete(BM25PaperStat).where(col(BM25PaperStat.paper_id) == paper_id))
+
+    @staticmethod
+    def index_paper(session: Session, paper_id: str) -> int:
+        """
+        (Re)build the postings and stats of one paper from its stored chunks.
+        Only rows of this paper are touched, so ingestion stays incremental.
+        The caller owns the transaction and must commit.
+        """
+        BM25IndexManager.remove_paper(session, paper_id)
+
+        chunks = session.exec(
+            select(PaperChunk.id, PaperChunk.text).where(PaperChunk.paper_id == paper_id)
+        ).all()
+
+        postings = []
+        doc_freq: Counter[str] = Counter()
+        doc_count = 0
+        total_length = 0
+        for chunk_id, chunk_text in chunks:
+            tokens = tokenize_for_bm25(chunk_text)
+            if not tokens:
+                continue
+            term_freq = Counter(tokens)
+            doc_freq.update(term_freq.keys())
+            doc_count += 1
+            total_length += len(tokens)
+            postings.extend(
+                {
+                    "term": term,
+                    "chunk_id": chunk_id,
+                    "paper_id": paper_id,
+                    "tf": tf,
+                    "doc_length": len(tokens),
+                }
+                for term, tf in term_freq.items()
+            )
+
+        if not postings:
+            return 0
+
+        session.execute(insert(BM25Posting), postings)
+        session.execute(
+            insert(BM25TermStat),
+            [{"term": term, "paper_id": paper_id, "df": df} for term, df in doc_freq.items()],
+        )
+        session.execute(
+            insert(BM25PaperStat).values(
+                paper_id=paper_id, doc_count=doc_count, total_length=total_length
+            )
+        )
+        return doc_count
+
+    @staticmethod
+    def _search_query(query: str, paper_id: Optional[str], top_k: int) -> Optional[tuple[str, dict]]:
+        terms = tokenize_for_bm25(query)
+        if not terms:
+            return None
+
+        params: dict = {"terms": terms, "k1": BM25_K1, "b": BM25_B, "top_k": top_k}
+        paper_filter = posting_filter = ""
+        if paper_id:
+            paper_filter = "AND paper_id = :paper_id"
+            posting_filter = "AND p.paper_id = :paper_id"
+            params["paper_id"] = paper_id
+
+        return _SEARCH_SQL.format(paper_filter=paper_filter, posting_filter=posting_filter), params
+
+    @staticmethod
+    def search(
+        session: Session,
+        query: str,
+        paper_id: Optional[str] = None,
+        top_k: int = 5,
+    ) -> list[tuple[int, float]]:
+        """Return (chunk_id, score) pairs of the top_k BM25 matches."""
+        search_query = BM25IndexManager._search_query(query, paper_id, top_k)
+        if search_query is None:
+            return []
+        rows = session.execute(text(search_query[0]), search_query[1]).all()
+        return [(row.chunk_id, float(row.score)) for row in rows]
+
+    @staticmethod
+    async def asearch(
+        conn: asyncpg.Connection,
+        query: str,
+        paper_id: Optional[str] = None,
+        top_k: int = 5,
+    ) -> list[tuple[int, float]]:
+        """search() on an asyncpg connection."""
+        search_query = BM25IndexManager._search_query(query, paper_id, top_k)
+        if search_query is None:
+            return []
+        rows = await conn.fetch(*to_asyncpg_query(*search_query))
+        return [(row["chunk_id"], float(row["score"])) for row in rows]
+
+def reindex_paper(paper_id: str) -> int:
+    with Session(engine) as session:
+        count = BM25IndexManager.index_paper(session, paper_id)
+        session.commit()
+    print(f"BM25 index updated for paper {paper_id}: {count} chunks")
+    return count
+
+
+def rebuild_bm25_index():
+    # one-off backfill for chunks ingested before the index existed
+    with Session(engine) as session:
+        paper_ids = session.exec(select(PaperChunk.paper_id).distinct()).all()
+
+    for paper_id in paper_ids:
+        reindex_paper(paper_id)
+    print(f"BM25 index rebuilt for {len(paper_ids)} papers")
+
+
+if __name__ == "__main__":
+    rebuild_bm25_index()
@@ -0,0 +1,218 @@
+import sys
+import time
+from statistics import mean, median
+from typing import Optional
+
+import asyncpg
+from sqlalchemy import text
+from sqlmodel import Session
+
+from database import engine
+from config import (
+    VECTOR_INDEX_TYPE,
+    HNSW_M,
+    HNSW_EF_CONSTRUCTION,
+    IVFFLAT_LISTS,
+    HNSW_EF_SEARCH,
+    IVFFLAT_PROBES,
+)
+
+INDEX_NAMES = {
+    "hnsw": "ix_paperchunk_embedding_hnsw",
+    "ivfflat": "ix_paperchunk_embedding_ivfflat",
+}
+
+# opening chunks (chunk_index 0 and 1) are about 1% of the rows; the exact
+# opening-chunk search reads its candidates through this partial index
+_OPENING_CHUNKS_INDEX_DDL = (
+    "CREATE INDEX IF NOT EXISTS ix_paperchunk_opening_chunks "
+    "ON paperchunk (paper_id) WHERE chunk_index IN (0, 1);"
+)
+
+
+def _index_ddl(index_type: str) -> str:
+    # cosine ops, matching PaperChunk.embedding.cosine_distance / <=> in retrieve.py
+    if index_type == "hnsw":
+        return (
+            f"CREATE INDEX IF NOT EXISTS {INDEX_NAMES['hnsw']} ON paperchunk "
+            f"USING hnsw (embedding vector_cosine_ops) "
+            f"WITH (m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION});"
+        )
+    if index_type == "ivfflat":
+        return (
+            f"CREATE INDEX IF NOT EXISTS {INDEX_NAMES['ivfflat']} ON paperchunk "
+            f"USING ivfflat (embedding vector_cosine_ops) "
+            f"WITH (lists = {IVFFLAT_LISTS});"
+        )
+    raise ValueError(f"Unknown vector index type: {index_type}")
+
+
+class VectorIndexManager:
+
+    @staticmethod
+    def ensure_index(index_type: str = VECTOR_INDEX_TYPE) -> None:
+        # create the configured ANN index and the opening-chunk index if they do not exist yet
+        with engine.connect() as conn:
+            conn.execute(text(_OPENING_CHUNKS_INDEX_DDL))
+            if index_type != "none":
+                conn.execute(text(_index_ddl(index_type)))
+            conn.commit()
+        if index_type != "none":
+            print(f"Vector index ready: {INDEX_NAMES[index_type]}")
+
+    @staticmethod
+    def rebuild_index(index_type: str = VECTOR_INDEX_TYPE) -> None:
+        """
+        Drop every managed vector index and build the configured one with the
+        current parameters. Use after changing build parameters or after a large
+        ingest (IVFFlat lists are trained on the rows present at build time).
+        """
+        with engine.connect() as conn:
+            for name in INDEX_NAMES.values():
+                conn.execute(text(f"DROP INDEX IF EXISTS {name};"))
+            conn.commit()
+
+            if index_type != "none":
+                start = time.perf_counter()
+                conn.execute(text(_index_ddl(index_type)))
+                conn.commit()
+                print(f"Rebuilt {INDEX_NAMES[index_type]} in {time.perf_counter() - start:.1f}s")
+
+    @staticmethod
+    def search_params_sql(
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        index_type: str = VECTOR_INDEX_TYPE,
+        exact: bool = False,
+    ) -> Optional[str]:
+        """
+        SET LOCAL statement with the per-request search parameters. SET LOCAL only
+        lasts for the current transaction, so pooled connections never leak one
+        request's setting.
+
+        exact=True is for searches with a selective filter: an ANN scan would
+        post-filter its ef_search/probes candidates and can return fewer than
+        top_k rows, or none. Disabling plain index scans makes Postgres fetch the
+        filtered rows through a bitmap scan and sort them exactly. For one paper
+        that is ix_paperchunk_paper_id (a few hundred chunks); for opening chunks
+        it is ix_paperchunk_opening_chunks (about 1% of the rows).
+        """
+        if exact:
+            return "SET LOCAL enable_indexscan = off"
+        if index_type == "hnsw":
+            return f"SET LOCAL hnsw.ef_search = {int(ef_search or HNSW_EF_SEARCH)}"
+        if index_type == "ivfflat":
+            return f"SET LOCAL ivfflat.probes = {int(probes or IVFFLAT_PROBES)}"
+        return None
+
+    @staticmethod
+    def apply_search_params(
+        session: Session,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        index_type: str = VECTOR_INDEX_TYPE,
+        exact: bool = False,
+    ) -> None:
+        sql = VectorIndexManager.search_params_sql(ef_search, probes, index_type, exact)
+        if sql:
+            session.execute(text(sql))
+
+    @staticmethod
+    async def aapply_search_params(
+        conn: asyncpg.Connection,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        index_type: str = VECTOR_INDEX_TYPE,
+        exact: bool = False,
+    ) -> None:
+        # asyncpg counterpart; conn must be inside a transaction for SET LOCAL to apply
+        sql = VectorIndexManager.search_params_sql(ef_search, probes, index_type, exact)
+        if sql:
+            await conn.execute(sql)
+
+def _search_ids(session: Session, query_vector: str, top_k: int) -> list[int]:
+    rows = session.execute(
+        text(
+            "SELECT id FROM paperchunk "
+            "ORDER BY embedding <=> CAST(:query_vector AS vector) LIMIT :top_k"
+        ),
+        {"query_vector": query_vector, "top_k": top_k},
+    ).all()
+    return [row.id for row in rows]
+
+
+def recall_report(
+    sample_size: int = 50,
+    top_k: int = 10,
+    settings: Optional[list[int]] = None,
+    index_type: str = VECTOR_INDEX_TYPE,
+):
+    """
+    Compare ANN results against exact search for a sample of stored chunk
+    embeddings used as queries, for several ef_search (HNSW) or probes (IVFFlat)
+    values. Prints recall@k and latency so the chosen settings can be validated.
+    """
+    if index_type == "none":
+        print("VECTOR_INDEX_TYPE=none: search is already exact")
+        return
+
+    if settings is None:
+        settings = [10, 20, 40, 80, 160] if index_type == "hnsw" else [1, 5, 10, 20, 50]
+    param_name = "ef_search" if index_type == "hnsw" else "probes"
+
+    with Session(engine) as session:
+        sample = session.execute(
+            text(
+                "SELECT embedding::text AS embedding FROM paperchunk "
+                "WHERE embedding IS NOT NULL ORDER BY random() LIMIT :n"
+            ),
+            {"n": sample_size},
+        ).all()
+    queries = [row.embedding for row in sample]
+    if not queries:
+        print("No chunk embeddings found")
+        return
+
+    # ground truth: exact scan with index scans disabled
+    exact: list[list[int]] = []
+    exact_latencies = []
+    for query_vector in queries:
+        with Session(engine) as session:
+            session.execute(text("SET LOCAL enable_indexscan = off"))
+            start = time.perf_counter()
+            exact.append(_search_ids(session, query_vector, top_k))
+            exact_latencies.append(time.perf_counter() - start)
+
+    print(f"{len(queries)} queries, recall@{top_k}, index {INDEX_NAMES[index_type]}")
+    print(f"{'exact':<16} recall 1.000 | p50 {median(exact_latencies) * 1000:7.2f} ms")
+
+    for value in settings:
+        recalls = []
+        latencies = []
+        for query_vector, truth in zip(queries, exact, strict=True):
+            with Session(engine) as session:
+                VectorIndexManager.apply_search_params(
+                    session, ef_search=value, probes=value, index_type=index_type
+                )
+                start = time.perf_counter()
+                ids = _search_ids(session, query_vector, top_k)
+                latencies.append(time.perf_counter() - start)
+            recalls.append(len(set(ids) & set(truth)) / max(len(truth), 1))
+
+        latencies.sort()
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        print(
+            f"{param_name}={value:<6} recall {mean(recalls):.3f} | "
+            f"p50 {median(latencies) * 1000:7.2f} ms | p95 {p95 * 1000:7.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    # python -m managers.vector_index_manager [ensure|rebuild|report]
+    command = sys.argv[1] if len(sys.argv) > 1 else "ensure"
+    if command == "rebuild":
+        VectorIndexManager.rebuild_index()
+    elif command == "report":
+        recall_report()
+    else:
+        VectorIndexManager.ensure_index()
@@ -1,4 +1,5 @@
 # models/__init__.py
 from .paper import Paper, PaperChunk
 from .report import Report
-from .session import ChatSession
\ No newline at end of file
+from .session import ChatSession
+from .bm25 import BM25Posting, BM25TermStat, BM25PaperStat
\ No newline at end of file
@@ -0,0 +1,30 @@
+from sqlmodel import Field, SQLModel, Index
+
+
+# Inverted index for lexical (BM25) search over PaperChunk.text.
+# All rows are scoped by paper_id so a paper can be (re)indexed or dropped
+# without touching the rest of the corpus.
+class BM25Posting(SQLModel, table=True):
+    term: str = Field(primary_key=True)
+    chunk_id: int = Field(primary_key=True, foreign_key="paperchunk.id")
+    paper_id: str = Field(foreign_key="paper.id", index=True)
+
+    #term frequency in the chunk, and the chunk's token count (document length)
+    tf: int
+    doc_length: int
+
+    __table_args__ = (Index("ix_bm25posting_term_paper_id", "term", "paper_id"),)
+
+
+class BM25TermStat(SQLModel, table=True):
+    #document frequency of a term inside one paper; corpus df is the sum over papers
+    term: str = Field(primary_key=True)
+    paper_id: str = Field(primary_key=True, foreign_key="paper.id", index=True)
+    df: int
+
+
+class BM25PaperStat(SQLModel, table=True):
+    #number of indexed chunks and their summed token count, used for N and avgdl
+    paper_id: str = Field(primary_key=True, foreign_key="paper.id")
+    doc_count: int
+    total_length: int
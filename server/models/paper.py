@@ -29,7 +29,7 @@ class PaperChunk(SQLModel, table = True):
     metadata_json: str
 
     #foreign key
-    paper_id : str = Field(foreign_key="paper.id")
+    paper_id : str = Field(foreign_key="paper.id", index=True)
     paper: Paper = Relationship(back_populates="chunks")
 
     #vectors
@@ -16,6 +16,7 @@ from config import METADATA_DIR, ARCHIVED_DIR, MD_DIR, CHUNK_SIZE, CHUNK_OVERLAP
 from utils.latex_utils import escape_latex_preserve_math
 from utils import ensure_dir
 from managers.storage_manager import StorageManager, PAPERS_BUCKET, get_supabase_client
+from managers.bm25_index_manager import BM25IndexManager
 from utils.arxiv_query import remove_arxiv_version
 
 # For backward compatibility with string paths
@@ -189,6 +190,10 @@ def ingest_papers():
                     session.add(chunk)
             
                 session.commit()
+
+                #update lexical index for this paper only
+                BM25IndexManager.index_paper(session, paper_id)
+                session.commit()
                 
                 print(f"storing {len(node_texts)} vectors successfully")
         
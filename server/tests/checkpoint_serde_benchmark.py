@@ -0,0 +1,110 @@
+"""
+Benchmark the compact checkpoint serializer against LangGraph's JsonPlusSerializer.
+Run from server directory:
+    python -m tests.checkpoint_serde_benchmark
+
+Replays the blob writes of a 50-turn chat thread: per turn the messages channel is
+written twice (user message, then the answer), and the document refs once. Every
+third question carries PDF excerpts in additional_kwargs, like chat.py stores them.
+Reports total bytes stored, total save time, and the time to load the latest
+state (the read done by get_messages / chat). No database is needed.
+"""
+import random
+import time
+
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from chatbox.chat_agents.checkpoint_serde import CompactCheckpointSerializer
+from chatbox.utils.create_message import create_message
+
+TURNS = 50
+ANSWER_WORDS = 250
+LOAD_REPEATS = 20
+
+_VOCABULARY = (
+    "the a of to and in is that for by with as on this we it be are from which at an "
+    "manifold curvature metric flow surface bound estimate lemma theorem proof compact "
+    "smooth operator energy harmonic convergence sequence function space minimal mean "
+    "scalar Ricci tensor geodesic volume entropy monotonicity blow-up singularity limit "
+    "solution equation parabolic elliptic maximum principle Sobolev inequality constant "
+    "assume suppose then hence therefore follows implies since because consider define "
+    "let show prove obtain satisfies holds every each some there exists unique local "
+    "global time interval neighborhood point boundary interior domain region open closed"
+).split()
+
+
+def _text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choices(_VOCABULARY, k=words)).capitalize() + "."
+
+
+def _thread_updates(rng: random.Random) -> list[tuple[str, object]]:
+    # (channel, value) blob writes in order
+    messages = []
+    updates = []
+    for turn in range(TURNS):
+        question = create_message("user", _text(rng, 25))
+        if turn % 3 == 0:
+            question.additional_kwargs["excerpts"] = [
+                {"id": f"excerpt-{turn}-{i}", "text": _text(rng, 60), "page": rng.randint(1, 40)}
+                for i in range(2)
+            ]
+        messages = messages + [question]
+        updates.append(("messages", messages))
+
+        documents = [
+            {"source": "local_db", "chunk_id": rng.randint(1, 10**6),
+             "score": round(rng.random(), 4), "similarity": round(rng.random(), 4)}
+            for _ in range(12)
+        ]
+        updates.append(("documents", documents))
+
+        messages = messages + [create_message("ai", _text(rng, ANSWER_WORDS))]
+        updates.append(("messages", messages))
+    return updates
+
+
+def _measure(name: str, serde, updates: list[tuple[str, object]]) -> dict:
+    start = time.perf_counter()
+    blobs = {}
+    total_bytes = 0
+    for channel, value in updates:
+        blob = serde.dumps_typed(value)
+        blobs[channel] = blob
+        total_bytes += len(blob[1])
+    save_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(LOAD_REPEATS):
+        loaded = {channel: serde.loads_typed(blob) for channel, blob in blobs.items()}
+    load_seconds = (time.perf_counter() - start) / LOAD_REPEATS
+
+    assert loaded["messages"] == updates[-1][1], f"{name}: messages did not round-trip"
+    return {
+        "name": name,
+        "bytes": total_bytes,
+        "latest_bytes": sum(len(blob[1]) for blob in blobs.values()),
+        "save_ms": save_seconds * 1000,
+        "load_ms": load_seconds * 1000,
+    }
+
+
+def main():
+    updates = _thread_updates(random.Random(0))
+    results = [
+        _measure("default", JsonPlusSerializer(), updates),
+        _measure("compact", CompactCheckpointSerializer(), updates),
+    ]
+
+    print(f"{TURNS}-turn thread, {len(updates)} blob writes")
+    print(f"{'serializer':<12}{'stored KB':>12}{'latest KB':>12}{'save ms':>10}{'load ms':>10}")
+    for result in results:
+        print(
+            f"{result['name']:<12}{result['bytes'] / 1024:>12.1f}{result['latest_bytes'] / 1024:>12.1f}"
+            f"{result['save_ms']:>10.1f}{result['load_ms']:>10.2f}"
+        )
+    default, compact = results
+    print(f"compact stores {1 - compact['bytes'] / default['bytes']:.1%} fewer bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Compare the checkpoint bytes a turn writes for retrieved documents: formatted
+document strings (old state layout) against DocumentRefs (chunk ids; external results
+keep their text).
+Run from server directory:
+    python -m tests.checkpoint_size_check
+
+AsyncPostgresSaver stores one blob per channel version, so every node that updates
+a document channel writes that channel again. The script replays the channel
+updates of a local turn (retrieve -> grade_documents -> generate) and of a global
+turn (global tools -> grade_documents -> generate) with synthetic chunks of
+CHUNK_SIZE tokens, serializes each update with the saver's serializer and sums
+the bytes. No database or API access is needed.
+"""
+import random
+
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from config import CHUNK_SIZE
+from chatbox.chat_agents.document_refs import format_document
+
+# retrieve: 4 sub-queries x top 10, about half of them unique; grading keeps 12
+LOCAL_RETRIEVED = 20
+LOCAL_KEPT = 12
+# global search: 2 results per tool
+EXTERNAL_PER_TOOL = 2
+GLOBAL_KEPT = 5
+
+_WORDS = (
+    "manifold curvature metric flow surface bound estimate lemma theorem proof "
+    "compact smooth operator energy harmonic convergence sequence function space"
+).split()
+
+
+def _chunk_text(rng: random.Random, tokens: int) -> str:
+    # about 4 characters per token for English text
+    sentences = []
+    length = 0
+    while length < tokens * 4:
+        sentence = " ".join(rng.choices(_WORDS, k=12)).capitalize() + "."
+        sentences.append(sentence)
+        length += len(sentence) + 1
+    return " ".join(sentences)
+
+
+def _old_local(rng: random.Random, count: int, source: str) -> tuple[list[str], list[int]]:
+    docs = [
+        format_document(source, "On the regularity of minimal surfaces", _chunk_text(rng, CHUNK_SIZE))
+        for _ in range(count)
+    ]
+    return docs, [rng.randint(1, 10**6) for _ in range(count)]
+
+
+def _new_local(rng: random.Random, count: int, source: str, graded: bool = False) -> list[dict]:
+    refs = []
+    for _ in range(count):
+        ref = {"source": source, "chunk_id": rng.randint(1, 10**6), "score": round(rng.random(), 4)}
+        if graded:
+            ref["similarity"] = round(rng.random(), 4)
+        refs.append(ref)
+    return refs
+
+
+def _old_external(rng: random.Random, source: str) -> list[str]:
+    return [
+        format_document(source, "A survey of geometric flows", _chunk_text(rng, 250), "https://example.org/paper")
+        for _ in range(EXTERNAL_PER_TOOL)
+    ]
+
+
+def _new_external(rng: random.Random, source: str) -> list[dict]:
+    # external refs keep the result text, so they are as large as the old documents
+    return [
+        {
+            "source": source,
+            "index": i,
+            "title": "A survey of geometric flows",
+            "text": _chunk_text(rng, 250),
+            "url": "https://example.org/paper",
+        }
+        for i in range(EXTERNAL_PER_TOOL)
+    ]
+
+
+def _turn_bytes(serde: JsonPlusSerializer, updates: list[dict]) -> int:
+    # one blob per updated channel per node step
+    return sum(
+        len(serde.dumps_typed(value)[1])
+        for update in updates
+        for value in update.values()
+    )
+
+
+def main():
+    serde = JsonPlusSerializer()
+    rng = random.Random(0)
+
+    old_docs, old_ids = _old_local(rng, LOCAL_RETRIEVED, "local_db")
+    old_local = [
+        {"documents": old_docs, "document_chunk_ids": old_ids},
+        {"documents": old_docs[:LOCAL_KEPT], "document_chunk_ids": old_ids[:LOCAL_KEPT]},
+    ]
+    new_local = [
+        {"documents": _new_local(rng, LOCAL_RETRIEVED, "local_db")},
+        {"documents": _new_local(rng, LOCAL_KEPT, "local_db", graded=True)},
+    ]
+
+    old_db, old_db_ids = _old_local(rng, EXTERNAL_PER_TOOL, "global_db_chunk")
+    old_external = _old_external(rng, "semantic_scholar") + _old_external(rng, "tavily")
+    old_global = [
+        {"semantic_docs": old_external[:EXTERNAL_PER_TOOL]},
+        {"tavily_docs": old_external[EXTERNAL_PER_TOOL:]},
+        {"db_docs": old_db, "db_doc_chunk_ids": old_db_ids},
+        {"documents": (old_external + old_db)[:GLOBAL_KEPT]},
+    ]
+    new_external = _new_external(rng, "semantic_scholar") + _new_external(rng, "tavily")
+    new_db = _new_local(rng, EXTERNAL_PER_TOOL, "global_db_chunk")
+    new_global = [
+        {"semantic_docs": new_external[:EXTERNAL_PER_TOOL]},
+        {"tavily_docs": new_external[EXTERNAL_PER_TOOL:]},
+        {"db_docs": new_db},
+        {"documents": (new_external + new_db)[:GLOBAL_KEPT]},
+    ]
+
+    print(f"{'turn':<8}{'strings':>12}{'refs':>12}{'saved':>10}")
+    for name, old, new in (("local", old_local, new_local), ("global", old_global, new_global)):
+        old_bytes = _turn_bytes(serde, old)
+        new_bytes = _turn_bytes(serde, new)
+        print(f"{name:<8}{old_bytes:>12,}{new_bytes:>12,}{1 - new_bytes / old_bytes:>10.1%}")
+
+
+if __name__ == "__main__":
+    main()
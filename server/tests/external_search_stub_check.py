@@ -0,0 +1,116 @@
+"""
+Check the shared external-search HTTP client against a local stub server.
+Run from server directory:
+    python -m tests.external_search_stub_check
+
+The stub answers like the Semantic Scholar search endpoint after a small delay
+and records the client port of every request. The script sends concurrent
+searches for a few terms, then repeats them, and reports how many requests
+reached the server, how many TCP connections were opened (keep-alive reuse),
+the peak number of in-flight requests (per-host limit) and the cache hit rate.
+"""
+import asyncio
+import json
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from chatbox.utils.http_client import ExternalHttpClient, ResponseCache
+
+STUB_DELAY_SECONDS = 0.05
+TERMS = ["minimal surface", "Ricci flow", "mean curvature", "harmonic map"]
+ROUNDS = 3
+MAX_PER_HOST = 2
+
+
+class _StubState:
+    lock = threading.Lock()
+    requests = 0
+    ports: set[int] = set()
+    in_flight = 0
+    peak_in_flight = 0
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        with _StubState.lock:
+            _StubState.requests += 1
+            _StubState.ports.add(self.client_address[1])
+            _StubState.in_flight += 1
+            _StubState.peak_in_flight = max(_StubState.peak_in_flight, _StubState.in_flight)
+        time.sleep(STUB_DELAY_SECONDS)
+
+        query = parse_qs(urlsplit(self.path).query).get("query", [""])[0]
+        body = json.dumps({
+            "data": [{"title": f"Stub paper on {query}", "abstract": "stub abstract", "url": ""}]
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        with _StubState.lock:
+            _StubState.in_flight -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+async def _run(endpoint: str, cache_dir: str):
+    client = ExternalHttpClient(
+        timeout=5,
+        max_connections=10,
+        max_per_host=MAX_PER_HOST,
+        cache=ResponseCache(max_entries=128, ttl_seconds=60, disk_dir=cache_dir),
+    )
+
+    async def _search(term: str):
+        return await client.request_json(
+            "GET",
+            endpoint,
+            cache_key=ResponseCache.key(endpoint, term, 2),
+            params={"query": term, "limit": 2},
+        )
+
+    try:
+        for round_index in range(ROUNDS):
+            start = time.perf_counter()
+            # differently cased/spaced variants must share cache entries
+            terms = [term if round_index == 0 else f"  {term.upper()} " for term in TERMS]
+            results = await asyncio.gather(*(_search(term) for term in terms))
+            elapsed = time.perf_counter() - start
+            print(f"round {round_index + 1}: {len(results)} searches in {elapsed * 1000:.1f} ms")
+    finally:
+        await client.aclose()
+
+    print(f"requests reaching the stub: {_StubState.requests} (expected {len(TERMS)})")
+    print(f"TCP connections opened:     {len(_StubState.ports)}")
+    print(f"peak in-flight requests:    {_StubState.peak_in_flight} (limit {MAX_PER_HOST})")
+    print(f"cache: {client.cache.stats()}")
+
+    # a fresh cache on the same directory is served from disk
+    disk_cache = ResponseCache(max_entries=128, ttl_seconds=60, disk_dir=cache_dir)
+    disk_hits = sum(
+        disk_cache.get(ResponseCache.key(endpoint, term, 2)) is not None for term in TERMS
+    )
+    print(f"disk tier hits after restart: {disk_hits}/{len(TERMS)}")
+
+
+def run_check():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    endpoint = f"http://127.0.0.1:{server.server_address[1]}/graph/v1/paper/search"
+    try:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            asyncio.run(_run(endpoint, cache_dir))
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    run_check()
@@ -0,0 +1,64 @@
+"""
+Compare the lexical retrieval backends on the local corpus.
+Run from server directory: python -m tests.lexical_backend_benchmark [paper_id]
+
+For every sample query both backends are timed and the overlap of their
+top-k chunk ids is reported, so "fts" and "bm25" can be judged on our data
+before switching LEXICAL_SEARCH_BACKEND. The per-paper chunk cache is bypassed,
+so with a paper_id both backends are timed against the database.
+"""
+import sys
+import time
+from statistics import mean
+
+from chatbox.chat_agents.retrieve import search_lexical
+
+SAMPLE_QUERIES = [
+    "what is the main theorem of this paper",
+    "definition of a minimal surface",
+    "mean curvature flow monotonicity formula",
+    "regularity of stationary varifolds",
+    "elliptic estimates for the Laplacian",
+    "Allen-Cahn equation and phase transitions",
+]
+TOP_K = 5
+REPEAT = 3
+
+
+def _time_backend(backend: str, query: str, paper_id: str | None):
+    durations = []
+    results = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        results = search_lexical(
+            query, paper_id=paper_id, top_k=TOP_K, backend=backend, use_paper_cache=False
+        )
+        durations.append(time.perf_counter() - start)
+    return min(durations), [result.chunk_id for result in results]
+
+
+def run_benchmark(paper_id: str | None = None):
+    timings: dict[str, list[float]] = {"fts": [], "bm25": []}
+    overlaps = []
+
+    for query in SAMPLE_QUERIES:
+        fts_time, fts_ids = _time_backend("fts", query, paper_id)
+        bm25_time, bm25_ids = _time_backend("bm25", query, paper_id)
+        timings["fts"].append(fts_time)
+        timings["bm25"].append(bm25_time)
+
+        overlap = len(set(fts_ids) & set(bm25_ids)) / TOP_K
+        overlaps.append(overlap)
+        print(
+            f"{query[:40]:<40} fts {fts_time * 1000:7.1f} ms | "
+            f"bm25 {bm25_time * 1000:7.1f} ms | overlap@{TOP_K} {overlap:.2f}"
+        )
+
+    print("=" * 80)
+    for backend, values in timings.items():
+        print(f"{backend:<5} mean {mean(values) * 1000:7.1f} ms, max {max(values) * 1000:7.1f} ms")
+    print(f"mean overlap@{TOP_K}: {mean(overlaps):.2f}")
+
+
+if __name__ == "__main__":
+    run_benchmark(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,126 @@
+"""
+Single-paper chat retrieval latency at growing corpus sizes.
+Run from server directory:
+    python -m tests.paper_scoped_search_benchmark [sizes] [dim]
+    e.g. python -m tests.paper_scoped_search_benchmark 10000,100000,1000000 1536
+
+A synthetic table (bench_paperchunk) with random embeddings, a B-tree on
+paper_id, the partial opening-chunk index and the configured ANN index is built
+for every size. It compares the plain ANN path (index scan + post-filter) with
+the exact path used by retrieve.py, for random papers (paper_id filter) and for
+the opening-chunk search (chunk_index IN (0, 1), about 1% of the rows),
+reporting latency and how often fewer than top_k rows came back. The table is
+dropped at the end.
+Building the ANN index for 1M chunks takes a long time; start with small sizes.
+"""
+import random
+import sys
+import time
+from statistics import median
+
+from sqlalchemy import text
+from sqlmodel import Session
+
+from database import engine
+from config import VECTOR_INDEX_TYPE, HNSW_M, HNSW_EF_CONSTRUCTION, IVFFLAT_LISTS
+from managers.vector_index_manager import VectorIndexManager
+
+CHUNKS_PER_PAPER = 200
+TOP_K = 5
+QUERIES = 50
+
+
+def _build_table(size: int, dim: int):
+    papers = max(1, size // CHUNKS_PER_PAPER)
+    with engine.connect() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS bench_paperchunk;"))
+        conn.execute(text(
+            f"CREATE TABLE bench_paperchunk "
+            f"(id serial PRIMARY KEY, paper_id text, chunk_index int, embedding vector({dim}));"
+        ))
+        conn.execute(text(
+            f"""
+            INSERT INTO bench_paperchunk (paper_id, chunk_index, embedding)
+            SELECT 'paper_' || (g % {papers}), g / {papers},
+                   (SELECT array_agg(random() - 0.5) FROM generate_series(1, {dim}) WHERE g > 0)::vector
+            FROM generate_series(1, {size}) AS g;
+            """
+        ))
+        conn.execute(text("CREATE INDEX ON bench_paperchunk (paper_id);"))
+        conn.execute(text("CREATE INDEX ON bench_paperchunk (paper_id) WHERE chunk_index IN (0, 1);"))
+        if VECTOR_INDEX_TYPE == "hnsw":
+            conn.execute(text(
+                f"CREATE INDEX ON bench_paperchunk USING hnsw (embedding vector_cosine_ops) "
+                f"WITH (m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION});"
+            ))
+        elif VECTOR_INDEX_TYPE == "ivfflat":
+            conn.execute(text(
+                f"CREATE INDEX ON bench_paperchunk USING ivfflat (embedding vector_cosine_ops) "
+                f"WITH (lists = {IVFFLAT_LISTS});"
+            ))
+        conn.execute(text("ANALYZE bench_paperchunk;"))
+        conn.commit()
+    return papers
+
+
+def _run_queries(papers: int, dim: int, exact: bool, opening_only: bool = False):
+    # opening_only: the filter of retrieve.asearch_opening_chunks_by_query instead of one paper
+    if opening_only:
+        where = "chunk_index IN (0, 1)"
+    else:
+        where = "paper_id = :paper_id"
+    latencies = []
+    short_results = 0
+    for _ in range(QUERIES):
+        paper_id = f"paper_{random.randrange(papers)}"
+        query_vector = "[" + ",".join(f"{random.random() - 0.5:.4f}" for _ in range(dim)) + "]"
+        with Session(engine) as session:
+            VectorIndexManager.apply_search_params(session, exact=exact)
+            start = time.perf_counter()
+            rows = session.execute(
+                text(
+                    f"SELECT id FROM bench_paperchunk WHERE {where} "
+                    "ORDER BY embedding <=> CAST(:query_vector AS vector) LIMIT :top_k"
+                ),
+                {"paper_id": paper_id, "query_vector": query_vector, "top_k": TOP_K},
+            ).all()
+            latencies.append(time.perf_counter() - start)
+        if len(rows) < TOP_K:
+            short_results += 1
+
+    latencies.sort()
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    return median(latencies), p95, short_results
+
+
+def run_benchmark(sizes: list[int], dim: int):
+    try:
+        for size in sizes:
+            print(f"\n>>> building {size} chunks (dim {dim}, index {VECTOR_INDEX_TYPE})")
+            start = time.perf_counter()
+            papers = _build_table(size, dim)
+            print(f"built in {time.perf_counter() - start:.1f}s, {papers} papers")
+
+            for label, exact, opening_only in (
+                ("ann + paper", False, False),
+                ("exact paper", True, False),
+                ("ann + opening", False, True),
+                ("exact opening", True, True),
+            ):
+                p50, p95, short = _run_queries(papers, dim, exact, opening_only)
+                print(
+                    f"{label:<16} p50 {p50 * 1000:8.2f} ms | p95 {p95 * 1000:8.2f} ms | "
+                    f"< top_k results: {short}/{QUERIES}"
+                )
+    finally:
+        with engine.connect() as conn:
+            conn.execute(text("DROP TABLE IF EXISTS bench_paperchunk;"))
+            conn.commit()
+
+
+if __name__ == "__main__":
+    sizes = [10_000, 100_000, 1_000_000]
+    if len(sys.argv) > 1:
+        sizes = [int(size) for size in sys.argv[1].split(",")]
+    dim = int(sys.argv[2]) if len(sys.argv) > 2 else 1536
+    run_benchmark(sizes, dim)
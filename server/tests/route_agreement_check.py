@@ -0,0 +1,103 @@
+"""
+Measure the local route classifier against labeled questions and the LLM router.
+Run from server directory:
+    python -m tests.route_agreement_check [--rules-only]
+
+Every labeled question is routed by the keyword rules, by the embedding centroids
+(when the rules abstain) and by the LLM router (_llm_plan in nodes.py). The script
+reports, per stage, how many questions it decided and how many of those match the
+label and the LLM route, plus the LLM router's own accuracy. Enable ROUTER_EMBEDDING_ROUTE
+only when the fast path agrees with the labels at least as well as the LLM does.
+--rules-only checks the keyword rules offline (no embedding or LLM requests).
+"""
+import asyncio
+import sys
+
+from chatbox.chat_agents.route_classifier import get_route_classifier
+
+LOCAL, GLOBAL = "retrieve", "global_search"
+
+LABELED_QUESTIONS = [
+    ("What is the main theorem of this paper?", LOCAL),
+    ("Explain the proof of Lemma 3.2.", LOCAL),
+    ("What do the authors assume about the metric?", LOCAL),
+    ("How is the energy functional defined here?", LOCAL),
+    ("Why does the inequality above hold?", LOCAL),
+    ("Can you summarize section 2?", LOCAL),
+    ("What role does the monotonicity formula play in the argument?", LOCAL),
+    ("Which boundary conditions are imposed in this paper?", LOCAL),
+    ("Is the constant in Theorem 1 sharp?", LOCAL),
+    ("What is the intuition behind this definition?", LOCAL),
+    ("How does the blow-up argument work in the proof?", LOCAL),
+    ("What does the notation H^1_0 mean in this excerpt?", LOCAL),
+    ("Is this method used in surveys of geometric flows?", LOCAL),
+    ("Where in the paper is compactness used?", LOCAL),
+    ("What do other authors say about the regularity of minimal surfaces?", GLOBAL),
+    ("Are there related papers on the Allen-Cahn equation?", GLOBAL),
+    ("Find me some papers on mean curvature flow with surgery.", GLOBAL),
+    ("What does the literature on Ricci flow say about singularities?", GLOBAL),
+    ("Search online for an introduction to varifolds.", GLOBAL),
+    ("Is there a survey paper on harmonic maps?", GLOBAL),
+    ("What is convergence in general?", GLOBAL),
+    ("Which recent works extend this approach to higher dimensions?", GLOBAL),
+    ("Who first proved the positive mass theorem?", GLOBAL),
+    ("Are there online lectures on elliptic regularity?", GLOBAL),
+    ("What is a Sobolev space?", GLOBAL),
+    ("Have similar results been obtained for the Yamabe problem?", GLOBAL),
+]
+
+
+def _report(name: str, decided: list[tuple[str, str, str | None]], total: int):
+    # decided: (label, route, llm route or None)
+    if not decided:
+        print(f"{name:<12} decided 0/{total}")
+        return
+    label_hits = sum(label == route for label, route, _ in decided)
+    with_llm = [(route, llm) for _, route, llm in decided if llm is not None]
+    llm_hits = sum(route == llm for route, llm in with_llm)
+    line = (
+        f"{name:<12} decided {len(decided):>2}/{total}, "
+        f"label agreement {label_hits}/{len(decided)} ({label_hits / len(decided):.0%})"
+    )
+    if with_llm:
+        line += f", LLM agreement {llm_hits}/{len(with_llm)} ({llm_hits / len(with_llm):.0%})"
+    print(line)
+
+
+async def _run(rules_only: bool):
+    classifier = get_route_classifier()
+    if not rules_only:
+        from chatbox.chat_agents.nodes import _llm_plan
+
+    by_rules, by_embedding, by_llm = [], [], []
+    for question, label in LABELED_QUESTIONS:
+        rule_route = classifier.classify_by_rules(question)
+        embedding_route = None
+        llm_route = None
+        if not rules_only:
+            plan = await _llm_plan(question, "N/A")
+            llm_route = GLOBAL if plan.data_source == GLOBAL else LOCAL
+            by_llm.append((label, llm_route, llm_route))
+            if rule_route is None:
+                embedding_route, _ = await classifier.classify_by_embedding(question)
+
+        if rule_route is not None:
+            by_rules.append((label, rule_route, llm_route))
+        elif embedding_route is not None:
+            by_embedding.append((label, embedding_route, llm_route))
+
+        fast_route = rule_route or embedding_route
+        marker = "" if fast_route in (None, label) else "  <-- fast path disagrees with label"
+        print(f"{label:<14}{fast_route or '-':<14}{llm_route or '-':<14}{question}{marker}")
+
+    total = len(LABELED_QUESTIONS)
+    print("=" * 80)
+    _report("rules", by_rules, total)
+    if not rules_only:
+        _report("embedding", by_embedding, total)
+        _report("fast path", by_rules + by_embedding, total)
+        _report("LLM router", by_llm, total)
+
+
+if __name__ == "__main__":
+    asyncio.run(_run("--rules-only" in sys.argv[1:]))
@@ -0,0 +1,152 @@
+"""
+Unit tests for /api/chat admission control (chatbox/chat_agents/admission.py).
+Run from server directory:
+    python -m pytest tests/test_admission.py
+"""
+import asyncio
+
+import pytest
+
+from chatbox.chat_agents.admission import AdmissionRejected, ChatAdmission
+
+
+def _admission(max_concurrent=2, max_queued=4, max_queued_per_thread=2, timeout=5.0) -> ChatAdmission:
+    return ChatAdmission(
+        max_concurrent=max_concurrent,
+        max_queued=max_queued,
+        max_queued_per_thread=max_queued_per_thread,
+        queue_timeout_seconds=timeout,
+    )
+
+
+async def _settle():
+    # let queued acquire() calls reach their wait
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_admits_up_to_the_cap_then_queues_in_order():
+    async def scenario():
+        admission = _admission(max_concurrent=2)
+        first = await admission.acquire("a")
+        await admission.acquire("b")
+        order = []
+
+        async def wait_for(thread_id):
+            slot = await admission.acquire(thread_id)
+            order.append(thread_id)
+            return slot
+
+        waiters = [asyncio.create_task(wait_for(t)) for t in ("c", "d")]
+        await _settle()
+        assert order == []
+        assert admission.stats()["queue_depth"] == 2
+
+        first.release()
+        await _settle()
+        assert order == ["c"]
+        assert admission.stats()["running"] == 2
+
+        (await waiters[0]).release()
+        await _settle()
+        assert order == ["c", "d"]
+        stats = admission.stats()
+        assert stats["admitted"] == 4 and stats["queued_admissions"] == 2
+
+    asyncio.run(scenario())
+
+
+def test_one_run_per_thread():
+    async def scenario():
+        admission = _admission(max_concurrent=4)
+        slot = await admission.acquire("a")
+        follow_up = asyncio.create_task(admission.acquire("a"))
+        other = await admission.acquire("b")
+        await _settle()
+        # a free global slot does not let a second run of the same thread start
+        assert not follow_up.done()
+
+        slot.release()
+        (await follow_up).release()
+        other.release()
+        stats = admission.stats()
+        assert stats["running"] == 0 and stats["threads_busy"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_release_is_idempotent():
+    async def scenario():
+        admission = _admission(max_concurrent=1)
+        slot = await admission.acquire("a")
+        slot.release()
+        slot.release()
+        assert admission.stats()["running"] == 0
+        # the slot was returned once, so the cap still holds
+        await admission.acquire("b")
+        blocked = asyncio.create_task(admission.acquire("c"))
+        await _settle()
+        assert not blocked.done()
+        blocked.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_rejects_when_the_queue_is_full():
+    async def scenario():
+        admission = _admission(max_concurrent=1, max_queued=1)
+        await admission.acquire("a")
+        waiter = asyncio.create_task(admission.acquire("b"))
+        await _settle()
+        with pytest.raises(AdmissionRejected) as rejected:
+            admission.check("c")
+        assert rejected.value.reason == "queue_full"
+        assert rejected.value.retry_after >= 1
+        assert admission.stats()["rejected"] == {"queue_full": 1}
+        waiter.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_rejects_when_the_thread_queue_is_full():
+    async def scenario():
+        admission = _admission(max_concurrent=2, max_queued=8, max_queued_per_thread=1)
+        await admission.acquire("a")
+        waiter = asyncio.create_task(admission.acquire("a"))
+        await _settle()
+        with pytest.raises(AdmissionRejected) as rejected:
+            await admission.acquire("a")
+        assert rejected.value.reason == "thread_queue_full"
+        # other threads are still admitted
+        await admission.acquire("b")
+        waiter.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_queue_timeout_rejects_and_frees_the_queue_place():
+    async def scenario():
+        admission = _admission(max_concurrent=1, timeout=0.05)
+        await admission.acquire("a")
+        with pytest.raises(AdmissionRejected) as rejected:
+            await admission.acquire("b")
+        assert rejected.value.reason == "queue_timeout"
+        stats = admission.stats()
+        assert stats["queue_depth"] == 0 and stats["running"] == 1 and stats["threads_busy"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_does_not_take_a_slot():
+    async def scenario():
+        admission = _admission(max_concurrent=1)
+        slot = await admission.acquire("a")
+        waiter = asyncio.create_task(admission.acquire("b"))
+        await _settle()
+        waiter.cancel()
+        await _settle()
+        slot.release()
+        assert admission.stats()["running"] == 0
+        (await admission.acquire("c")).release()
+
+    asyncio.run(scenario())
@@ -0,0 +1,147 @@
+"""
+Unit tests for the persistent BM25 index (managers/bm25_index_manager.py).
+Run from server directory:
+    python -m pytest tests/test_bm25_index_manager.py
+
+The search itself is one SQL statement; these tests check what ingestion writes and
+that scoring those rows with the statement's formula matches the in-memory BM25 of
+PaperChunkMatrix, which both follow rank_bm25.BM25Okapi.
+"""
+import math
+from collections import defaultdict
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from sqlalchemy.sql.dml import Delete, Insert
+
+from managers.bm25_index_manager import BM25_B, BM25_K1, BM25IndexManager, tokenize_for_bm25
+from chatbox.chat_agents.paper_chunk_cache import PaperChunkMatrix
+
+CHUNKS = [
+    (1, "Minimal surfaces have zero mean curvature."),
+    (2, "The mean curvature flow of surfaces develops singularities."),
+    (3, ""),  # empty chunks are not indexed
+    (4, "Ricci flow, Ricci solitons and the Ricci curvature."),
+]
+
+
+class _FakeSession:
+    """Records the statements index_paper executes; exec() returns the chunk rows."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.executed = []
+
+    def exec(self, statement):
+        return SimpleNamespace(all=lambda: list(self.chunks))
+
+    def execute(self, statement, params=None):
+        self.executed.append((statement, params))
+
+    def inserted(self, table: str) -> list[dict]:
+        rows = []
+        for statement, params in self.executed:
+            if isinstance(statement, Insert) and statement.table.name == table:
+                rows.extend(params if params is not None else [statement.compile().params])
+        return rows
+
+
+def _index(chunks=CHUNKS) -> tuple[_FakeSession, int]:
+    session = _FakeSession(chunks)
+    return session, BM25IndexManager.index_paper(session, "paper")
+
+
+def test_tokenize_lowercases_and_splits_on_non_word_characters():
+    assert tokenize_for_bm25("Ricci-flow, H^1_0 (2024)!") == ["ricci", "flow", "h", "1_0", "2024"]
+    assert tokenize_for_bm25("") == []
+    assert tokenize_for_bm25(None) == []
+
+
+def test_index_paper_replaces_the_papers_rows_first():
+    session, _ = _index()
+    deletes = [s.table.name for s, _ in session.executed if isinstance(s, Delete)]
+    assert deletes == ["bm25posting", "bm25termstat", "bm25paperstat"]
+    first_insert = next(i for i, (s, _) in enumerate(session.executed) if isinstance(s, Insert))
+    assert first_insert == 3
+
+
+def test_index_paper_writes_postings_and_stats():
+    session, count = _index()
+    assert count == 3
+
+    postings = {(row["term"], row["chunk_id"]): row for row in session.inserted("bm25posting")}
+    assert postings[("ricci", 4)]["tf"] == 3
+    assert postings[("ricci", 4)]["doc_length"] == 8
+    assert postings[("curvature", 1)]["tf"] == 1
+    assert all(row["paper_id"] == "paper" for row in postings.values())
+    assert not any(chunk_id == 3 for _, chunk_id in postings)
+
+    df = {row["term"]: row["df"] for row in session.inserted("bm25termstat")}
+    assert df["curvature"] == 3
+    assert df["mean"] == 2
+    assert df["ricci"] == 1
+
+    (paper_stat,) = session.inserted("bm25paperstat")
+    assert paper_stat["doc_count"] == 3
+    assert paper_stat["total_length"] == 6 + 8 + 8
+
+
+def test_index_paper_without_text_writes_nothing():
+    session, count = _index([(1, ""), (2, "  ...  ")])
+    assert count == 0
+    assert not any(isinstance(s, Insert) for s, _ in session.executed)
+
+
+def test_search_query_filters_by_paper_only_when_given():
+    sql, params = BM25IndexManager._search_query("Mean curvature", "paper", 5)
+    assert params == {
+        "terms": ["mean", "curvature"], "k1": BM25_K1, "b": BM25_B, "top_k": 5, "paper_id": "paper",
+    }
+    assert "AND p.paper_id = :paper_id" in sql
+
+    sql, params = BM25IndexManager._search_query("Mean curvature", None, 5)
+    assert "paper_id" not in params
+    assert ":paper_id" not in sql
+    assert "{" not in sql
+
+    assert BM25IndexManager._search_query("?!", None, 5) is None
+
+
+def _sql_scores(session: _FakeSession, query: str) -> dict[int, float]:
+    # _SEARCH_SQL evaluated over the rows index_paper wrote
+    (paper_stat,) = session.inserted("bm25paperstat")
+    n = paper_stat["doc_count"]
+    avgdl = paper_stat["total_length"] / n
+    df = {row["term"]: row["df"] for row in session.inserted("bm25termstat")}
+    qtf = defaultdict(int)
+    for term in tokenize_for_bm25(query):
+        qtf[term] += 1
+
+    scores: dict[int, float] = defaultdict(float)
+    for row in session.inserted("bm25posting"):
+        if row["term"] not in qtf:
+            continue
+        idf = math.log(1 + (n - df[row["term"]] + 0.5) / (df[row["term"]] + 0.5))
+        tf = row["tf"]
+        scores[row["chunk_id"]] += qtf[row["term"]] * idf * tf * (BM25_K1 + 1) / (
+            tf + BM25_K1 * (1 - BM25_B + BM25_B * row["doc_length"] / avgdl)
+        )
+    return dict(scores)
+
+
+@pytest.mark.parametrize("query", ["mean curvature", "ricci flow", "surfaces surfaces singularities"])
+def test_index_rows_score_like_the_in_memory_bm25(query):
+    session, _ = _index()
+    indexed = [(chunk_id, text) for chunk_id, text in CHUNKS if tokenize_for_bm25(text)]
+    rows = [
+        SimpleNamespace(id=chunk_id, chunk_index=i, text=text, embedding=None)
+        for i, (chunk_id, text) in enumerate(indexed)
+    ]
+    matrix = PaperChunkMatrix("paper", "Title", rows, ttl_seconds=60)
+
+    expected = matrix.bm25_scores(query)
+    scores = _sql_scores(session, query)
+    actual = np.array([scores.get(chunk_id, 0.0) for chunk_id, _ in indexed])
+    np.testing.assert_allclose(actual, expected, rtol=1e-5)
+    assert actual.max() > 0
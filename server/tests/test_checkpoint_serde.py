@@ -0,0 +1,84 @@
+"""
+Unit tests for the compact checkpoint serializer (chatbox/chat_agents/checkpoint_serde.py).
+Run from server directory:
+    python -m pytest tests/test_checkpoint_serde.py
+"""
+from datetime import datetime
+
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, SystemMessage, ToolMessage
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from chatbox.chat_agents.checkpoint_serde import CompactCheckpointSerializer
+
+
+def _messages() -> list:
+    return [
+        HumanMessage(
+            content="What is a minimal surface?",
+            id="m1",
+            additional_kwargs={"timestamp": 1700000000000, "excerpts": [{"content": "H = 0"}]},
+        ),
+        AIMessage(content="A surface with zero mean curvature.", id="m2"),
+        SystemMessage(content="summary", id="m3"),
+        ToolMessage(content="result", tool_call_id="call-1", id="m4"),
+    ]
+
+
+def test_messages_and_plain_values_round_trip():
+    serde = CompactCheckpointSerializer()
+    value = {
+        "messages": _messages(),
+        "documents": [{"source": "local_db", "chunk_id": 7, "score": 0.0312}],
+        "search_count": 2,
+        "summary": "",
+        "user_excerpts": None,
+    }
+    type_, data = serde.dumps_typed(value)
+    assert type_.endswith("cmsgpack")
+    assert serde.loads_typed((type_, data)) == value
+
+
+def test_compresses_large_payloads_only():
+    serde = CompactCheckpointSerializer()
+    small_type, _ = serde.dumps_typed({"answer": "short"})
+    large_type, large = serde.dumps_typed({"answer": "minimal surface " * 200})
+    assert small_type == "cmsgpack"
+    assert large_type == "zstd+cmsgpack"
+    assert len(large) < 3200
+    assert serde.loads_typed((large_type, large)) == {"answer": "minimal surface " * 200}
+
+
+def test_unsupported_values_fall_back_to_jsonplus():
+    serde = CompactCheckpointSerializer()
+    default = JsonPlusSerializer()
+    for value in [
+        (1, 2),  # not silently turned into a list by msgpack
+        datetime(2024, 1, 2, 3, 4, 5),
+        [AIMessageChunk(content="partial", id="c1")],  # message subclasses
+    ]:
+        type_, data = serde.dumps_typed(value)
+        assert "cmsgpack" not in type_
+        # same value as a JsonPlusSerializer round trip
+        assert serde.loads_typed((type_, data)) == default.loads_typed(default.dumps_typed(value))
+
+
+def test_reads_rows_written_by_the_default_serializer():
+    value = {"messages": _messages(), "search_count": 1}
+    row = JsonPlusSerializer().dumps_typed(value)
+    assert CompactCheckpointSerializer().loads_typed(row) == value
+
+
+def test_write_compact_false_writes_the_default_format_and_reads_both():
+    value = {"messages": _messages()}
+    default = CompactCheckpointSerializer(write_compact=False)
+    assert default.dumps_typed(value) == JsonPlusSerializer().dumps_typed(value)
+    compact_row = CompactCheckpointSerializer().dumps_typed(value)
+    assert default.loads_typed(compact_row) == value
+
+
+def test_message_fields_survive_round_trip():
+    serde = CompactCheckpointSerializer()
+    restored = serde.loads_typed(serde.dumps_typed(_messages()))
+    assert [type(m) for m in restored] == [HumanMessage, AIMessage, SystemMessage, ToolMessage]
+    assert restored[0].additional_kwargs["excerpts"] == [{"content": "H = 0"}]
+    assert restored[3].tool_call_id == "call-1"
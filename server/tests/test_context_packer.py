@@ -0,0 +1,98 @@
+"""
+Unit tests for the generate context packer (chatbox/chat_agents/context_packer.py) and the
+ranking scores it gets from document_refs.context_scores.
+Run from server directory:
+    python -m pytest tests/test_context_packer.py
+"""
+import random
+
+from chatbox.chat_agents.context_packer import count_tokens, pack_context
+from chatbox.chat_agents.document_refs import context_scores, format_document
+from chatbox.core.config import GRADING_ACCEPT_SIMILARITY
+
+_TOPICS = ["curvature", "flow", "surface", "metric", "operator", "energy"]
+_WORDS = (
+    "manifold bound estimate lemma theorem proof compact smooth harmonic convergence "
+    "sequence function space tensor geodesic boundary domain weak strong limit"
+).split()
+
+
+def _document(topic: str, sentences: int = 3) -> str:
+    # distinct word order per topic, so different documents share few word triples
+    rng = random.Random(topic)
+    content = " ".join(
+        f"The {topic} {' '.join(rng.sample(_WORDS, 8))} section." for _ in range(sentences)
+    )
+    return format_document("local_db", f"On {topic}", content)
+
+
+def test_ranks_by_score_and_breaks_ties_by_retrieval_order():
+    documents = [_document(topic) for topic in _TOPICS[:4]]
+    packed = pack_context(documents, [0.2, 0.9, 0.2, 0.5], budget=10_000)
+    assert packed.order == [1, 3, 0, 2]
+    assert packed.packed == 4
+
+
+def test_unknown_scores_rank_with_the_median():
+    documents = [_document(topic) for topic in _TOPICS[:4]]
+    # known scores 0.1, 0.5, 0.9 -> median 0.5; ties keep retrieval order
+    packed = pack_context(documents, [0.1, None, 0.9, 0.5], budget=10_000)
+    assert packed.order == [2, 1, 3, 0]
+
+
+def test_drops_database_url_line():
+    packed = pack_context([_document("flow")], budget=10_000)
+    assert "URL: N/A" not in packed.text
+    assert packed.text.startswith("[SOURCE: local_db]\nTitle: On flow\nContent:")
+
+
+def test_near_duplicates_are_dropped():
+    original = _document("curvature", sentences=6)
+    # a chunk that repeats most of a longer one
+    repeated = original.rsplit(" The curvature", 1)[0]
+    packed = pack_context([original, repeated, _document("flow")], [0.9, 0.8, 0.1], budget=10_000)
+    assert packed.order == [0, 2]
+    assert packed.duplicates == 1
+
+
+def test_stays_within_budget_and_truncates_at_sentences():
+    documents = [_document(topic, sentences=20) for topic in _TOPICS[:3]]
+    first = count_tokens(documents[0].replace("\nURL: N/A\n", "\n", 1))
+    budget = first + 150
+    packed = pack_context(documents, budget=budget, min_truncated_tokens=32)
+
+    assert packed.used_tokens <= budget
+    assert count_tokens(packed.text) <= budget
+    assert packed.order == [0, 1]
+    assert packed.truncated == 1
+    assert packed.skipped == 1
+    # the truncated document ends with a whole sentence
+    assert packed.text.endswith("section.")
+
+
+def test_skips_document_when_too_little_budget_is_left():
+    documents = [_document(topic, sentences=20) for topic in _TOPICS[:2]]
+    first = count_tokens(documents[0].replace("\nURL: N/A\n", "\n", 1))
+    packed = pack_context(documents, budget=first + 10, min_truncated_tokens=64)
+    assert packed.order == [0]
+    assert packed.truncated == 0
+    assert packed.skipped == 1
+
+
+def test_context_scores_combine_retrieval_rank_and_relevance():
+    refs = [
+        {"source": "local_db", "chunk_id": 1, "score": 0.03, "similarity": 0.7},
+        {"source": "local_db", "chunk_id": 2, "score": 0.01},
+        {"source": "tavily", "index": 0, "title": "A", "text": "a", "url": ""},
+        {"source": "tavily", "index": 3, "title": "B", "text": "b", "url": "", "similarity": 0.6},
+    ]
+    scores = context_scores(refs)
+    # retrieval scores are normalized per source; LLM-accepted refs count at the accept threshold
+    assert scores[0] == 1.0 + 0.7
+    assert scores[1] == 0.0 + GRADING_ACCEPT_SIMILARITY
+    assert scores[2] == 1.0 + GRADING_ACCEPT_SIMILARITY
+    assert scores[3] == 0.0 + 0.6
+
+
+def test_context_scores_single_ref_per_source():
+    assert context_scores([{"source": "semantic_scholar", "index": 1, "title": "", "text": "t", "url": ""}]) == [1.0 + GRADING_ACCEPT_SIMILARITY]
@@ -0,0 +1,46 @@
+"""
+Unit tests for the sqlalchemy -> asyncpg placeholder conversion (database.to_asyncpg_query).
+Run from server directory:
+    python -m pytest tests/test_database.py
+"""
+import pytest
+
+from database import to_asyncpg_query
+
+
+def test_named_params_become_positional_in_first_use_order():
+    sql, args = to_asyncpg_query(
+        "SELECT * FROM paperchunk WHERE paper_id = :paper_id LIMIT :top_k",
+        {"top_k": 5, "paper_id": "p1"},
+    )
+    assert sql == "SELECT * FROM paperchunk WHERE paper_id = $1 LIMIT $2"
+    assert args == ["p1", 5]
+
+
+def test_repeated_names_reuse_the_same_placeholder():
+    sql, args = to_asyncpg_query(
+        "SELECT :q, :k WHERE a = :q OR b = :q",
+        {"q": "minimal surface", "k": 3},
+    )
+    assert sql == "SELECT $1, $2 WHERE a = $1 OR b = $1"
+    assert args == ["minimal surface", 3]
+
+
+def test_casts_are_left_untouched():
+    sql, args = to_asyncpg_query(
+        "SELECT embedding <=> CAST(:v AS vector), x::float, now()::timestamptz, :v::text",
+        {"v": "[0.1,0.2]"},
+    )
+    assert sql == "SELECT embedding <=> CAST($1 AS vector), x::float, now()::timestamptz, $1::text"
+    assert args == ["[0.1,0.2]"]
+
+
+def test_unused_params_are_ignored_and_missing_names_raise():
+    sql, args = to_asyncpg_query("SELECT :a", {"a": 1, "unused": 2})
+    assert (sql, args) == ("SELECT $1", [1])
+    with pytest.raises(KeyError):
+        to_asyncpg_query("SELECT :a, :b", {"a": 1})
+
+
+def test_sql_without_params():
+    assert to_asyncpg_query("SELECT 1", {}) == ("SELECT 1", [])
@@ -0,0 +1,120 @@
+"""
+Unit tests for the query embedding cache (chatbox/utils/embedding_cache.py).
+Run from server directory:
+    python -m pytest tests/test_embedding_cache.py
+"""
+import asyncio
+import os
+
+import numpy as np
+
+from chatbox.utils import embedding_cache
+from chatbox.utils.embedding_cache import EmbeddingCache, normalize_query_text
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _cache(monkeypatch, max_vectors: int = 2, ttl_seconds: float = 60, disk_dir=None) -> tuple[EmbeddingCache, _Clock]:
+    clock = _Clock()
+    monkeypatch.setattr(embedding_cache.time, "time", clock)
+    # 4 float32 dimensions = 16 bytes per vector
+    cache = EmbeddingCache("model", max_bytes=16 * max_vectors, ttl_seconds=ttl_seconds, disk_dir=disk_dir)
+    return cache, clock
+
+
+def test_normalize_query_text_keeps_case():
+    assert normalize_query_text("  Ricci  flow\n") == "Ricci flow"
+    assert normalize_query_text(None) == ""
+
+
+def test_hit_after_put_with_normalized_key(monkeypatch):
+    cache, _ = _cache(monkeypatch)
+    stored = cache.put("mean  curvature", [1, 2, 3, 4])
+    assert stored.dtype == np.float32
+    np.testing.assert_array_equal(cache.get(" mean curvature "), [1, 2, 3, 4])
+    assert cache.get("Mean curvature") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["bytes"]) == (1, 1, 16)
+
+
+def test_least_recently_used_entry_is_evicted(monkeypatch):
+    cache, _ = _cache(monkeypatch, max_vectors=2)
+    cache.put("a", [1] * 4)
+    cache.put("b", [2] * 4)
+    assert cache.get("a") is not None  # b is now least recently used
+    cache.put("c", [3] * 4)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    stats = cache.stats()
+    assert (stats["entries"], stats["evictions"], stats["bytes"]) == (2, 1, 32)
+
+
+def test_put_replaces_an_entry_without_double_counting(monkeypatch):
+    cache, _ = _cache(monkeypatch)
+    cache.put("a", [1] * 4)
+    cache.put("a", [2] * 4)
+    np.testing.assert_array_equal(cache.get("a"), [2] * 4)
+    assert cache.stats()["bytes"] == 16
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    cache, clock = _cache(monkeypatch, ttl_seconds=60)
+    cache.put("a", [1] * 4)
+    clock.now += 59
+    assert cache.get("a") is not None
+    clock.now += 1
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 0
+    assert cache.stats()["bytes"] == 0
+
+
+def test_disk_tier_survives_a_new_cache_and_expires(monkeypatch, tmp_path):
+    cache, clock = _cache(monkeypatch, disk_dir=tmp_path)
+    cache.put("a", [1, 2, 3, 4])
+    path = next(tmp_path.glob("*.npy"))
+    os.utime(path, (clock.now, clock.now))
+
+    restarted = EmbeddingCache("model", max_bytes=32, ttl_seconds=60, disk_dir=tmp_path)
+    np.testing.assert_array_equal(restarted.get("a"), [1, 2, 3, 4])
+    assert restarted.stats()["disk_hits"] == 1
+    # now served from memory
+    restarted.get("a")
+    assert restarted.stats()["hits"] == 1
+
+    clock.now += 61
+    fresh = EmbeddingCache("model", max_bytes=32, ttl_seconds=60, disk_dir=tmp_path)
+    assert fresh.get("a") is None
+    assert not path.exists()
+
+
+def test_model_name_is_part_of_the_key(monkeypatch, tmp_path):
+    cache, _ = _cache(monkeypatch, disk_dir=tmp_path)
+    cache.put("a", [1] * 4)
+    other = EmbeddingCache("other-model", max_bytes=32, ttl_seconds=60, disk_dir=tmp_path)
+    assert other.get("a") is None
+
+
+def test_batch_embeds_only_distinct_misses(monkeypatch):
+    cache, _ = _cache(monkeypatch, max_vectors=10)
+    cache.put("cached", [0] * 4)
+    requests = []
+
+    class _Model:
+        async def aget_text_embedding_batch(self, texts):
+            requests.append(list(texts))
+            return [[len(text)] * 4 for text in texts]
+
+    monkeypatch.setattr(embedding_cache, "get_embedding_cache", lambda: cache)
+    monkeypatch.setattr(embedding_cache, "get_embed_model", lambda: _Model())
+    vectors = asyncio.run(embedding_cache.aget_query_embeddings(["ab", "cached", " ab ", "abc"]))
+
+    assert requests == [["ab", "abc"]]
+    assert [int(v[0]) for v in vectors] == [2, 0, 2, 3]
+    assert asyncio.run(embedding_cache.aget_query_embeddings(["abc"]))[0][0] == 3
+    assert len(requests) == 1
@@ -0,0 +1,73 @@
+"""
+Unit tests for the in-memory single-paper search (chatbox/chat_agents/paper_chunk_cache.py).
+Run from server directory:
+    python -m pytest tests/test_paper_chunk_cache.py
+"""
+from types import SimpleNamespace
+
+import numpy as np
+
+from chatbox.chat_agents.paper_chunk_cache import PaperChunkMatrix, top_indices
+
+
+def test_top_indices_orders_best_first():
+    scores = np.array([0.1, 0.9, 0.5, 0.7, 0.3])
+    assert top_indices(scores, 3) == [1, 3, 2]
+
+
+def test_top_indices_k_larger_than_scores():
+    assert top_indices(np.array([0.2, 0.8]), 5) == [1, 0]
+
+
+def test_top_indices_non_positive_k():
+    assert top_indices(np.array([0.2, 0.8]), 0) == []
+    assert top_indices(np.array([0.2, 0.8]), -1) == []
+
+
+def test_top_indices_positive_only_drops_zero_scores():
+    scores = np.array([0.0, 2.0, 0.0, 1.0])
+    assert top_indices(scores, 3, positive_only=True) == [1, 3]
+    assert top_indices(np.zeros(4), 2, positive_only=True) == []
+
+
+def test_top_indices_ties_keep_index_order():
+    scores = np.array([0.5, 0.5, 0.9, 0.5])
+    assert top_indices(scores, 4) == [2, 0, 1, 3]
+    assert top_indices(scores, 2) == [2, 0]
+
+
+def _matrix() -> PaperChunkMatrix:
+    rows = [
+        SimpleNamespace(id=10, chunk_index=0, text="minimal surfaces have zero mean curvature", embedding=[1.0, 0.0]),
+        SimpleNamespace(id=11, chunk_index=1, text="the ricci flow develops singularities", embedding=[0.0, 1.0]),
+        SimpleNamespace(id=12, chunk_index=2, text="harmonic maps between manifolds", embedding=[0.6, 0.8]),
+        SimpleNamespace(id=13, chunk_index=3, text="an appendix without embedding", embedding=None),
+    ]
+    return PaperChunkMatrix("paper", "Title", rows, ttl_seconds=60)
+
+
+def test_vector_scores_are_cosine_similarities():
+    matrix = _matrix()
+    scores = matrix.vector_scores(np.array([[2.0, 0.0], [0.0, 3.0]]))
+    np.testing.assert_allclose(scores, [[1.0, 0.0, 0.6, 0.0], [0.0, 1.0, 0.8, 0.0]], atol=1e-6)
+
+
+def test_bm25_scores_only_matching_chunks():
+    scores = _matrix().bm25_scores("ricci flow")
+    assert scores[1] > 0
+    assert scores[0] == scores[2] == scores[3] == 0
+
+
+def test_hybrid_search_fuses_vector_and_bm25_rankings():
+    matrix = _matrix()
+    results = matrix.hybrid_search(
+        ["ricci flow", "minimal surfaces"],
+        [np.array([0.0, 1.0]), np.array([1.0, 0.0])],
+        top_k=2,
+        candidate_k=2,
+    )
+    assert [[hit.chunk_id for hit in hits] for hits in results] == [[11, 12], [10, 12]]
+    best = results[0][0]
+    assert best.paper_id == "paper" and best.title == "Title" and best.chunk_index == 1
+    # first in both rankings
+    assert best.score == 2 / 61
@@ -0,0 +1,52 @@
+"""
+Unit tests for the similarity prefilter of grade_documents (nodes._prefilter_by_similarity).
+Run from server directory:
+    python -m pytest tests/test_prefilter.py
+"""
+import asyncio
+
+import pytest
+
+from chatbox.chat_agents import nodes
+
+
+def _prefilter(monkeypatch, chunk_ids, similarities):
+    async def fake_similarities(question, chunk_ids, paper_id=None):
+        return similarities
+
+    monkeypatch.setattr(nodes, "achunk_similarities", fake_similarities)
+    monkeypatch.setattr(nodes, "GRADING_ACCEPT_SIMILARITY", 0.55)
+    monkeypatch.setattr(nodes, "GRADING_REJECT_SIMILARITY", 0.25)
+    return asyncio.run(nodes._prefilter_by_similarity("question", chunk_ids, "paper"))
+
+
+def test_bands_accept_reject_and_ambiguous(monkeypatch):
+    verdicts, scores = _prefilter(
+        monkeypatch, [1, 2, 3, 4, 5], {1: 0.9, 2: 0.55, 3: 0.4, 4: 0.25, 5: 0.1}
+    )
+    # accept at or above the upper bound, reject strictly below the lower bound
+    assert verdicts == [True, True, None, None, False]
+    assert scores == [0.9, 0.55, 0.4, 0.25, 0.1]
+
+
+def test_external_and_unknown_chunks_go_to_the_llm(monkeypatch):
+    # external refs have no chunk id; chunk 7 has no embedding
+    verdicts, scores = _prefilter(monkeypatch, [None, 7, 3], {3: 0.8})
+    assert verdicts == [None, None, True]
+    assert scores == [None, None, 0.8]
+
+
+def test_similarity_failure_grades_everything_with_the_llm(monkeypatch):
+    async def failing_similarities(question, chunk_ids, paper_id=None):
+        raise RuntimeError("embedding request failed")
+
+    monkeypatch.setattr(nodes, "achunk_similarities", failing_similarities)
+    verdicts, scores = asyncio.run(nodes._prefilter_by_similarity("question", [1, 2], None))
+    assert verdicts == [None, None]
+    assert scores == [None, None]
+
+
+@pytest.mark.parametrize("similarity, verdict", [(0.5499, None), (0.2499, False)])
+def test_band_edges(monkeypatch, similarity, verdict):
+    verdicts, _ = _prefilter(monkeypatch, [1], {1: similarity})
+    assert verdicts == [verdict]
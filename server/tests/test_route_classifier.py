@@ -0,0 +1,104 @@
+"""
+Unit tests for the local route classifier (chatbox/chat_agents/route_classifier.py).
+Run from server directory:
+    python -m pytest tests/test_route_classifier.py
+"""
+import asyncio
+
+import numpy as np
+import pytest
+
+from chatbox.chat_agents import route_classifier
+from chatbox.chat_agents.route_classifier import RouteClassifier
+
+LOCAL, GLOBAL = "retrieve", "global_search"
+
+
+@pytest.mark.parametrize("question, route", [
+    ("What is the main theorem of this paper?", LOCAL),
+    ("Explain the proof of Lemma 3.2.", LOCAL),
+    ("What do the authors assume about the metric?", LOCAL),
+    ("Why does the inequality above hold?", LOCAL),
+    ("How is the energy functional defined here?", LOCAL),
+    ("Are there related papers on the Allen-Cahn equation?", GLOBAL),
+    ("Find me some papers on mean curvature flow with surgery.", GLOBAL),
+    ("Search online for an introduction to varifolds.", GLOBAL),
+    ("Is there a survey paper on harmonic maps?", GLOBAL),
+    ("What does the literature on Ricci flow say about singularities?", GLOBAL),
+])
+def test_rules_decide_phrases(question, route):
+    assert RouteClassifier.classify_by_rules(question) == route
+
+
+@pytest.mark.parametrize("question", [
+    # single words that also occur in questions about the paper
+    "Is this method used in surveys of geometric flows?",
+    "What is a Sobolev space?",
+    # both kinds of phrases
+    "Do other papers use the same argument as this paper?",
+])
+def test_rules_abstain_without_a_clear_phrase(question):
+    assert RouteClassifier.classify_by_rules(question) is None
+
+
+def _fake_embeddings(monkeypatch):
+    # global examples point along x, local examples along y, the question is given below
+    vectors = {text: [1.0, 0.0] for text in route_classifier._GLOBAL_EXAMPLES}
+    vectors.update({text: [0.0, 1.0] for text in route_classifier._LOCAL_EXAMPLES})
+    requests = []
+
+    async def embeddings(texts):
+        requests.append(len(texts))
+        return [np.array(vectors[text]) for text in texts]
+
+    async def embedding(text):
+        requests.append(1)
+        return np.array(vectors[text])
+
+    monkeypatch.setattr(route_classifier, "aget_query_embeddings", embeddings)
+    monkeypatch.setattr(route_classifier, "aget_query_embedding", embedding)
+    return vectors, requests
+
+
+def test_embedding_route_needs_the_margin(monkeypatch):
+    vectors, _ = _fake_embeddings(monkeypatch)
+    vectors["global-ish"] = [0.9, 0.3]
+    vectors["undecided"] = [1.0, 0.98]
+    classifier = RouteClassifier(margin=0.05)
+
+    route, margin = asyncio.run(classifier.classify_by_embedding("global-ish"))
+    assert route == GLOBAL and margin == pytest.approx(0.6 / np.hypot(0.9, 0.3))
+    route, margin = asyncio.run(classifier.classify_by_embedding("undecided"))
+    assert route is None and margin < 0.05
+
+
+def test_classify_counts_rules_then_embedding(monkeypatch):
+    vectors, requests = _fake_embeddings(monkeypatch)
+    vectors["local-ish"] = [0.1, 1.0]
+    classifier = RouteClassifier(margin=0.05)
+
+    assert asyncio.run(classifier.classify("Explain the proof of Lemma 3.")) == LOCAL
+    assert requests == []
+    assert asyncio.run(classifier.classify("local-ish")) == LOCAL
+    classifier.record_llm_fallback()
+    stats = classifier.stats()
+    assert (stats["rule_decisions"], stats["embedding_decisions"], stats["llm_fallbacks"]) == (1, 1, 1)
+    assert stats["fallback_rate"] == pytest.approx(1 / 3)
+
+
+def test_rules_only_classifier_makes_no_embedding_requests(monkeypatch):
+    vectors, requests = _fake_embeddings(monkeypatch)
+    vectors["local-ish"] = [0.1, 1.0]
+    classifier = RouteClassifier(margin=0.05, use_embedding=False)
+    assert asyncio.run(classifier.classify("local-ish")) is None
+    assert requests == []
+
+
+def test_embedding_failure_falls_back_to_the_llm(monkeypatch):
+    async def failing(texts):
+        raise RuntimeError("embedding request failed")
+
+    monkeypatch.setattr(route_classifier, "aget_query_embeddings", failing)
+    classifier = RouteClassifier(margin=0.05)
+    assert asyncio.run(classifier.classify("What is a Sobolev space?")) is None
+    assert classifier.stats()["embedding_decisions"] == 0
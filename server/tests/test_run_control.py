@@ -0,0 +1,152 @@
+"""
+Unit tests for cancellable graph runs (chatbox/chat_agents/run_control.py).
+Run from server directory:
+    python -m pytest tests/test_run_control.py
+"""
+import asyncio
+from types import SimpleNamespace
+
+from chatbox.chat_agents.run_control import AgentRunManager
+
+
+def _generate_events(tokens: int, context_tokens: int = 100) -> list[dict]:
+    metadata = {"langgraph_node": "generate"}
+    events = [{"event": "on_chain_start", "name": "generate", "metadata": metadata}]
+    events += [
+        {"event": "on_chat_model_stream", "metadata": metadata, "data": {"chunk": SimpleNamespace(content="t")}}
+        for _ in range(tokens)
+    ]
+    events.append({
+        "event": "on_chain_end",
+        "name": "generate",
+        "metadata": metadata,
+        "data": {"output": {"context_stats": {"used_tokens": context_tokens}}},
+    })
+    return events
+
+
+class _Events:
+    """Graph event stream that yields events, then blocks until cancelled when hang is set."""
+
+    def __init__(self, events: list[dict], hang: bool = False):
+        self.events = events
+        self.hang = hang
+        self.closed = False
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for event in self.events:
+            yield event
+        if self.hang:
+            await asyncio.Event().wait()
+
+    async def aclose(self):
+        self.closed = True
+
+
+async def _drain(run):
+    async def connected():
+        return False
+
+    return [event async for event in run.stream(connected, poll_seconds=0.01)]
+
+
+def test_completed_run_is_counted_and_dropped():
+    async def scenario():
+        manager = AgentRunManager()
+        events = _Events(_generate_events(tokens=5, context_tokens=300))
+        run = manager.start("t1", events)
+        streamed = await _drain(run)
+        return manager, run, events, streamed
+
+    manager, run, events, streamed = asyncio.run(scenario())
+    assert len(streamed) == 7
+    assert run.completed and events.closed
+    assert run.answer_tokens == 5 and run.context_tokens == 300
+    stats = manager.stats()
+    assert stats["active"] == 0 and stats["completed"] == 1
+    assert stats["avg_answer_tokens"] == 5.0
+    assert manager.active("t1") is None
+
+
+def test_cancel_thread_stops_the_run_and_waits_for_it():
+    async def scenario():
+        manager = AgentRunManager()
+        events = _Events(_generate_events(tokens=0)[:1], hang=True)
+        run = manager.start("t1", events)
+        await asyncio.sleep(0)
+        assert manager.active("t1") is run
+        await manager.cancel_thread("t1", "new_message")
+        # cancel_thread returns only after the run has stopped
+        assert run.task.done()
+        return manager, run, events
+
+    manager, run, events = asyncio.run(scenario())
+    assert run.task.cancelled() and not run.completed
+    assert run.cancel_reason == "new_message"
+    assert events.closed
+    assert manager.active("t1") is None
+    assert manager.stats()["cancelled"] == {"new_message": 1}
+
+
+def test_cancel_thread_without_a_run_is_a_no_op():
+    manager = AgentRunManager()
+    asyncio.run(manager.cancel_thread("missing", "new_message"))
+    assert manager.stats()["cancelled"] == {}
+
+
+def test_cancel_only_touches_the_given_thread():
+    async def scenario():
+        manager = AgentRunManager()
+        other = manager.start("t2", _Events(_generate_events(tokens=3)))
+        manager.start("t1", _Events([], hang=True))
+        await asyncio.sleep(0)
+        await manager.cancel_thread("t1", "new_message")
+        await _drain(other)
+        return manager, other
+
+    manager, other = asyncio.run(scenario())
+    assert other.completed
+    assert manager.stats()["completed"] == 1
+    assert manager.stats()["cancelled"] == {"new_message": 1}
+
+
+def test_tokens_saved_estimate():
+    async def scenario():
+        manager = AgentRunManager()
+        await _drain(manager.start("t1", _Events(_generate_events(tokens=10, context_tokens=400))))
+
+        # cancelled before generate: the average prompt and answer are saved
+        manager.start("t1", _Events([], hang=True))
+        await asyncio.sleep(0)
+        await manager.cancel_thread("t1", "new_message")
+
+        # cancelled after 4 of ~10 answer tokens
+        manager.start("t1", _Events(_generate_events(tokens=4)[:5], hang=True))
+        await asyncio.sleep(0.01)
+        await manager.cancel_thread("t1", "client_disconnected")
+        return manager
+
+    manager = asyncio.run(scenario())
+    assert manager.tokens_saved == (10 + 400) + (10 - 4)
+    assert manager.stats()["cancelled"] == {"new_message": 1, "client_disconnected": 1}
+
+
+def test_stream_cancels_the_run_when_the_client_is_gone():
+    async def scenario():
+        manager = AgentRunManager()
+        run = manager.start("t1", _Events([{"event": "on_chain_start", "metadata": {}}], hang=True))
+
+        async def disconnected():
+            return True
+
+        streamed = [event async for event in run.stream(disconnected, poll_seconds=0.01)]
+        await run.wait()
+        return manager, run, streamed
+
+    manager, run, streamed = asyncio.run(scenario())
+    assert len(streamed) == 1
+    assert run.cancel_reason == "client_disconnected"
+    assert manager.stats()["cancelled"] == {"client_disconnected": 1}
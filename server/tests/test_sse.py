@@ -0,0 +1,99 @@
+"""
+Unit tests for the coalescing SSE writer of /api/chat (chatbox/utils/sse.py).
+Run from server directory:
+    python -m pytest tests/test_sse.py
+"""
+import json
+
+from chatbox.utils import sse
+from chatbox.utils.sse import SSEWriter
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _writer(monkeypatch, **settings) -> tuple[SSEWriter, _Clock]:
+    clock = _Clock()
+    monkeypatch.setattr(sse.time, "monotonic", clock)
+    options = {"flush_seconds": 0.05, "flush_bytes": 64, "heartbeat_seconds": 15}
+    options.update(settings)
+    return SSEWriter(**options), clock
+
+
+def _payloads(out: str) -> list[dict]:
+    return [json.loads(frame[len("data: "):]) for frame in out.split("\n\n") if frame.startswith("data: ")]
+
+
+def test_tokens_are_coalesced_until_the_flush_interval(monkeypatch):
+    writer, clock = _writer(monkeypatch)
+    assert writer.add_token("generate", "Minimal ") == ""
+    clock.now += 0.01
+    assert writer.add_token("generate", "surfaces") == ""
+    assert writer.tick() == ""
+    assert writer.next_deadline() == 100.05
+
+    clock.now += 0.04
+    assert _payloads(writer.tick()) == [{"type": "llm_stream", "node": "generate", "chunk": "Minimal surfaces"}]
+    assert writer.counters["frames"] == 1
+    assert writer.counters["token_chunks"] == 2
+
+
+def test_flush_bytes_flushes_immediately(monkeypatch):
+    writer, _ = _writer(monkeypatch, flush_bytes=10)
+    assert writer.add_token("generate", "12345") == ""
+    assert _payloads(writer.add_token("generate", "67890")) == [
+        {"type": "llm_stream", "node": "generate", "chunk": "1234567890"}
+    ]
+    assert writer.next_deadline() == 100 + 15
+
+
+def test_other_frames_flush_tokens_first(monkeypatch):
+    writer, _ = _writer(monkeypatch)
+    writer.add_token("generate", "answer")
+    payloads = _payloads(writer.send({"type": "end"}))
+    assert payloads == [
+        {"type": "llm_stream", "node": "generate", "chunk": "answer"},
+        {"type": "end"},
+    ]
+
+
+def test_node_change_flushes_the_previous_node(monkeypatch):
+    writer, _ = _writer(monkeypatch)
+    writer.add_token("rewrite", "query")
+    assert _payloads(writer.add_token("generate", "answer")) == [
+        {"type": "llm_stream", "node": "rewrite", "chunk": "query"}
+    ]
+    assert _payloads(writer.flush()) == [{"type": "llm_stream", "node": "generate", "chunk": "answer"}]
+    assert writer.flush() == ""
+
+
+def test_heartbeat_after_idle_interval(monkeypatch):
+    writer, clock = _writer(monkeypatch)
+    clock.now += 14
+    assert writer.tick() == ""
+    clock.now += 1
+    assert writer.tick() == ": keep-alive\n\n"
+    assert writer.counters["heartbeats"] == 1
+    # heartbeats are not data frames
+    assert writer.counters["frames"] == 0
+    assert writer.next_deadline() == clock.now + 15
+
+
+def test_close_records_counters(monkeypatch):
+    stats = sse.SSEStats()
+    monkeypatch.setattr(sse, "get_sse_stats", lambda: stats)
+    writer, _ = _writer(monkeypatch)
+    writer.received()
+    writer.received()
+    writer.drop()
+    out = writer.send({"type": "start"})
+    writer.close()
+    assert stats.stats() == {
+        "streams": 1, "events": 2, "dropped": 1, "frames": 1,
+        "token_chunks": 0, "heartbeats": 0, "bytes": len(out),
+    }
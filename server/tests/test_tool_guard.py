@@ -0,0 +1,155 @@
+"""
+Unit tests for the global-search latency guard (chatbox/chat_agents/tool_guard.py).
+Run from server directory:
+    python -m pytest tests/test_tool_guard.py
+"""
+import asyncio
+
+import httpx
+
+from chatbox.chat_agents import tool_guard
+from chatbox.chat_agents.tool_guard import ToolGuard
+
+
+def _guard(**overrides) -> ToolGuard:
+    settings = dict(
+        deadlines={"tool": 0.5},
+        hedge_after=0.05,
+        hedge_min_samples=3,
+        window=10,
+        min_calls=3,
+        failure_rate=0.5,
+        cooldown_seconds=30,
+    )
+    settings.update(overrides)
+    return ToolGuard(**settings)
+
+
+class _Tool:
+    """Async tool whose n-th call sleeps delays[n] and then returns or raises outcomes[n]."""
+
+    def __init__(self, delays, outcomes):
+        self.delays = list(delays)
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    async def __call__(self):
+        n = self.calls
+        self.calls += 1
+        await asyncio.sleep(self.delays[n])
+        if isinstance(self.outcomes[n], BaseException):
+            raise self.outcomes[n]
+        return self.outcomes[n]
+
+
+def _status_error(status_code: int) -> httpx.HTTPStatusError:
+    request = httpx.Request("GET", "https://api.example.org/search")
+    response = httpx.Response(status_code, request=request)
+    return httpx.HTTPStatusError(f"{status_code}", request=request, response=response)
+
+
+def test_slow_call_is_hedged_and_the_faster_attempt_wins():
+    guard = _guard()
+    tool = _Tool([0.4, 0.0], [["slow"], ["hedge"]])
+    assert asyncio.run(guard.run("tool", tool)) == ["hedge"]
+    assert tool.calls == 2
+    assert guard.stats()["tool"]["hedges"] == 1
+
+
+def test_no_hedge_before_samples_by_default():
+    guard = _guard(hedge_after=0)
+    tool = _Tool([0.1], [["only"]])
+    assert asyncio.run(guard.run("tool", tool)) == ["only"]
+    assert tool.calls == 1
+
+
+def test_hedge_delay_follows_p95_once_samples_exist():
+    guard = _guard(hedge_after=0)
+    for latency in (0.1, 0.2, 0.3):
+        guard._record("tool", latency, True)
+    assert guard._hedge_delay("tool", deadline=5.0) == 0.3
+    # no hedge that could not finish before the deadline
+    assert guard._hedge_delay("tool", deadline=0.3) is None
+
+
+def test_server_error_is_retried():
+    guard = _guard()
+    tool = _Tool([0.0, 0.0], [_status_error(503), ["retry"]])
+    assert asyncio.run(guard.run("tool", tool)) == ["retry"]
+    assert tool.calls == 2
+
+
+def test_client_error_is_not_hedged():
+    guard = _guard()
+    tool = _Tool([0.0, 0.0], [_status_error(400), ["retry"]])
+    assert asyncio.run(guard.run("tool", tool)) == []
+    assert tool.calls == 1
+    assert guard.stats()["tool"]["failure_rate"] == 1.0
+    assert guard.stats()["tool"]["state"] == "closed"
+
+
+def test_rate_limit_opens_the_breaker_without_retrying():
+    guard = _guard()
+    tool = _Tool([0.0, 0.0], [_status_error(429), ["retry"]])
+    assert asyncio.run(guard.run("tool", tool)) == []
+    assert tool.calls == 1
+    assert guard.stats()["tool"]["state"] == "open"
+    assert asyncio.run(guard.run("tool", tool)) == []
+    assert tool.calls == 1
+    assert guard.stats()["tool"]["skipped"] == 1
+
+
+def test_timeout_returns_empty_and_counts_a_deadline_miss():
+    guard = _guard(deadlines={"tool": 0.1}, hedge_after=0)
+    tool = _Tool([1.0], [["late"]])
+    assert asyncio.run(guard.run("tool", tool)) == []
+    assert guard.stats()["tool"]["deadline_misses"] == 1
+
+
+def test_breaker_opens_probes_after_cooldown_and_closes(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(tool_guard.time, "monotonic", lambda: now[0])
+    guard = _guard(hedge_after=0)
+
+    failing = _Tool([0.0] * 3, [RuntimeError("down")] * 3)
+    for _ in range(3):
+        asyncio.run(guard.run("tool", failing))
+    assert guard.stats()["tool"]["state"] == "open"
+
+    # skipped during the cooldown
+    healthy = _Tool([0.0] * 2, [["ok"], ["ok"]])
+    assert asyncio.run(guard.run("tool", healthy)) == []
+    assert healthy.calls == 0
+
+    # after the cooldown one probe decides; a success closes the circuit
+    now[0] += 31
+    assert asyncio.run(guard.run("tool", healthy)) == ["ok"]
+    stats = guard.stats()["tool"]
+    assert stats["state"] == "closed"
+    assert stats["calls"] == 0
+
+
+def test_failed_probe_reopens_the_breaker(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(tool_guard.time, "monotonic", lambda: now[0])
+    guard = _guard(hedge_after=0)
+    failing = _Tool([0.0] * 4, [RuntimeError("down")] * 4)
+    for _ in range(3):
+        asyncio.run(guard.run("tool", failing))
+
+    now[0] += 31
+    assert asyncio.run(guard.run("tool", failing)) == []
+    assert failing.calls == 4
+    assert guard.stats()["tool"]["state"] == "open"
+
+
+def test_half_open_admits_a_single_probe():
+    guard = _guard()
+    with guard._lock:
+        circuit = guard._circuit("tool")
+        circuit.state = "half_open"
+    assert guard._allow("tool") == (True, True)
+    assert guard._allow("tool") == (False, False)
+    # a cancelled probe lets the next call probe
+    guard._release_probe("tool")
+    assert guard._allow("tool") == (True, True)